@@ -119,7 +119,9 @@ def gcb_appstats_enabled():
 
 
 def webapp_add_wsgi_middleware(app):
-    """Enable AppStats if requested."""
+    """Enable AppStats if requested; flush performance counters."""
+    from models import counters
+    app = counters.AggregationMiddleware(app)
     if gcb_appstats_enabled():
         logging.info('Enabling AppStats.')
         from google.appengine.ext.appstats import recording
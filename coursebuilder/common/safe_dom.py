@@ -27,6 +27,10 @@ class Node(object):
     def sanitized(self):
         raise NotImplementedError()
 
+    def _write(self, out):
+        """Appends the sanitized HTML of the node to a list of strings."""
+        out.append(self.sanitized)
+
     def __str__(self):
         return self.sanitized
 
@@ -79,10 +83,13 @@ class NodeList(object):
 
     @property
     def sanitized(self):
-        sanitized_list = []
+        out = []
+        self._write(out)
+        return ''.join(out)
+
+    def _write(self, out):
         for node in self.list:
-            sanitized_list.append(node.sanitized)
-        return ''.join(sanitized_list)
+            node._write(out)  # pylint: disable=protected-access
 
     def __str__(self):
         return self.sanitized
@@ -122,7 +129,12 @@ class Comment(Node):
 
 
 class Element(Node):
-    """Embodies an HTML element which will be sanitized when accessed."""
+    """Embodies an HTML element which will be sanitized when accessed.
+
+    The element and all its descendants are written out in a single pass
+    into one list of strings. The start tag is only built again after the
+    attributes change, and the HTML of frozen elements is built only once.
+    """
 
     _ALLOWED_NAME_PATTERN = re.compile(r'^[a-zA-Z][_\-a-zA-Z0-9]*$')
 
@@ -153,6 +165,14 @@ class Element(Node):
         self._attr = {}
         for _name, _value in attr.items():
             self._attr[_name.lower()] = _value
+        # The start tag without its closing '>'; None until built.
+        self._start_tag = None
+        # The HTML of the element once it is frozen; see freeze().
+        self._frozen = None
+
+    def _assert_not_frozen(self):
+        if self._frozen is not None:
+            raise ValueError('Element <%s> is frozen' % self._tag_name)
 
     def has_attribute(self, name):
         return name.lower() in self._attr
@@ -162,20 +182,25 @@ class Element(Node):
         return self._attr.keys()
 
     def set_attribute(self, name, value):
+        self._assert_not_frozen()
         self._attr[name.lower()] = value
+        self._start_tag = None
         return self
 
     def get_escaped_attribute(self, name):
         return escape(self._attr[name.lower()])
 
     def add_attribute(self, **attr):
+        self._assert_not_frozen()
         for attr_name, value in attr.items():
             assert Element._ALLOWED_NAME_PATTERN.match(attr_name), (
                 'attribute name %s is not allowed' % attr_name)
             self._attr[attr_name.lower()] = value
+        self._start_tag = None
         return self
 
     def add_child(self, node):
+        self._assert_not_frozen()
         node._set_parent(self)  # pylint: disable=protected-access
         self._children.append(node)
         return self
@@ -189,12 +214,30 @@ class Element(Node):
         return self
 
     def empty(self):
+        self._assert_not_frozen()
         self._children = []
         return self
 
     def add_text(self, text):
         return self.add_child(Text(text))
 
+    def freeze(self):
+        """Builds the HTML of the element once, for all later uses.
+
+        A frozen element can no longer be changed, and neither should its
+        descendants be. It may be added to any number of parents, e.g. an
+        icon repeated on every row of a table; its parent is then the last
+        one it was added to.
+
+        Returns:
+            The element.
+        """
+        if self._frozen is None:
+            out = []
+            self._write(out)
+            self._frozen = ''.join(out)
+        return self
+
     def can_have_children(self):
         return True
 
@@ -209,9 +252,15 @@ class Element(Node):
     @property
     def sanitized(self):
         """Santize the element and its descendants."""
-        assert Element._ALLOWED_NAME_PATTERN.match(self._tag_name), (
-            'tag name %s is not allowed' % self._tag_name)
-        buff = '<' + self._tag_name
+        if self._frozen is not None:
+            return self._frozen
+        out = []
+        self._write(out)
+        return ''.join(out)
+
+    def _build_start_tag(self):
+        # The tag name was checked by the constructor and cannot change.
+        parts = ['<', self._tag_name]
         for attr_name, value in sorted(self._attr.items()):
             if attr_name == 'classname':
                 attr_name = 'class'
@@ -219,20 +268,26 @@ class Element(Node):
                 attr_name = attr_name.replace('_', '-')
             if value is None:
                 value = ''
-            buff += ' %s="%s"' % (
-                attr_name, escape(value))
+            parts.append(' %s="%s"' % (attr_name, escape(value)))
+        return ''.join(parts)
+
+    def _write(self, out):
+        if self._frozen is not None:
+            out.append(self._frozen)
+            return
+        if self._start_tag is None:
+            self._start_tag = self._build_start_tag()
+        out.append(self._start_tag)
 
         if self._children:
-            buff += '>'
+            out.append('>')
             for child in self._children:
-                buff += child.sanitized
-            buff += '</%s>' % self._tag_name
+                child._write(out)  # pylint: disable=protected-access
+            out.append('</%s>' % self._tag_name)
         elif self._tag_name.lower() in Element._VOID_ELEMENTS:
-            buff += '/>'
+            out.append('/>')
         else:
-            buff += '></%s>' % self._tag_name
-
-        return buff
+            out.append('></%s>' % self._tag_name)
 
 
 class A(Element):
@@ -286,6 +341,7 @@ class ScriptElement(Element):
                     raise ValueError('End script tag forbidden')
                 return self._script
 
+        self._assert_not_frozen()
         self._children.append(Script(text))
 
 
@@ -466,7 +466,14 @@ def make_css_combo_zip_handler(zipfilename, static_file_handler):
 
 
 class AssetHandler(utils.BaseHandler):
-    """Handles serving of static resources located on the file system."""
+    """Handles serving of static resources located on the file system.
+
+    Answers conditional requests with 304 Not Modified, and requests for a
+    single byte range with 206 Partial Content, from the metadata of the file
+    and the shards holding the range only.
+    """
+
+    _RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
 
     def __init__(self, app_context, filename):
         super(AssetHandler, self).__init__()
@@ -479,26 +486,102 @@ class AssetHandler(utils.BaseHandler):
             return default
         return guess
 
-    def _can_view(self, fs, stream):
-        """Checks if current user can view stream."""
-        public = not fs.is_draft(stream)
-        return public or Roles.is_course_admin(self.app_context)
+    def _can_view(self, stat):
+        """Checks if current user can view the file."""
+        return not stat.is_draft or Roles.is_course_admin(self.app_context)
+
+    def _is_not_modified(self, stat, etag):
+        """Checks the If-None-Match or If-Modified-Since of the request."""
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            if not etag:
+                return False
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if_modified_since = self.request.if_modified_since
+        if stat.updated_on and if_modified_since:
+            return stat.updated_on.replace(microsecond=0) <= (
+                if_modified_since.replace(tzinfo=None))
+        return False
+
+    def _get_byte_range(self, stat, etag):
+        """Returns (start, stop) of the single range asked for, or None.
+
+        Ranges that can't be parsed, lists of ranges and ranges asked for
+        with an If-Range that does not match are ignored, and the whole file
+        is served. A start at or past the end means no byte can be served.
+        """
+        header = self.request.headers.get('Range')
+        if not header:
+            return None
+        if_range = self.request.headers.get('If-Range')
+        if if_range is not None and (not etag or if_range != etag):
+            return None
+        match = self._RANGE_PATTERN.match(header.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            stop = stat.size
+            if last:
+                if int(last) < start:
+                    return None
+                stop = min(int(last) + 1, stat.size)
+        elif last:
+            start = max(0, stat.size - int(last))
+            stop = stat.size
+            if not int(last):
+                start = stat.size
+        else:
+            return None
+        return start, stop
 
     def get(self):
         """Handles GET requests."""
         models.MemcacheManager.begin_readonly()
         try:
-            stream = self.app_context.fs.open(self.filename)
-            if not stream:
+            fs = self.app_context.fs
+            stat = fs.stat(self.filename)
+            if not stat:
                 self.error(404)
                 return
-            if not self._can_view(self.app_context.fs, stream):
+            if not self._can_view(stat):
                 self.error(403)
                 return
             set_static_resource_cache_control(self)
             self.response.headers['Content-Type'] = self.get_mime_type(
                 self.filename)
-            self.response.write(stream.read())
+            self.response.headers['Accept-Ranges'] = 'bytes'
+            etag = None
+            if stat.content_hash:
+                etag = '"%s"' % stat.content_hash
+                self.response.headers['ETag'] = etag
+            if stat.updated_on:
+                self.response.last_modified = stat.updated_on
+
+            if self._is_not_modified(stat, etag):
+                self.response.set_status(304)
+                return
+
+            byte_range = self._get_byte_range(stat, etag)
+            if byte_range is None:
+                stream = fs.open(self.filename)
+                if not stream:
+                    self.error(404)
+                    return
+                self.response.write(stream.read())
+                return
+            start, stop = byte_range
+            if start >= stat.size:
+                self.response.set_status(416)
+                self.response.headers['Content-Range'] = 'bytes */%d' % (
+                    stat.size)
+                return
+            self.response.set_status(206)
+            self.response.headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, stop - 1, stat.size)
+            self.response.write(fs.read_range(self.filename, start, stop))
         finally:
             models.MemcacheManager.end_readonly()
 
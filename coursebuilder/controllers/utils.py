@@ -37,8 +37,9 @@ from common import tags
 from common import utils as common_utils
 from common.crypto import XsrfTokenManager
 from models import courses
-from models import resources_display
 from models import models
+from models import progress
+from models import resources_display
 from models import transforms
 from models.config import ConfigProperty
 from models.courses import Course
@@ -520,6 +521,11 @@ class ApplicationHandler(webapp2.RequestHandler):
 class CourseHandler(ApplicationHandler):
     """Base handler that is aware of the current course."""
 
+    # Functions called with (handler, user) that return, as pairs made by
+    # get_prefetch_key() of the models, more entities pages read for the user;
+    # they are fetched along with those of prefetch_for_user().
+    PREFETCH_HOOKS = []
+
     def __init__(self, *args, **kwargs):
         super(CourseHandler, self).__init__(*args, **kwargs)
         self.course = None
@@ -536,6 +542,20 @@ class CourseHandler(ApplicationHandler):
             return None
         return Student.get_by_email(user.email())
 
+    def prefetch_for_user(self, user):
+        """Fetches in one batch the entities pages of the course read."""
+        if user is None:
+            return
+        keys = [
+            Student.get_prefetch_key(user.email()),
+            models.StudentPreferencesDAO.get_prefetch_key(user.user_id()),
+            models.StudentPropertyEntity.get_prefetch_key(
+                user.user_id(),
+                progress.UnitLessonCompletionTracker.PROPERTY_KEY)]
+        for hook in self.PREFETCH_HOOKS:
+            keys.extend(hook(self, user))
+        models.RequestPrefetch.fetch(keys)
+
     def _pick_first_valid_locale_from_list(self, desired_locales):
         available_locales = self.app_context.get_allowed_locales()
         for lang in desired_locales:
@@ -553,7 +573,8 @@ class CourseHandler(ApplicationHandler):
         if self.get_user():
             # check if student has any locale labels assigned
             if student is None:
-                student = self.get_student()
+                student = Student.get_enrolled_student_by_email(
+                    self.get_user().email())
             if student and student.is_enrolled and not student.is_transient:
                 student_label_ids = student.get_labels_of_type(
                     models.LabelDTO.LABEL_TYPE_LOCALE)
@@ -723,6 +744,14 @@ class CourseHandler(ApplicationHandler):
 
         _p = self.app_context.get_environ()
         self.init_template_values(_p, prefs=prefs)
+        return self.get_template_environ(additional_dirs).get_template(
+            template_file)
+
+    def get_template_environ(self, additional_dirs=None):
+        """Creates the jinja environment of the templates of the course.
+
+        Unlike get_template(), does not initialize the template values.
+        """
         template_environ = self.app_context.get_template_environ(
             self.app_context.get_current_locale(), additional_dirs)
         template_environ.filters[
@@ -737,8 +766,7 @@ class CourseHandler(ApplicationHandler):
             'display_lesson_title': (
                 lambda unit, lesson: resources_display.display_lesson_title(
                     unit, lesson, self.app_context))})
-
-        return template_environ.get_template(template_file)
+        return template_environ
 
 
 class BaseHandler(CourseHandler):
@@ -750,6 +778,7 @@ class BaseHandler(CourseHandler):
 
     def before_method(self, verb, path):
         """Modify global locale value for the duration of this handler."""
+        self.prefetch_for_user(self.get_user())
         self._old_locale = self.app_context.get_current_locale()
         new_locale = self.get_locale_for(self.request, self.app_context)
         self.app_context.set_current_locale(new_locale)
@@ -169,6 +169,12 @@ def get_generator_status_message(generator_class, job):
             'Job for %s statistics started at %s and is running now.' % (
                generator_description,
                job.updated_on.strftime(utils.HUMAN_READABLE_DATETIME_FORMAT))))
+
+    if job and issubclass(generator_class, jobs.MapReduceJob):
+        shard_plan = jobs.MapReduceJob.get_shard_plan(job)
+        if shard_plan:
+            message.append(safe_dom.Element('br'))
+            message.append(safe_dom.Text('Shards: %s' % shard_plan.describe()))
     return message
 
 
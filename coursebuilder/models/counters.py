@@ -16,6 +16,9 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import bisect
+import time
+
 
 def incr_counter_global_value(unused_name, unused_delta):
     """Hook method for global aggregation."""
@@ -27,6 +30,21 @@ def get_counter_global_value(unused_name):
     return None
 
 
+def get_counter_global_values(names):
+    """Hook method for global aggregation; returns a dict of name to value."""
+    values = {}
+    for name in names:
+        value = get_counter_global_value(name)
+        if value is not None:
+            values[name] = value
+    return values
+
+
+def flush_counter_global_values():
+    """Hook method for global aggregation; sends buffered increments."""
+    pass
+
+
 class PerfCounter(object):
     """A generic, in-process integer counter."""
 
@@ -73,6 +91,123 @@ class PerfCounter(object):
         return get_counter_global_value(self.name)
 
 
+class LatencyHistogram(PerfCounter):
+    """An in-process histogram of durations, in fixed logarithmic buckets.
+
+    Bucket i counts durations of up to BUCKET_BOUNDS_MS[i] milliseconds; the
+    last bucket counts everything longer. As the buckets are the same
+    everywhere, histograms from different processes are merged by adding the
+    counts of each bucket. The value of the histogram is its number of
+    recorded durations.
+    """
+
+    BUCKET_BOUNDS_MS = [2 ** i for i in xrange(17)]  # 1 ms to about 65 sec.
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self, name, doc_string):
+        super(LatencyHistogram, self).__init__(name, doc_string)
+        self._buckets = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+
+    def _clear(self):
+        super(LatencyHistogram, self)._clear()
+        self._buckets = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+
+    def _bucket_name(self, index):
+        return '%s:%s' % (self.name, index)
+
+    def record(self, duration_ms):
+        """Records a duration given in milliseconds."""
+        index = bisect.bisect_left(self.BUCKET_BOUNDS_MS, duration_ms)
+        self._buckets[index] += 1
+        self._value += 1
+        incr_counter_global_value(self._bucket_name(index), 1)
+
+    def timer(self):
+        """Returns a context manager recording the duration of its block."""
+        return _HistogramTimer(self)
+
+    @property
+    def buckets(self):
+        """Counts of each bucket for this process only."""
+        return list(self._buckets)
+
+    @property
+    def global_buckets(self):
+        """Counts of each bucket aggregated across all processes."""
+        names = [
+            self._bucket_name(index) for index in xrange(len(self._buckets))]
+        values = get_counter_global_values(names)
+        if not values:
+            return None
+        return [values.get(name, 0) for name in names]
+
+    @property
+    def global_value(self):
+        buckets = self.global_buckets
+        if buckets is None:
+            return None
+        return sum(buckets)
+
+    @classmethod
+    def get_percentiles(cls, buckets):
+        """Estimates percentiles of durations from bucket counts.
+
+        Args:
+            buckets: list of int. Counts of each bucket.
+
+        Returns:
+            A list of the upper bound in milliseconds of the bucket holding
+            each of PERCENTILES, None if it is in the last bucket, or None
+            instead of the list if there are no counts.
+        """
+        total = sum(buckets)
+        if not total:
+            return None
+        result = []
+        for percentile in cls.PERCENTILES:
+            rank = total * percentile / 100.0
+            seen = 0
+            for index, count in enumerate(buckets):
+                seen += count
+                if seen >= rank:
+                    break
+            if index < len(cls.BUCKET_BOUNDS_MS):
+                result.append(cls.BUCKET_BOUNDS_MS[index])
+            else:
+                result.append(None)
+        return result
+
+    @classmethod
+    def format_buckets(cls, buckets):
+        """Formats bucket counts as a line of text for the admin pages."""
+        percentiles = cls.get_percentiles(buckets) if buckets else None
+        if not percentiles:
+            return 'NA'
+        parts = ['count=%s' % sum(buckets)]
+        for percentile, bound in zip(cls.PERCENTILES, percentiles):
+            if bound is None:
+                parts.append('p%s>%sms' % (
+                    percentile, cls.BUCKET_BOUNDS_MS[-1]))
+            else:
+                parts.append('p%s<=%sms' % (percentile, bound))
+        return ' '.join(parts)
+
+
+class _HistogramTimer(object):
+    """Context manager recording durations to a LatencyHistogram."""
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *unused_exception_info):
+        self._histogram.record((time.time() - self._start) * 1000)
+
+
 class Registry(object):
     """Holds all registered counters."""
     registered = {}
@@ -82,3 +217,26 @@ class Registry(object):
         """Clears all counters for tests."""
         for counter in cls.registered.values():
             counter._clear()  # pylint: disable=protected-access
+
+
+REQUEST_LATENCY = LatencyHistogram(
+    'gcb-request-latency-ms',
+    'Distribution of the time taken to serve requests, in milliseconds.')
+
+
+class AggregationMiddleware(object):
+    """WSGI middleware recording request latency and flushing counters.
+
+    Counters buffer their global increments for the duration of a request;
+    this sends them in a single batch once the request has been served.
+    """
+
+    def __init__(self, app):
+        self._app = app
+
+    def __call__(self, environ, start_response):
+        try:
+            with REQUEST_LATENCY.timer():
+                return self._app(environ, start_response)
+        finally:
+            flush_counter_global_values()
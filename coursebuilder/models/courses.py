@@ -30,6 +30,7 @@ import custom_units
 
 import messages
 import progress
+import question_usage
 import review
 import transforms
 import utils
@@ -910,17 +911,21 @@ class PersistentCourse13(object):
 
     COURSES_FILENAME = 'data/course.json'
 
-    def __init__(self, next_id=None, units=None, lessons=None):
+    def __init__(
+        self, next_id=None, units=None, lessons=None, content_version=None):
         self.version = CourseModel13.VERSION
         self.next_id = next_id
         self.units = units
         self.lessons = lessons
+        self.content_version = content_version
 
     def to_dict(self):
         """Saves object attributes into a dict."""
         result = {}
         result['version'] = str(self.version)
         result['next_id'] = int(self.next_id)
+        if self.content_version:
+            result['content_version'] = self.content_version
 
         units = []
         for unit in self.units:
@@ -937,6 +942,7 @@ class PersistentCourse13(object):
     def _from_dict(self, adict):
         """Loads instance attributes from the dict."""
         self.next_id = int(adict.get('next_id'))
+        self.content_version = adict.get('content_version')
 
         self.units = []
         unit_dicts = adict.get('units')
@@ -961,7 +967,8 @@ class PersistentCourse13(object):
         """Saves course to datastore."""
         persistent = PersistentCourse13(
             next_id=course.next_id,
-            units=course.units, lessons=course.lessons)
+            units=course.units, lessons=course.lessons,
+            content_version=course.content_version)
 
         fs = app_context.fs.impl
         filename = fs.physical_to_logical(cls.COURSES_FILENAME)
@@ -979,7 +986,8 @@ class PersistentCourse13(object):
             persistent.deserialize(stream.read())
             return CourseModel13(
                 app_context, next_id=persistent.next_id,
-                units=persistent.units, lessons=persistent.lessons)
+                units=persistent.units, lessons=persistent.lessons,
+                content_version=persistent.content_version)
         return None
 
     def serialize(self):
@@ -1005,12 +1013,13 @@ class CachedCourse13(AbstractCachedObject):
 
     def __init__(
         self, next_id=None, units=None, lessons=None,
-        unit_id_to_lesson_ids=None):
+        unit_id_to_lesson_ids=None, content_version=None):
 
         self.version = self.VERSION
         self.next_id = next_id
         self.units = units
         self.lessons = lessons
+        self.content_version = content_version
 
         # This is almost the same as PersistentCourse13 above, but it also
         # stores additional indexes used for performance optimizations. There
@@ -1033,14 +1042,16 @@ class CachedCourse13(AbstractCachedObject):
         return CourseModel13(
             app_context, next_id=memento.next_id,
             units=memento.units, lessons=memento.lessons,
-            unit_id_to_lesson_ids=memento.unit_id_to_lesson_ids)
+            unit_id_to_lesson_ids=memento.unit_id_to_lesson_ids,
+            content_version=getattr(memento, 'content_version', None))
 
     @classmethod
     def memento_from_instance(cls, course):
         return CachedCourse13(
             next_id=course.next_id,
             units=course.units, lessons=course.lessons,
-            unit_id_to_lesson_ids=course.unit_id_to_lesson_ids)
+            unit_id_to_lesson_ids=course.unit_id_to_lesson_ids,
+            content_version=course.content_version)
 
 
 class CourseModel13(object):
@@ -1071,7 +1082,7 @@ class CourseModel13(object):
 
     def __init__(
         self, app_context, next_id=None, units=None, lessons=None,
-        unit_id_to_lesson_ids=None):
+        unit_id_to_lesson_ids=None, content_version=None):
 
         # Init default values.
         self._app_context = app_context
@@ -1079,6 +1090,8 @@ class CourseModel13(object):
         self._units = []
         self._lessons = []
         self._unit_id_to_lesson_ids = {}
+        # A stamp that changes every time units or lessons are saved.
+        self._content_version = content_version
 
         # These array keep dirty object in current transaction.
         self._dirty_units = []
@@ -1118,6 +1131,10 @@ class CourseModel13(object):
     def unit_id_to_lesson_ids(self):
         return self._unit_id_to_lesson_ids
 
+    @property
+    def content_version(self):
+        return self._content_version
+
     def _get_next_id(self):
         """Allocates next id in sequence."""
         next_id = self._next_id
@@ -1263,10 +1280,18 @@ class CourseModel13(object):
         self._deleted_units = []
         self._deleted_lessons = []
 
+        old_content_version = self._content_version
+        self._content_version = common_utils.generate_instance_id()
+
         self._index()
         PersistentCourse13.save(self._app_context, self)
         CachedCourse13.delete(self._app_context)
 
+        with Namespace(self._app_context.get_namespace_name()):
+            question_usage.QuestionUsageIndex.on_course_saved(
+                self._units, self._lessons, old_content_version,
+                self._content_version)
+
     def get_units(self):
         return self._units[:]
 
@@ -2158,6 +2183,13 @@ class Course(object):
     # saved.
     COURSE_ENV_POST_SAVE_HOOKS = []
 
+    # Holds callback functions which are passed the course after the content
+    # of another course was imported into it. Entities of the types in
+    # ADDITIONAL_ENTITIES_FOR_COURSE_IMPORT are copied as they are, without
+    # any hooks of their own running; these callbacks can refresh whatever
+    # derived data is cached for them.
+    POST_IMPORT_HOOKS = []
+
     # Data which is patched onto the course environment - for testing use only.
     ENVIRON_TEST_OVERRIDES = {}
 
@@ -2749,6 +2781,20 @@ class Course(object):
     def save(self):
         return self._model.save()
 
+    @property
+    def content_version(self):
+        """A stamp that changes whenever units or lessons are saved.
+
+        Returns:
+            A string, or None for courses that cannot be edited.
+        """
+        return getattr(self._model, 'content_version', None)
+
+    def get_question_usage_index(self):
+        """Returns question_usage.QuestionUsageIndex for this course."""
+        with Namespace(self._namespace):
+            return question_usage.QuestionUsageIndex.load(self)
+
     def find_unit_by_id(self, unit_id):
         return self._model.find_unit_by_id(unit_id)
 
@@ -3065,22 +3111,21 @@ class Course(object):
 
         qulocations = {}
         qglocations = {}
+        index = self.get_question_usage_index()
 
-        def _add_to_map(component, unit, lesson=None):
+        def _add_to_map(usage, unit, lesson=None):
             try:
-                if component.get('cpt_name') == 'question':
+                if usage['type'] == 'question':
                     compononent_locations = qulocations.setdefault(
-                        long(component.get('quid')),
+                        long(usage['id']),
                         {'lessons': {}, 'assessments': {}}
                     )
-                elif component.get('cpt_name') == 'question-group':
+                else:
                     compononent_locations = qglocations.setdefault(
-                        long(component.get('qgid')),
+                        long(usage['id']),
                         {'lessons': {}, 'assessments': {}}
                     )
-                else:
-                    return
-            except ValueError:
+            except (TypeError, ValueError):
                 title = lesson.title if lesson else unit.title
                 logging.exception('Bad component ID found in "%s"', title)
                 return
@@ -3097,14 +3142,14 @@ class Course(object):
 
         for unit in self.get_units():
             if unit.type == verify.UNIT_TYPE_ASSESSMENT:
-                for component in self.get_assessment_components(unit.unit_id):
-                    _add_to_map(component, unit)
+                for usage in index.get_page_usages(unit.unit_id):
+                    _add_to_map(usage, unit)
 
             elif unit.type == verify.UNIT_TYPE_UNIT:
                 for lesson in self.get_lessons(unit.unit_id):
-                    for component in self.get_components(
+                    for usage in index.get_page_usages(
                             unit.unit_id, lesson.lesson_id):
-                        _add_to_map(component, unit, lesson)
+                        _add_to_map(usage, unit, lesson)
 
         return (qulocations, qglocations)
 
@@ -3175,6 +3220,8 @@ class Course(object):
             CourseModel12.VERSION, CourseModel13.VERSION]):
             result = self._model.import_from(src_course, errors)
             self.app_context.clear_per_request_cache()
+            if result[1]:
+                common_utils.run_hooks(self.POST_IMPORT_HOOKS, self)
             return result
 
         errors.append(
@@ -38,6 +38,9 @@ DB_DELETE = PerfCounter(
 # String. Name of the safe key property used for data export.
 SAFE_KEY_NAME = 'safe_key'
 
+# Map of BaseEntity subclass to its _ExportPlan.
+_EXPORT_PLANS = {}
+
 
 def delete(keys):
     """Wrapper around db.delete that counts entities we attempted to get."""
@@ -79,6 +82,55 @@ class ExportEntity(db.Expando):
         raise NotImplementedError
 
 
+class _ExportPlan(object):
+    """What exporting an entity of some class needs; computed once per class.
+
+    Holds the names of the plain properties, the reference properties, whose
+    keys are read without fetching their referents, and the blacklist, both
+    as sorted names and as paths split at dots. A plan is replaced when any
+    _PROPERTY_EXPORT_BLACKLIST it was compiled from is.
+    """
+
+    @staticmethod
+    def _get_blacklists(entity_class):
+        return [
+            klass._PROPERTY_EXPORT_BLACKLIST  # pylint: disable=protected-access
+            for klass in entity_class.__mro__
+            if hasattr(klass, '_PROPERTY_EXPORT_BLACKLIST')]
+
+    def __init__(self, entity_class):
+        self.property_names = []
+        self.reference_properties = []
+        for name, prop in entity_class.properties().items():
+            if isinstance(prop, db.ReferenceProperty):
+                self.reference_properties.append((name, prop))
+            else:
+                self.property_names.append(name)
+
+        self._blacklists = self._get_blacklists(entity_class)
+        blacklist = []
+        for klass_blacklist in self._blacklists:
+            blacklist.extend(klass_blacklist)
+
+        for index, item in enumerate(blacklist):
+            if isinstance(item, db.Property):
+                blacklist[index] = item.name
+            elif isinstance(item, basestring):
+                pass
+            else:
+                raise ValueError(
+                    'Blacklist entries must be either a db.Property ' +
+                    'or a string.  The entry "%s" is neither. ' % str(item))
+        self.blacklist = sorted(set(blacklist))
+        self.blacklist_paths = [item.split('.') for item in self.blacklist]
+
+    def is_current(self, entity_class):
+        blacklists = self._get_blacklists(entity_class)
+        return len(blacklists) == len(self._blacklists) and all([
+            current is compiled
+            for current, compiled in zip(blacklists, self._blacklists)])
+
+
 class BaseEntity(db.Model):
     """A common class to all datastore entities."""
 
@@ -144,26 +196,19 @@ class BaseEntity(db.Model):
         assert cls.kind() == db_key.kind()
         return db_key
 
+    @classmethod
+    def _get_export_plan(cls):
+        """Gets the _ExportPlan of this class, compiling it on first use."""
+        plan = _EXPORT_PLANS.get(cls)
+        if plan is None or not plan.is_current(cls):
+            plan = _ExportPlan(cls)
+            _EXPORT_PLANS[cls] = plan
+        return plan
+
     @classmethod
     def _get_export_blacklist(cls):
         """Collapses all _PROPERTY_EXPORT_BLACKLISTs in the class hierarchy."""
-        blacklist = []
-        for klass in cls.__mro__:
-            if hasattr(klass, '_PROPERTY_EXPORT_BLACKLIST'):
-                # Treat as module-protected.
-                # pylint: disable=protected-access
-                blacklist.extend(klass._PROPERTY_EXPORT_BLACKLIST)
-
-        for index, item in enumerate(blacklist):
-            if isinstance(item, db.Property):
-                blacklist[index] = item.name
-            elif isinstance(item, basestring):
-                pass
-            else:
-                raise ValueError(
-                    'Blacklist entries must be either a db.Property ' +
-                    'or a string.  The entry "%s" is neither. ' % str(item))
-        return sorted(set(blacklist))
+        return list(cls._get_export_plan().blacklist)
 
     def put(self):
         DB_PUT.inc()
@@ -201,6 +246,7 @@ class BaseEntity(db.Model):
             called 'safe_key', containing a string representation of the value
             returned by cls.safe_key().
         """
+        plan = self._get_export_plan()
         properties = {}
 
         # key is a reserved property and cannot be mutated; write to safe_key
@@ -210,15 +256,17 @@ class BaseEntity(db.Model):
         assert SAFE_KEY_NAME not in self.properties().iterkeys()
         properties[SAFE_KEY_NAME] = self.safe_key(self.key(), transform_fn)
 
-        for name, prop in self.properties().items():
-            if isinstance(prop, db.ReferenceProperty):
-                referent = getattr(self, name)
-                if referent:
-                    unsafe_key = referent.key()
-                    safe_key = referent.safe_key(unsafe_key, transform_fn)
-                    properties[name] = str(safe_key)
-            else:
-                properties[name] = getattr(self, name)
+        for name in plan.property_names:
+            properties[name] = getattr(self, name)
+
+        # Only the keys of referents are exported; read them without fetching
+        # the referents.
+        for name, prop in plan.reference_properties:
+            unsafe_key = prop.get_value_for_datastore(self)
+            if unsafe_key:
+                referent_class = db.class_for_kind(unsafe_key.kind())
+                safe_key = referent_class.safe_key(unsafe_key, transform_fn)
+                properties[name] = str(safe_key)
         return properties
 
     def for_export(self, transform_fn):
@@ -230,8 +278,8 @@ class BaseEntity(db.Model):
         # specifying 'additional_items.name' would remove the PII item for
         # the student's name, but not affect additional_items['goal'],
         # (the student's goal for the course), which is not PII.
-        for item in  self._get_export_blacklist():
-            self._remove_named_component(item, properties)
+        for path in self._get_export_plan().blacklist_paths:
+            self._remove_path(path, properties)
         return ExportEntity(**properties)
 
     def for_export_unsafe(self):
@@ -263,17 +311,21 @@ class BaseEntity(db.Model):
 
     @classmethod
     def _remove_named_component(cls, spec, container):
-        name, tail = spec.split('.', 1) if '.' in spec else (spec, None)
+        cls._remove_path(spec.split('.'), container)
 
+    @classmethod
+    def _remove_path(cls, path, container, index=0):
+        """Removes the item at path[index:], a list of names, if present."""
+        name = path[index]
         if isinstance(container, dict) and name in container:
-            if tail:
+            if index + 1 < len(path):
                 tmp_dict = transforms.nested_lists_as_string_to_dict(
                     container[name])
                 if tmp_dict:
-                    cls._remove_named_component(tail, tmp_dict)
+                    cls._remove_path(path, tmp_dict, index + 1)
                     container[name] = transforms.dict_to_nested_lists_as_string(
                         tmp_dict)
                 else:
-                    cls._remove_named_component(tail, container[name])
+                    cls._remove_path(path, container[name], index + 1)
             else:
                 del container[name]
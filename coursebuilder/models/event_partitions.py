@@ -0,0 +1,85 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Map/reduce jobs over the events of some sources only.
+
+Busy courses record hundreds of millions of events, most of them page views.
+A job reading answers only cares about a few sources, yet mapping over
+EventEntity reads every event. EventEntity keeps an indexed copy of its
+source in 'partition', and jobs derived from PartitionedEventsJob name the
+sources they want; their input reader then queries each of these partitions
+and reads no other event.
+
+Events recorded before partitions existed have none, and a partitioned
+read would miss them. The first partitioned job run in a course therefore
+starts EventPartitionsBackfill, which sets the partition of older events,
+and reads all events until the backfill has completed.
+"""
+
+from mapreduce import operation
+
+from models import jobs
+from models import models
+
+
+class EventPartitionsBackfill(jobs.AbstractCountingMapReduceJob):
+    """Sets the partition of events recorded before events had one."""
+
+    @staticmethod
+    def get_description():
+        return 'event partitions backfill'
+
+    @staticmethod
+    def entity_class():
+        return models.EventEntity
+
+    @staticmethod
+    def map(event):
+        if event.partition != event.source:
+            event.partition = event.source
+            yield operation.db.Put(event)
+            yield 'backfilled', 1
+
+
+def is_backfill_complete(app_context):
+    """Whether all events of a course have their partition set."""
+    job = EventPartitionsBackfill(app_context).load()
+    return job is not None and job.status_code == jobs.STATUS_CODE_COMPLETED
+
+
+class PartitionedEventsJob(jobs.MapReduceJob):
+    """Base for jobs that map over the events of a few sources only."""
+
+    @staticmethod
+    def entity_class():
+        return models.EventEntity
+
+    def get_event_sources_wanted(self):
+        """Returns the sources of the events map() is called for.
+
+        Returns:
+          A list of event sources, or None to map over all events.
+        """
+        raise NotImplementedError(
+            'Classes derived from PartitionedEventsJob must implement '
+            'get_event_sources_wanted()')
+
+    def entity_partitions(self):
+        sources = self.get_event_sources_wanted()
+        if sources is None:
+            return None
+        if not is_backfill_complete(self._app_context):
+            EventPartitionsBackfill(self._app_context).submit()
+            return None
+        return sources
@@ -20,7 +20,6 @@ import collections
 import logging
 
 import courses
-from common import tags
 import models
 from tools import verify
 
@@ -290,33 +289,6 @@ def unpack_check_answers(
     return answers
 
 
-def _add_questions_from_html(
-    questions_by_usage_id, unit_id, lesson_id, html, question_group_lengths):
-    """Parse rich-text HTML and add questions found to map by ID."""
-
-    sequence_counter = 0
-    for component in tags.get_components_from_html(html):
-        if component['cpt_name'] == 'question':
-            questions_by_usage_id[component['instanceid']] = {
-                'unit': unit_id,
-                'lesson': lesson_id,
-                'sequence': sequence_counter,
-                'id': component['quid'],
-                'weight': float(component.get('weight', 1.0)),
-                }
-            sequence_counter += 1
-        elif component['cpt_name'] == 'question-group':
-            questions_by_usage_id[component['instanceid']] = {
-                'unit': unit_id,
-                'lesson': lesson_id,
-                'sequence': sequence_counter,
-                'id': component['qgid'],
-                }
-            if component['qgid'] in question_group_lengths:
-                sequence_counter += (
-                    question_group_lengths[component['qgid']])
-
-
 def get_questions_by_usage_id(app_context):
     """Build map: question-usage-ID to {question ID, unit ID, sequence}.
 
@@ -331,29 +303,13 @@ def get_questions_by_usage_id(app_context):
       workerbee instances.
     """
 
-    questions_by_usage_id = {}
-    # To know a question's sequence number within an assessment, we need
-    # to know how many questions a question group contains.
-    question_group_lengths = {}
-    for group in models.QuestionGroupDAO.get_all():
-        question_group_lengths[str(group.id)] = (
-            len(group.question_ids))
-
-    # Run through course.  For each assessment, parse the HTML content
-    # looking for questions and question groups.  For each of those,
-    # record the unit ID, use-of-item-on-page-instance-ID (a string
-    # like 'RK3q5H2dS7So'), and the sequence on the page.  Questions
-    # count as one position.  Question groups increase the sequence
-    # count by the number of questions they contain.
+    # The index records, for each assessment and lesson, the
+    # use-of-item-on-page-instance-ID (a string like 'RK3q5H2dS7So') of
+    # each question and question group, and the sequence on the page.
+    # Questions count as one position.  Question groups increase the
+    # sequence count by the number of questions they contain.
     course = courses.Course(None, app_context)
-    for unit in course.get_units():
-        _add_questions_from_html(questions_by_usage_id, unit.unit_id, None,
-                                 unit.html_content, question_group_lengths)
-        for lesson in course.get_lessons(unit.unit_id):
-            _add_questions_from_html(questions_by_usage_id, unit.unit_id,
-                                     lesson.lesson_id, lesson.objectives,
-                                     question_group_lengths)
-    return questions_by_usage_id
+    return course.get_question_usage_index().get_questions_by_usage_id()
 
 
 def get_assessment_weights(app_context):
@@ -16,7 +16,6 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
-import ast
 import datetime
 import logging
 import time
@@ -24,9 +23,18 @@ import traceback
 import urllib
 
 import entities
+import record_codec
+import shard_planner
 from mapreduce import base_handler
+from mapreduce import context
+from mapreduce import datastore_range_iterators
 from mapreduce import input_readers
+from mapreduce import key_ranges
 from mapreduce import mapreduce_pipeline
+from mapreduce import model as mapreduce_model
+from mapreduce import namespace_range
+from mapreduce import operation
+from mapreduce import property_range
 from mapreduce.lib.pipeline import pipeline
 import transforms
 from common.utils import Namespace
@@ -49,6 +57,19 @@ STATUS_CODE_DESCRIPTION = {
     STATUS_CODE_FAILED: 'Failed',
 }
 
+# Results of a MapReduceJob are stored as JSON in DurableJobResultsShard
+# entities holding at most this many bytes each, well under the entity size
+# limit.
+RESULTS_SHARD_MAX_BYTES = 512 * 1024
+
+# Number of results shards loaded from the datastore in one batch.
+RESULTS_SHARDS_PER_FETCH = 8
+
+# Names of map/reduce counters kept when map() output is combined in the
+# mapper; they tell how much combining shrinks the shuffle.
+COUNTER_MAP_VALUES = 'gcb-map-values'
+COUNTER_MAP_VALUES_SHUFFLED = 'gcb-map-values-shuffled'
+
 # The methods in DurableJobEntity are module-level protected
 # pylint: disable=protected-access
 
@@ -171,40 +192,232 @@ class DurableJob(DurableJobBase):
 
 class MapReduceJobPipeline(base_handler.PipelineBase):
 
-    def run(self, job_name, sequence_num, kwargs, namespace):
+    def run(self, job_name, sequence_num, kwargs, namespace,
+            codec_name=None, shard_plan=None):
         time_started = time.time()
 
         with Namespace(namespace):
             db.run_in_transaction(
                 DurableJobEntity._start_job, job_name, sequence_num,
-                MapReduceJob.build_output(self.root_pipeline_id, []))
+                MapReduceJob.build_output(
+                    self.root_pipeline_id, [], shard_plan=shard_plan))
         output = yield mapreduce_pipeline.MapreducePipeline(**kwargs)
         yield StoreMapReduceResults(job_name, sequence_num, time_started,
-                                    namespace, output)
+                                    namespace, output, codec_name, shard_plan)
 
     def finalized(self):
         pass  # Suppress default Pipeline behavior of sending email.
 
 
+class _ResultsShardWriter(object):
+    """Writes results to DurableJobResultsShard entities as they fill up."""
+
+    def __init__(self, job_name, sequence_num):
+        self._job_name = job_name
+        self._sequence_num = sequence_num
+        self._items = []
+        self._size = 0
+        self.shard_sizes = []
+
+    def add(self, result):
+        item = transforms.dumps(result)
+        if self._items and self._size + len(item) > RESULTS_SHARD_MAX_BYTES:
+            self.flush()
+        self._items.append(item)
+        self._size += len(item) + 1
+
+    def flush(self):
+        if not self._items:
+            return
+        DurableJobResultsShard(
+            key_name=DurableJobResultsShard.key_name(
+                self._job_name, self._sequence_num, len(self.shard_sizes)),
+            job_name=self._job_name,
+            data='[%s]' % ','.join(self._items)).put()
+        self.shard_sizes.append(len(self._items))
+        self._items = []
+        self._size = 0
+
+
+class BatchingDatastoreInputReader(input_readers.DatastoreInputReader):
+    """Hands entities to the mapper in lists rather than one at a time.
+
+    Used for jobs that set MapReduceJob.MAP_BATCH_SIZE.  A slice can only end
+    between two calls to the mapper, so values combined across one list are
+    always emitted before the shard is checkpointed.
+    """
+
+    BATCH_SIZE_PARAM = 'map_batch_size'
+
+    def __iter__(self):
+        batch_size = context.get().mapreduce_spec.mapper.params[
+            self.BATCH_SIZE_PARAM]
+        batch = []
+        for item in super(BatchingDatastoreInputReader, self).__iter__():
+            if item is input_readers.ALLOW_CHECKPOINT:
+                if batch:
+                    yield batch
+                    batch = []
+                yield item
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class _PartitionsIterator(object):
+    """Chains the iterators over the partitions of one shard.
+
+    Partitions are read one after the other; iterators are dropped once
+    done, so a shard restarted from its JSON state resumes where it was.
+    """
+
+    def __init__(self, iterators):
+        self._iterators = iterators
+
+    def __iter__(self):
+        while self._iterators:
+            for item in self._iterators[0]:
+                yield item
+            self._iterators.pop(0)
+
+    def __repr__(self):
+        return 'Partitions(%s)' % ', '.join(
+            repr(iterator) for iterator in self._iterators)
+
+    def to_json(self):
+        return {'partition_iterators': [
+            iterator.to_json() for iterator in self._iterators]}
+
+    @classmethod
+    def from_json(cls, json):
+        return cls([
+            datastore_range_iterators.RangeIteratorFactory.from_json(item)
+            for item in json['partition_iterators']])
+
+
+class PartitionedDatastoreInputReader(input_readers.DatastoreInputReader):
+    """Reads only the entities of some partitions of a kind.
+
+    Used for jobs whose entity_partitions() are not None.  Each shard reads a
+    range of keys of the kind, as DatastoreInputReader does, but with one
+    query per partition, filtering on the indexed property the entity class
+    names in PARTITION_PROPERTY.  Entities of other partitions are never
+    read.
+
+    When the job's 'filters' bound a property to a range, e.g. recorded_on
+    to the events since the last run, shards split that range instead, and
+    read it from each partition.  An index on the partition property then
+    the ranged property is needed.
+    """
+
+    PARTITIONS_PARAM = 'partitions'
+    PARTITION_PROPERTY_PARAM = 'partition_property'
+
+    @classmethod
+    def split_input(cls, mapper_spec):
+        params = input_readers._get_params(  # pylint: disable=protected-access
+            mapper_spec)
+        partitions = params[cls.PARTITIONS_PARAM]
+        partition_property = params[cls.PARTITION_PROPERTY_PARAM]
+        query_spec = cls._get_query_spec(mapper_spec)
+        if not partitions:
+            return []
+
+        if property_range.should_shard_by_property_range(query_spec.filters):
+            return cls._split_property_ranges(
+                query_spec, mapper_spec.shard_count, partition_property,
+                partitions)
+
+        readers = []
+        for k_ranges in cls._to_key_ranges_by_shard(
+            query_spec.app, [query_spec.ns], mapper_spec.shard_count,
+            query_spec):
+            iterators = []
+            for partition in partitions:
+                partition_spec = mapreduce_model.QuerySpec.from_json(
+                    query_spec.to_json())
+                partition_spec.filters = [
+                    (partition_property, '=', partition)]
+                # Key ranges are consumed as they are read; each query
+                # needs its own copy.
+                partition_ranges = key_ranges.KeyRangesFactory.from_json(
+                    k_ranges.to_json())
+                iterators.append(
+                    datastore_range_iterators.RangeIteratorFactory
+                    .create_key_ranges_iterator(
+                        partition_ranges, partition_spec,
+                        cls._KEY_RANGE_ITER_CLS))
+            readers.append(cls(_PartitionsIterator(iterators)))
+        return readers
+
+    @classmethod
+    def _split_property_ranges(cls, query_spec, shard_count,
+                               partition_property, partitions):
+        iterators_by_shard = []
+        for partition in partitions:
+            partition_spec = mapreduce_model.QuerySpec.from_json(
+                query_spec.to_json())
+            partition_spec.filters = query_spec.filters + [
+                (partition_property, '=', partition)]
+            p_ranges = property_range.PropertyRange(
+                partition_spec.filters,
+                query_spec.model_class_path).split(shard_count)
+            for index, p_range in enumerate(p_ranges):
+                if index == len(iterators_by_shard):
+                    iterators_by_shard.append([])
+                ns_range = namespace_range.NamespaceRange(
+                    namespace_start=query_spec.ns,
+                    namespace_end=query_spec.ns, _app=query_spec.app)
+                iterators_by_shard[index].append(
+                    datastore_range_iterators.RangeIteratorFactory
+                    .create_property_range_iterator(
+                        p_range, ns_range, partition_spec))
+        return [cls(_PartitionsIterator(iterators))
+                for iterators in iterators_by_shard]
+
+    @classmethod
+    def from_json(cls, json):
+        return cls(_PartitionsIterator.from_json(json))
+
+
+class BatchingPartitionedDatastoreInputReader(
+    PartitionedDatastoreInputReader, BatchingDatastoreInputReader):
+    """Reads some partitions of a kind and hands entities over in lists."""
+
+
 class StoreMapReduceResults(base_handler.PipelineBase):
 
-    def run(self, job_name, sequence_num, time_started, namespace, output):
-        results = []
+    def run(self, job_name, sequence_num, time_started, namespace, output,
+            codec_name=None, shard_plan=None):
+        writer = _ResultsShardWriter(job_name, sequence_num)
+        codec = record_codec.get_codec(codec_name)
 
         # TODO(mgainer): Notice errors earlier in pipeline, and mark job
         # as failed in that case as well.
         try:
-            iterator = input_readers.RecordsReader(output, 0)
-            for item in iterator:
-                # Map/reduce puts reducer output into blobstore files as a
-                # string obtained via "str(result)".  Use AST as a safe
-                # alternative to eval() to get the Python object back.
-                results.append(ast.literal_eval(item))
+            with Namespace(namespace):
+                DurableJobResultsShard.delete_stale(job_name, sequence_num)
+                iterator = input_readers.RecordsReader(output, 0)
+                for item in iterator:
+                    # Map/reduce puts reducer output into blobstore files as
+                    # a string; by default that is "str(result)", which the
+                    # default codec parses with AST as a safe alternative to
+                    # eval().  Results are written out shard by shard rather
+                    # than held in memory.
+                    writer.add(codec.decode(item))
+                writer.flush()
             time_completed = time.time()
             with Namespace(namespace):
                 db.run_in_transaction(
                     DurableJobEntity._complete_job, job_name, sequence_num,
-                    MapReduceJob.build_output(self.root_pipeline_id, results),
+                    MapReduceJob.build_output(
+                        self.root_pipeline_id, None,
+                        result_shard_sizes=writer.shard_sizes,
+                        shard_plan=shard_plan),
                     long(time_completed - time_started))
         # Don't know what exceptions are currently, or will be in future,
         # thrown from Map/Reduce or Pipeline libraries; these are under
@@ -216,8 +429,10 @@ class StoreMapReduceResults(base_handler.PipelineBase):
             with Namespace(namespace):
                 db.run_in_transaction(
                     DurableJobEntity._fail_job, job_name, sequence_num,
-                    MapReduceJob.build_output(self.root_pipeline_id, results,
-                                              str(ex)),
+                    MapReduceJob.build_output(
+                        self.root_pipeline_id, None, str(ex),
+                        result_shard_sizes=writer.shard_sizes,
+                        shard_plan=shard_plan),
                     long(time_completed - time_started))
 
 
@@ -235,6 +450,18 @@ class MapReduceJob(DurableJobBase):
     # _OUTPUT_KEY_RESULTS
     # Holds a list of individual results.  The result items will be of
     # whatever type is 'yield'-ed from the 'reduce' method (see below).
+    # Only present for runs that stored their results in line, before
+    # results were sharded.
+    #
+    # _OUTPUT_KEY_RESULT_SHARD_SIZES
+    # Holds the number of results stored in each DurableJobResultsShard of
+    # the run, in order.  Use iter_results() or get_results_page() rather
+    # than loading the shards directly.
+    #
+    # _OUTPUT_KEY_SHARD_PLAN
+    # Holds the dict form of the shard_planner.ShardPlan the run was started
+    # with; see get_shard_plan().  Absent for runs started before jobs were
+    # planned.
     #
     # _OUTPUT_KEY_ERROR
     # Stringified error message in the event that something has gone wrong
@@ -242,15 +469,46 @@ class MapReduceJob(DurableJobBase):
     # STATUS_CODE_FAILED.
     _OUTPUT_KEY_ROOT_PIPELINE_ID = 'root_pipeline_id'
     _OUTPUT_KEY_RESULTS = 'results'
+    _OUTPUT_KEY_RESULT_SHARD_SIZES = 'result_shard_sizes'
+    _OUTPUT_KEY_SHARD_PLAN = 'shard_plan'
     _OUTPUT_KEY_ERROR = 'error'
 
+    # How values are passed from map() to combine() and reduce(), and from
+    # reduce() to the job results.  When None, the framework stores each
+    # value as str(value), and combine() and reduce() receive those strings.
+    # Set to a codec from models.record_codec, e.g. TypedRecordCodec, to
+    # have combine() and reduce() receive the values as they were yielded.
+    RECORD_CODEC = None
+
+    # When set, values are combined in the mapper before the shuffle.  The
+    # mapper is given lists of up to this many entities, calls map() on each
+    # and folds the values emitted for each key together using
+    # combine_in_mapper().  reduce() then only receives combined values.
+    MAP_BATCH_SIZE = None
+
+    # Most keys held while combining a list of entities; when exceeded, all
+    # combined values are emitted and combining starts afresh.
+    MAP_COMBINER_MAX_KEYS = 1000
+
+    # Number of entities each shard should map.  The number of shards of a
+    # run is chosen from an estimate of the number of entities of
+    # entity_class() in the course; see models.shard_planner.
+    TARGET_ENTITIES_PER_SHARD = shard_planner.DEFAULT_TARGET_ENTITIES_PER_SHARD
+
     @staticmethod
-    def build_output(root_pipeline_id, results_list, error=None):
-        return transforms.dumps({
+    def build_output(root_pipeline_id, results_list, error=None,
+                     result_shard_sizes=None, shard_plan=None):
+        output = {
             MapReduceJob._OUTPUT_KEY_ROOT_PIPELINE_ID: root_pipeline_id,
             MapReduceJob._OUTPUT_KEY_RESULTS: results_list,
             MapReduceJob._OUTPUT_KEY_ERROR: error,
-            })
+            }
+        if result_shard_sizes is not None:
+            output[MapReduceJob._OUTPUT_KEY_RESULT_SHARD_SIZES] = (
+                result_shard_sizes)
+        if shard_plan is not None:
+            output[MapReduceJob._OUTPUT_KEY_SHARD_PLAN] = shard_plan
+        return transforms.dumps(output)
 
     @staticmethod
     def get_status_url(job, namespace, xsrf_token):
@@ -276,12 +534,126 @@ class MapReduceJob(DurableJobBase):
             return False
         return MapReduceJob._OUTPUT_KEY_ROOT_PIPELINE_ID in job.output
 
+    @staticmethod
+    def get_shard_plan(job):
+        """Returns the shard_planner.ShardPlan of a run, or None."""
+        if not job or not job.output:
+            return None
+        content = transforms.loads(job.output)
+        plan = content.get(MapReduceJob._OUTPUT_KEY_SHARD_PLAN)
+        if not plan:
+            return None
+        return shard_planner.ShardPlan.from_dict(plan)
+
     @staticmethod
     def get_results(job):
+        """Returns all results of a job as a list.
+
+        Prefer iter_results() or get_results_page() for jobs that may have
+        many results.
+        """
         if not job.output:
             return None
+        return list(MapReduceJob.iter_results(job))
+
+    @staticmethod
+    def _iter_result_shards(job, shard_sizes, first_shard, end_shard):
+        """Yields (index, results) of shards of a job in [first, end)."""
+        for start in xrange(first_shard, end_shard, RESULTS_SHARDS_PER_FETCH):
+            indexes = range(
+                start, min(start + RESULTS_SHARDS_PER_FETCH, end_shard))
+            shards = db.get([
+                DurableJobResultsShard.get_key(job, index)
+                for index in indexes])
+            for index, shard in zip(indexes, shards):
+                if shard is None:
+                    raise ValueError(
+                        'Results shard %s of job %s is missing.' % (
+                            index, job.key().name()))
+                results = transforms.loads(shard.data)
+                if len(results) != shard_sizes[index]:
+                    raise ValueError(
+                        'Results shard %s of job %s is out of date.' % (
+                            index, job.key().name()))
+                yield index, results
+
+    @staticmethod
+    def iter_results(job):
+        """Yields the results of a job, loading one batch of shards at a time.
+
+        Args:
+          job: DurableJobEntity of a finished MapReduceJob.
+        """
+        if not job.output:
+            return
+        content = transforms.loads(job.output)
+        shard_sizes = content.get(MapReduceJob._OUTPUT_KEY_RESULT_SHARD_SIZES)
+        if shard_sizes is None:
+            for result in content[MapReduceJob._OUTPUT_KEY_RESULTS] or []:
+                yield result
+            return
+        for _, results in MapReduceJob._iter_result_shards(
+            job, shard_sizes, 0, len(shard_sizes)):
+            for result in results:
+                yield result
+
+    @staticmethod
+    def get_result_count(job):
+        """Returns the number of results of a job without loading them."""
+        if not job.output:
+            return 0
         content = transforms.loads(job.output)
-        return content[MapReduceJob._OUTPUT_KEY_RESULTS]
+        shard_sizes = content.get(MapReduceJob._OUTPUT_KEY_RESULT_SHARD_SIZES)
+        if shard_sizes is None:
+            return len(content[MapReduceJob._OUTPUT_KEY_RESULTS] or [])
+        return sum(shard_sizes)
+
+    @staticmethod
+    def get_results_page(job, page_number, page_size):
+        """Returns one page of the results of a job.
+
+        Only the shards holding results of the page are loaded.
+
+        Args:
+          job: DurableJobEntity of a finished MapReduceJob.
+          page_number: int. Zero-based number of the page.
+          page_size: int. Number of results in each page.
+        Returns:
+          A list of at most page_size results; empty past the last page.
+        """
+        if not job.output:
+            return []
+        content = transforms.loads(job.output)
+        shard_sizes = content.get(MapReduceJob._OUTPUT_KEY_RESULT_SHARD_SIZES)
+        page_start = page_number * page_size
+        page_end = page_start + page_size
+        if shard_sizes is None:
+            results = content[MapReduceJob._OUTPUT_KEY_RESULTS] or []
+            return results[page_start:page_end]
+
+        # Find the shards overlapping the page from the running totals.
+        first_shard = None
+        end_shard = len(shard_sizes)
+        shard_start = 0
+        shard_starts = []
+        for index, size in enumerate(shard_sizes):
+            shard_starts.append(shard_start)
+            if first_shard is None and shard_start + size > page_start:
+                first_shard = index
+            if shard_start >= page_end:
+                end_shard = index
+                break
+            shard_start += size
+        if first_shard is None:
+            return []
+
+        page = []
+        for index, results in MapReduceJob._iter_result_shards(
+            job, shard_sizes, first_shard, end_shard):
+            offset = shard_starts[index]
+            page.extend(results[
+                max(page_start - offset, 0):page_end - offset])
+        return page
 
     @staticmethod
     def get_error_message(job):
@@ -295,6 +667,23 @@ class MapReduceJob(DurableJobBase):
         raise NotImplementedError('Classes derived from MapReduceJob must '
                                   'implement entity_class()')
 
+    def entity_partitions(self):
+        """Returns the partitions of entity_class() to map, or None for all.
+
+        Entity classes can be partitioned by an indexed property, whose name
+        they give in PARTITION_PROPERTY.  Jobs that only need the entities
+        having some values of this property return these values; map() is
+        then only called for these entities, and no other entity is read.
+
+        Called before the job is submitted, with the namespace of the course
+        current.  Return None when not all entities have their partition
+        property set yet.
+
+        Returns:
+          A list of values of the partition property, or None.
+        """
+        return None
+
     @staticmethod
     def map(item):
         """Implements the map function.  Must be declared @staticmethod.
@@ -366,6 +755,100 @@ class MapReduceJob(DurableJobBase):
                                   'optionally implement combine() as a static '
                                   'method.')
 
+    @staticmethod
+    def combine_in_mapper(key, combined, value):
+        """Optional.  Folds a value emitted by map() into a combined value.
+
+        Used when MAP_BATCH_SIZE is set.  Unlike combine(), this sees the
+        values exactly as map() emitted them, and its result is what reduce()
+        receives, so it may change the shape of the values.  As an example,
+        a job counting answers may have map() emit single answers and this
+        function build a dict of answer to count.
+
+        Args:
+          key: The key map() emitted the value for.
+          combined: The value combined so far for the key, or None for the
+              first value of the key.
+          value: A value map() emitted for the key.
+        Returns:
+          The new combined value for the key.
+        """
+        raise NotImplementedError('Classes derived from MapReduceJob that set '
+                                  'MAP_BATCH_SIZE must implement '
+                                  'combine_in_mapper() as a static method.')
+
+    @classmethod
+    def _iter_map_output(cls, item):
+        results = cls.map(item)
+        if results is None:
+            return []
+        if isinstance(results, tuple):
+            return [results]
+        return results
+
+    @classmethod
+    def _map_with_codec(cls, item):
+        """Runs map(), encoding the values it emits with RECORD_CODEC."""
+        for key, value in cls._iter_map_output(item):
+            yield key, cls.RECORD_CODEC.encode(value)
+
+    @classmethod
+    def _emit_combined(cls, combined):
+        if cls.RECORD_CODEC:
+            pairs = [(key, cls.RECORD_CODEC.encode(value))
+                     for key, value in combined.iteritems()]
+        else:
+            pairs = combined.items()
+        combined.clear()
+        return pairs
+
+    @classmethod
+    def _map_batch(cls, items):
+        """Runs map() over a list of entities, combining values per key."""
+        combined = {}
+        num_values = 0
+        num_shuffled = 0
+        for item in items:
+            for key, value in cls._iter_map_output(item):
+                num_values += 1
+                combined[key] = cls.combine_in_mapper(
+                    key, combined.get(key), value)
+                if len(combined) >= cls.MAP_COMBINER_MAX_KEYS:
+                    pairs = cls._emit_combined(combined)
+                    num_shuffled += len(pairs)
+                    for pair in pairs:
+                        yield pair
+        pairs = cls._emit_combined(combined)
+        num_shuffled += len(pairs)
+        for pair in pairs:
+            yield pair
+        yield operation.counters.Increment(COUNTER_MAP_VALUES, num_values)
+        yield operation.counters.Increment(
+            COUNTER_MAP_VALUES_SHUFFLED, num_shuffled)
+
+    @classmethod
+    def _combine_with_codec(cls, key, values, previously_combined_values):
+        """Runs combine() on decoded values; encodes what it emits."""
+        codec = cls.RECORD_CODEC
+        if previously_combined_values is not None:
+            previously_combined_values = [
+                codec.decode(value) for value in previously_combined_values]
+        for value in cls.combine(
+            key, [codec.decode(value) for value in values],
+            previously_combined_values):
+            yield codec.encode(value)
+
+    @classmethod
+    def _reduce_with_codec(cls, key, values):
+        """Runs reduce() on decoded values; encodes what it emits."""
+        codec = cls.RECORD_CODEC
+        for result in cls.reduce(
+            key, [codec.decode(value) for value in values]):
+            if isinstance(result, operation.Operation):
+                yield result
+            else:
+                yield codec.encode(result)
+
     def build_additional_mapper_params(self, unused_app_context):
         """Build a dict of additional parameters to make available to mappers.
 
@@ -414,6 +897,18 @@ class MapReduceJob(DurableJobBase):
 
         self.mapper_params = self.build_additional_mapper_params(
             self._app_context)
+        # Queries outside of entity groups are not allowed in the submit
+        # transaction, so the plan is made before it starts.
+        self._partitions = self.entity_partitions()
+        partition_property = None
+        if self._partitions is not None:
+            self._partitions = sorted(set(self._partitions))
+            partition_property = self.entity_class().PARTITION_PROPERTY
+        self._shard_plan = shard_planner.plan(
+            self.entity_class(), self._namespace,
+            self.TARGET_ENTITIES_PER_SHARD,
+            partition_property=partition_property,
+            partitions=self._partitions)
         return True
 
     def non_transactional_submit(self):
@@ -432,25 +927,58 @@ class MapReduceJob(DurableJobBase):
             'namespace': self._namespace,
             })
 
+        shard_plan = self._shard_plan
+
+        input_reader_class = input_readers.DatastoreInputReader
+        if self.RECORD_CODEC:
+            map_name = '_map_with_codec'
+            combine_name = '_combine_with_codec'
+            reduce_name = '_reduce_with_codec'
+            codec_name = self.RECORD_CODEC.NAME
+        else:
+            map_name = 'map'
+            combine_name = 'combine'
+            reduce_name = 'reduce'
+            codec_name = None
+        if self.MAP_BATCH_SIZE:
+            map_name = '_map_batch'
+            input_reader_class = BatchingDatastoreInputReader
+            self.mapper_params.update({
+                BatchingDatastoreInputReader.BATCH_SIZE_PARAM:
+                    self.MAP_BATCH_SIZE})
+        if self._partitions is not None:
+            if self.MAP_BATCH_SIZE:
+                input_reader_class = BatchingPartitionedDatastoreInputReader
+            else:
+                input_reader_class = PartitionedDatastoreInputReader
+            self.mapper_params.update({
+                PartitionedDatastoreInputReader.PARTITIONS_PARAM:
+                    self._partitions,
+                PartitionedDatastoreInputReader.PARTITION_PROPERTY_PARAM:
+                    entity_class_type.PARTITION_PROPERTY})
         kwargs = {
             'job_name': self._job_name,
-            'mapper_spec': '%s.%s.map' % (
-                self.__class__.__module__, self.__class__.__name__),
-            'reducer_spec': '%s.%s.reduce' % (
-                self.__class__.__module__, self.__class__.__name__),
-            'input_reader_spec':
-                'mapreduce.input_readers.DatastoreInputReader',
+            'mapper_spec': '%s.%s.%s' % (
+                self.__class__.__module__, self.__class__.__name__, map_name),
+            'reducer_spec': '%s.%s.%s' % (
+                self.__class__.__module__, self.__class__.__name__,
+                reduce_name),
+            'input_reader_spec': '%s.%s' % (
+                input_reader_class.__module__, input_reader_class.__name__),
             'output_writer_spec':
                 'mapreduce.output_writers.BlobstoreRecordsOutputWriter',
             'mapper_params': self.mapper_params,
             'reducer_params': self.mapper_params,
+            'shards': shard_plan.shard_count,
         }
         if (getattr(self.__class__, 'combine') !=
             getattr(MapReduceJob, 'combine')):
-            kwargs['combiner_spec'] = '%s.%s.combine' % (
-                self.__class__.__module__, self.__class__.__name__)
+            kwargs['combiner_spec'] = '%s.%s.%s' % (
+                self.__class__.__module__, self.__class__.__name__,
+                combine_name)
         mr_pipeline = MapReduceJobPipeline(self._job_name, sequence_num,
-                                           kwargs, self._namespace)
+                                           kwargs, self._namespace,
+                                           codec_name, shard_plan.to_dict())
         mr_pipeline.start(base_path='/mapreduce/worker/pipeline')
         return sequence_num
 
@@ -521,6 +1049,35 @@ class AbstractCountingMapReduceJob(MapReduceJob):
         yield (key, total)
 
 
+class DurableJobResultsShard(entities.BaseEntity):
+    """A slice of the results of one run of a MapReduceJob, stored as JSON."""
+
+    job_name = db.StringProperty(indexed=True)
+    data = db.TextProperty(indexed=False)
+
+    @classmethod
+    def key_name(cls, job_name, sequence_num, index):
+        return '%s:%d:%d' % (job_name, sequence_num, index)
+
+    @classmethod
+    def get_key(cls, job, index):
+        """Returns the key of a results shard of the last run of a job."""
+        return db.Key.from_path(
+            cls.kind(), cls.key_name(job.key().name(), job.sequence_num, index),
+            namespace=job.key().namespace())
+
+    @classmethod
+    def delete_stale(cls, job_name, sequence_num):
+        """Deletes the results shards of all other runs of a job."""
+        current_prefix = '%s:%d:' % (job_name, sequence_num)
+        stale_keys = []
+        for key in cls.all(keys_only=True).filter('job_name =', job_name):
+            if not key.name().startswith(current_prefix):
+                stale_keys.append(key)
+        for start in xrange(0, len(stale_keys), 100):
+            db.delete(stale_keys[start:start + 100])
+
+
 class DurableJobEntity(entities.BaseEntity):
     """A class that represents a persistent database entity of durable job."""
 
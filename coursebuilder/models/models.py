@@ -18,9 +18,12 @@ __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 import collections
 import copy
+import hashlib
 import logging
 import os
+import random
 import sys
+import threading
 import time
 
 from config import ConfigProperty
@@ -88,6 +91,24 @@ CACHE_HIT_LOCAL = PerfCounter(
 CACHE_MISS_LOCAL = PerfCounter(
     'gcb-models-cache-miss-local',
     'A number of times an object was not found in local memcache.')
+LABEL_INDEX_CACHE_HIT = PerfCounter(
+    'gcb-models-label-index-cache-hit',
+    'Number of times the labels of a course were served from the in-process '
+    'cache.')
+LABEL_INDEX_CACHE_MISS = PerfCounter(
+    'gcb-models-label-index-cache-miss',
+    'Number of times the labels of a course were loaded from the datastore.')
+
+# Memcache key of the stamp identifying the current version of the labels of a
+# course; it is incremented on every write to a label.
+LABELS_VERSION_KEY = 'labels_version'
+
+# Maximum number of courses whose labels are cached by each process.
+MAX_CACHED_LABEL_INDEXES = 64
+
+# Memcache key of the stamp identifying the current version of the content
+# chunks of a course; it is incremented on every write to a chunk.
+CONTENT_CHUNKS_VERSION_KEY = 'content_chunks_version'
 
 # Intent for sending welcome notifications.
 WELCOME_NOTIFICATION_INTENT = 'welcome'
@@ -197,15 +218,15 @@ class MemcacheManager(object):
     def _local_cache_get_multi(cls, keys, namespace):
         if cls._IS_READONLY:
             assert cls._is_same_app_context_if_set()
-            values = []
+            values = {}
             for key in keys:
                 is_cached, value = cls._local_cache_get(key, namespace)
                 if not is_cached:
-                    return False, []
-                else:
-                    values.append(value)
+                    return False, {}
+                elif value is not None:
+                    values[key] = value
             return True, values
-        return False, []
+        return False, {}
 
     @classmethod
     def _local_cache_put_multi(cls, values, namespace):
@@ -280,6 +301,7 @@ class MemcacheManager(object):
         """Sets an item in memcache if memcache is enabled."""
         # Ensure subsequent mods to value do not affect the cached copy.
         value = copy.deepcopy(value)
+        RequestPrefetch.forget([key], cls._get_namespace(namespace))
 
         try:
             if CAN_USE_MEMCACHE.value:
@@ -299,6 +321,7 @@ class MemcacheManager(object):
     @classmethod
     def set_multi(cls, mapping, ttl=DEFAULT_CACHE_TTL_SECS, namespace=None):
         """Sets a dict of items in memcache if memcache is enabled."""
+        RequestPrefetch.forget(mapping.keys(), cls._get_namespace(namespace))
         try:
             if CAN_USE_MEMCACHE.value:
                 if not mapping:
@@ -323,6 +346,7 @@ class MemcacheManager(object):
     def delete(cls, key, namespace=None):
         """Deletes an item from memcache if memcache is enabled."""
         assert not cls._IS_READONLY
+        RequestPrefetch.forget([key], cls._get_namespace(namespace))
         if CAN_USE_MEMCACHE.value:
             CACHE_DELETE.inc()
             memcache.delete(key, namespace=cls._get_namespace(namespace))
@@ -331,18 +355,141 @@ class MemcacheManager(object):
     def delete_multi(cls, key_list, namespace=None):
         """Deletes a list of items from memcache if memcache is enabled."""
         assert not cls._IS_READONLY
+        RequestPrefetch.forget(key_list, cls._get_namespace(namespace))
         if CAN_USE_MEMCACHE.value:
             CACHE_DELETE.inc(increment=len(key_list))
             memcache.delete_multi(
                 key_list, namespace=cls._get_namespace(namespace))
 
     @classmethod
-    def incr(cls, key, delta, namespace=None):
-        """Incr an item in memcache if memcache is enabled."""
+    def incr(cls, key, delta, namespace=None, initial_value=0):
+        """Incr an item in memcache if memcache is enabled.
+
+        Returns:
+            The new value, or None if memcache is disabled, the increment
+            failed or the item was missing and initial_value is None.
+        """
         if CAN_USE_MEMCACHE.value:
-            memcache.incr(
+            return memcache.incr(
                 key, delta,
-                namespace=cls._get_namespace(namespace), initial_value=0)
+                namespace=cls._get_namespace(namespace),
+                initial_value=initial_value)
+        return None
+
+    @classmethod
+    def get_version_stamp(cls, key, namespace=None):
+        """Returns the version stamp kept under a key, creating it if missing.
+
+        Caches of data that can change in any process key their entries by a
+        stamp, which is bumped by bump_version_stamp() on every change.
+
+        Returns:
+            An int, or None if memcache is disabled.
+        """
+        if not CAN_USE_MEMCACHE.value:
+            return None
+        version = cls.get(key, namespace=namespace)
+        if version is None:
+            # Start from a random stamp, so one evicted from memcache is not
+            # reused for different data.
+            version = random.getrandbits(48)
+            cls.set(key, version, namespace=namespace)
+        return version
+
+    @classmethod
+    def bump_version_stamp(cls, key, namespace=None):
+        """Increments a version stamp; returns it, or None if it is unknown."""
+        return cls.incr(key, 1, namespace=namespace, initial_value=None)
+
+    @classmethod
+    def incr_multi(cls, mapping, namespace=None, initial_value=0):
+        """Incr a dict of items in memcache if memcache is enabled.
+
+        Returns:
+            A dict of the new values; those which could not be incremented are
+            None. Empty if memcache is disabled.
+        """
+        if CAN_USE_MEMCACHE.value and mapping:
+            return memcache.offset_multi(
+                mapping, namespace=cls._get_namespace(namespace),
+                initial_value=initial_value)
+        return {}
+
+
+class RequestPrefetch(caching.RequestScopedSingleton):
+    """Entities fetched in one batch for the current request.
+
+    Handlers declare the entities they are about to read, as pairs of their
+    memcache key and datastore key, and fetch them all at once: one
+    MemcacheManager.get_multi() and one db.get() of those not in memcache.
+    Later lookups of these memcache keys in the same request, by
+    Student.get_enrolled_student_by_email(), StudentPropertyEntity.get() and
+    BaseJsonDao.load(), are then answered from here. An entity set in or
+    deleted from memcache is dropped, so it is read anew afterwards.
+    """
+
+    def __init__(self):
+        # Entity, or None if there is none, by (namespace, memcache key).
+        self._entities = {}
+
+    @classmethod
+    def _get_if_exists(cls):
+        return cls._instances().get(cls)
+
+    @classmethod
+    def fetch(cls, keys):
+        """Fetches entities of the current namespace in one batch.
+
+        Args:
+            keys: a list of (memcache_key, db.Key) pairs of the entities.
+        """
+        namespace = MemcacheManager.get_namespace()
+        entities = cls.instance()._entities  # pylint: disable=protected-access
+        keys = [
+            (memcache_key, db_key) for memcache_key, db_key in keys
+            if (namespace, memcache_key) not in entities]
+        if not keys:
+            return
+
+        found = MemcacheManager.get_multi(
+            [memcache_key for memcache_key, _ in keys])
+        missing = [
+            (memcache_key, db_key) for memcache_key, db_key in keys
+            if memcache_key not in found]
+        if missing:
+            memcache_update = {}
+            for (memcache_key, _), entity in zip(
+                    missing, db.get([db_key for _, db_key in missing])):
+                found[memcache_key] = entity
+                memcache_update[memcache_key] = (
+                    NO_OBJECT if entity is None else entity)
+            MemcacheManager.set_multi(memcache_update)
+
+        for memcache_key, _ in keys:
+            entity = found[memcache_key]
+            if NO_OBJECT == entity:
+                entity = None
+            entities[(namespace, memcache_key)] = entity
+
+    @classmethod
+    def get(cls, memcache_key):
+        """Returns (is_prefetched, entity) for a memcache key."""
+        prefetch = cls._get_if_exists()
+        if prefetch is None:
+            return False, None
+        key = (MemcacheManager.get_namespace(), memcache_key)
+        # pylint: disable=protected-access
+        if key not in prefetch._entities:
+            return False, None
+        return True, copy.deepcopy(prefetch._entities[key])
+
+    @classmethod
+    def forget(cls, memcache_keys, namespace):
+        prefetch = cls._get_if_exists()
+        if prefetch is not None:
+            for memcache_key in memcache_keys:
+                # pylint: disable=protected-access
+                prefetch._entities.pop((namespace, memcache_key), None)
 
 
 CAN_AGGREGATE_COUNTERS = ConfigProperty(
@@ -352,27 +499,81 @@ CAN_AGGREGATE_COUNTERS = ConfigProperty(
     'application instances. Without recording, you only see counter values '
     'for one frontend instance you are connected to right now. Enabling '
     'aggregation improves quality of performance metrics, but adds a small '
-    'amount of latency to all your requests.',
+    'amount of latency to all your requests. Increments are buffered and '
+    'sent once at the end of each request.',
     default_value=False)
 
 
+# Each aggregated counter is spread over this many memcache keys, so that
+# instances flushing at the same time do not all update the same key.
+COUNTER_GLOBAL_SHARDS = 8
+# Increments buffered for longer than this are flushed by the next increment,
+# even if the request has not ended yet; this bounds staleness of global values
+# for long-running requests and tasks.
+COUNTER_FLUSH_INTERVAL_SEC = 10
+
+# Increments not yet sent to memcache, by counter name, for the current thread.
+_counter_deltas = threading.local()
+
+
+def _counter_global_key(name, shard):
+    return 'counter:%s:%s' % (name, shard)
+
+
 def incr_counter_global_value(name, delta):
     if CAN_AGGREGATE_COUNTERS.value:
-        MemcacheManager.incr(
-            'counter:' + name, delta,
-            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+        deltas = getattr(_counter_deltas, 'deltas', None)
+        if deltas is None:
+            deltas = {}
+            _counter_deltas.deltas = deltas
+            _counter_deltas.since = time.time()
+        deltas[name] = deltas.get(name, 0) + delta
+        if time.time() - _counter_deltas.since > COUNTER_FLUSH_INTERVAL_SEC:
+            flush_counter_global_values()
+
+
+def flush_counter_global_values():
+    """Sends increments buffered by this thread to memcache in one batch."""
+    deltas = getattr(_counter_deltas, 'deltas', None)
+    _counter_deltas.deltas = None
+    if not deltas:
+        return
+    shard = random.randrange(COUNTER_GLOBAL_SHARDS)
+    mapping = dict(
+        (_counter_global_key(name, shard), delta)
+        for name, delta in deltas.iteritems() if delta)
+    try:
+        MemcacheManager.incr_multi(
+            mapping, namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+    except Exception:  # pylint: disable=broad-except
+        logging.exception('Failed to flush %s counters.', len(mapping))
+
+
+def get_counter_global_values(names):
+    """Sums the shards of each of the given counters."""
+    if not CAN_AGGREGATE_COUNTERS.value:
+        return {}
+    keys = [
+        _counter_global_key(name, shard)
+        for name in names for shard in xrange(COUNTER_GLOBAL_SHARDS)]
+    found = MemcacheManager.get_multi(
+        keys, namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
+    values = {}
+    for name in names:
+        for shard in xrange(COUNTER_GLOBAL_SHARDS):
+            value = found.get(_counter_global_key(name, shard))
+            if value is not None:
+                values[name] = values.get(name, 0) + value
+    return values
 
 
 def get_counter_global_value(name):
-    if CAN_AGGREGATE_COUNTERS.value:
-        return MemcacheManager.get(
-            'counter:' + name,
-            namespace=appengine_config.DEFAULT_NAMESPACE_NAME)
-    else:
-        return None
+    return get_counter_global_values([name]).get(name)
 
 counters.get_counter_global_value = get_counter_global_value
+counters.get_counter_global_values = get_counter_global_values
 counters.incr_counter_global_value = incr_counter_global_value
+counters.flush_counter_global_values = flush_counter_global_values
 
 
 # Whether to record tag events in a database.
@@ -425,18 +626,23 @@ class ContentChunkDAO(object):
 
     @classmethod
     def delete(cls, entity_id):
-        """Deletes ContentChunkEntity for datastore id int; returns None."""
+        """Deletes ContentChunkEntity for datastore id; returns None."""
         memcache_key = cls._get_memcache_key(entity_id)
-        entity = ContentChunkEntity.get_by_id(entity_id)
+        entity = cls._get_entity(entity_id)
 
         if entity:
             db.delete(entity)
+            cls._on_uid_changed(entity.uid)
 
         MemcacheManager.delete(memcache_key)
 
     @classmethod
     def get(cls, entity_id):
-        """Gets ContentChunkEntityDTO or None from given datastore id int."""
+        """Gets ContentChunkEntityDTO or None from given datastore id.
+
+        The id is an int, or the string key name of a chunk saved with
+        save_by_uid().
+        """
         if entity_id is None:
             return
 
@@ -451,7 +657,7 @@ class ContentChunkDAO(object):
             result = None
             cache_value = NO_OBJECT
 
-            entity = ContentChunkEntity.get_by_id(entity_id)
+            entity = cls._get_entity(entity_id)
             if entity:
                 result = cls._make_dto(entity)
                 cache_value = result
@@ -469,6 +675,37 @@ class ContentChunkDAO(object):
             [cls._make_dto(result) for result in results],
             key=lambda dto: dto.id)
 
+    @classmethod
+    def get_one_by_uid(cls, uid):
+        """Gets the DTO or None of the chunk saved with save_by_uid().
+
+        Chunks saved before chunks were keyed by their uid are found with
+        get_by_uid(); the first one saved is returned, as it was by the
+        callers of get_by_uid().
+
+        Args:
+            uid: string. The uid of the chunk; see make_uid().
+
+        Returns:
+            ContentChunkDTO or None.
+        """
+        memcache_key = cls._get_uid_memcache_key(uid)
+        found = MemcacheManager.get(memcache_key)
+        if found == NO_OBJECT:
+            return None
+        elif found:
+            return found
+
+        entity = ContentChunkEntity.get_by_key_name(cls._get_key_name(uid))
+        if entity:
+            result = cls._make_dto(entity)
+        else:
+            matches = cls.get_by_uid(uid)
+            result = matches[0] if matches else None
+        MemcacheManager.set(
+            memcache_key, result if result is not None else NO_OBJECT)
+        return result
+
     @classmethod
     def make_uid(cls, type_id, resource_id):
         """Makes a uid string (or None) from the given strings (or Nones)."""
@@ -498,35 +735,121 @@ class ContentChunkDAO(object):
         Returns:
             db.Key of saved ContentChunkEntity.
         """
-        if dto.id is None:
-            entity = ContentChunkEntity(content_type=dto.content_type)
-        else:
-            entity = ContentChunkEntity.get_by_id(dto.id)
+        entity = None
+        if dto.id is not None:
+            entity = cls._get_entity(dto.id)
+        if entity is None:
+            key_name = dto.id if isinstance(dto.id, basestring) else None
+            entity = ContentChunkEntity(
+                content_type=dto.content_type, key_name=key_name)
+
+        old_uid = entity.uid
+        cls._put(entity, dto)
+        cls._on_saved(entity)
+        if old_uid != entity.uid:
+            cls._on_uid_changed(old_uid)
+
+        return entity.key()
+
+    @classmethod
+    def save_by_uid(cls, dto):
+        """Saves a DTO as the only chunk of its uid; returns the db.Key.
+
+        The chunk is stored under a key derived from the uid, so concurrent
+        saves of a uid update one entity instead of each creating their own.
+        The id of the DTO is ignored. Chunks of the uid saved with save()
+        are deleted when the keyed chunk is created.
+
+        Args:
+            dto: ContentChunkDTO with type_id and resource_id set.
+                last_modified will be ignored.
+
+        Returns:
+            db.Key of saved ContentChunkEntity.
+        """
+        uid = cls.make_uid(dto.type_id, dto.resource_id)
+        assert uid
+        key_name = cls._get_key_name(uid)
+
+        def save():
+            entity = ContentChunkEntity.get_by_key_name(key_name)
+            created = entity is None
+            if created:
+                entity = ContentChunkEntity(
+                    content_type=dto.content_type, key_name=key_name)
+            cls._put(entity, dto)
+            return entity, created
+
+        entity, created = db.run_in_transaction(save)
+        if created:
+            legacy_keys = [
+                key for key in ContentChunkEntity.all(keys_only=True).filter(
+                    ContentChunkEntity.uid.name, uid).fetch(1000)
+                if key.name() != key_name]
+            db.delete(legacy_keys)
+            MemcacheManager.delete_multi([
+                cls._get_memcache_key(key.id()) for key in legacy_keys])
+        cls._on_saved(entity)
+        return entity.key()
+
+    @classmethod
+    def get_version(cls):
+        """Returns the version stamp of the chunks, or None without memcache.
 
-            if entity is None:
-                entity = ContentChunkEntity(content_type=dto.content_type)
+        Caches of anything derived from the chunks of a course, e.g. their
+        rendered HTML, can be keyed by it.
+        """
+        return MemcacheManager.get_version_stamp(CONTENT_CHUNKS_VERSION_KEY)
 
+    @classmethod
+    def _put(cls, entity, dto):
         entity.contents = dto.contents
         entity.supports_custom_tags = dto.supports_custom_tags
         entity.uid = cls.make_uid(dto.type_id, dto.resource_id)
         entity.put()
+
+    @classmethod
+    def _on_saved(cls, entity):
         MemcacheManager.set(
-            cls._get_memcache_key(entity.key().id()), cls._make_dto(entity))
+            cls._get_memcache_key(entity.key().id_or_name()),
+            cls._make_dto(entity))
+        cls._on_uid_changed(entity.uid)
 
-        return entity.key()
+    @classmethod
+    def _on_uid_changed(cls, uid):
+        if uid is not None:
+            MemcacheManager.delete(cls._get_uid_memcache_key(uid))
+        MemcacheManager.bump_version_stamp(CONTENT_CHUNKS_VERSION_KEY)
+
+    @classmethod
+    def _get_entity(cls, entity_id):
+        return ContentChunkEntity.get(
+            db.Key.from_path(ContentChunkEntity.kind(), entity_id))
+
+    @classmethod
+    def _get_key_name(cls, uid):
+        # Uids may be longer than key names are allowed to be.
+        if isinstance(uid, unicode):
+            uid = uid.encode('utf-8')
+        return 'uid:%s' % hashlib.sha1(uid).hexdigest()
 
     @classmethod
     def _get_memcache_key(cls, entity_id):
         assert entity_id is not None
         return '(%s:%s)' % (ContentChunkEntity.kind(), entity_id)
 
+    @classmethod
+    def _get_uid_memcache_key(cls, uid):
+        return '(%s:by_uid:%s)' % (
+            ContentChunkEntity.kind(), cls._get_key_name(uid))
+
     @classmethod
     def _make_dto(cls, entity):
         type_id, resource_id = cls._split_uid(entity.uid)
         return ContentChunkDTO({
             'content_type': entity.content_type,
             'contents': entity.contents,
-            'id': entity.key().id(),
+            'id': entity.key().id_or_name(),
             'last_modified': entity.last_modified,
             'resource_id': resource_id,
             'supports_custom_tags': entity.supports_custom_tags,
@@ -1029,9 +1352,18 @@ class Student(BaseEntity):
     def get_by_email(cls, email):
         return Student.get_by_key_name(email.encode('utf8'))
 
+    @classmethod
+    def get_prefetch_key(cls, email):
+        """Returns what RequestPrefetch.fetch() needs to fetch a student."""
+        return (cls._memcache_key(email),
+                db.Key.from_path(cls.kind(), email.encode('utf8')))
+
     @classmethod
     def get_enrolled_student_by_email(cls, email):
         """Returns enrolled student or None."""
+        is_prefetched, student = RequestPrefetch.get(cls._memcache_key(email))
+        if is_prefetched:
+            return student if student and student.is_enrolled else None
         student = MemcacheManager.get(cls._memcache_key(email))
         if NO_OBJECT == student:
             return None
@@ -1101,7 +1433,7 @@ class Student(BaseEntity):
     def get_labels_of_type(self, label_type):
         if not self.labels:
             return set()
-        label_ids = LabelDAO.get_set_of_ids_of_type(label_type)
+        label_ids = LabelManager.get_index().get_ids_of_type(label_type)
         return set([int(label) for label in
                     common_utils.text_to_list(self.labels)
                     if int(label) in label_ids])
@@ -1126,10 +1458,18 @@ class EventEntity(BaseEntity):
     recorded. Each event has a 'user_id' to represent an actor who triggered
     the event. The event 'data' is a JSON object, the format of which is defined
     elsewhere and depends on the type of the event.
+
+    Events are partitioned by source: 'partition' is an indexed copy of
+    'source', so jobs wanting only a few sources can query for them rather
+    than read every event.  Events recorded before it existed have no
+    partition until models.event_partitions.EventPartitionsBackfill has run.
     """
+    PARTITION_PROPERTY = 'partition'
+
     recorded_on = db.DateTimeProperty(auto_now_add=True, indexed=True)
     source = db.StringProperty(indexed=False)
     user_id = db.StringProperty(indexed=False)
+    partition = db.StringProperty(indexed=True)
 
     # Each of the following is a string representation of a JSON dict.
     data = db.TextProperty(indexed=False)
@@ -1144,6 +1484,11 @@ class EventEntity(BaseEntity):
         event.data = data
         event.put()
 
+    def put(self):
+        """Do the normal put(), keeping the partition in step with source."""
+        self.partition = self.source
+        return super(EventEntity, self).put()
+
     def for_export(self, transform_fn):
         model = super(EventEntity, self).for_export(transform_fn)
         model.user_id = transform_fn(self.user_id)
@@ -1181,6 +1526,12 @@ class StudentPropertyEntity(BaseEntity):
     def create_key(cls, student_id, property_name):
         return '%s-%s' % (student_id, property_name)
 
+    @classmethod
+    def get_prefetch_key(cls, student_id, property_name):
+        """Returns what RequestPrefetch.fetch() needs to fetch a property."""
+        key = cls.create_key(student_id, property_name)
+        return cls._memcache_key(key), db.Key.from_path(cls.kind(), key)
+
     @classmethod
     def create(cls, student, property_name):
         return cls(
@@ -1208,6 +1559,9 @@ class StudentPropertyEntity(BaseEntity):
     def get(cls, student, property_name):
         """Loads student property."""
         key = cls.create_key(student.user_id, property_name)
+        is_prefetched, value = RequestPrefetch.get(cls._memcache_key(key))
+        if is_prefetched:
+            return value
         value = MemcacheManager.get(cls._memcache_key(key))
         if NO_OBJECT == value:
             return None
@@ -1337,6 +1691,9 @@ class BaseJsonDao(object):
         if not obj_id:
             return None
         memcache_key = cls._memcache_key(obj_id)
+        is_prefetched, entity = RequestPrefetch.get(memcache_key)
+        if is_prefetched:
+            return entity
         entity = MemcacheManager.get(memcache_key)
         if NO_OBJECT == entity:
             return None
@@ -1348,6 +1705,14 @@ class BaseJsonDao(object):
                 MemcacheManager.set(memcache_key, NO_OBJECT)
         return entity
 
+    @classmethod
+    def get_prefetch_key(cls, obj_id):
+        """Returns what RequestPrefetch.fetch() needs to fetch an entity."""
+        if cls.ENTITY_KEY_TYPE is BaseJsonDao.EntityKeyTypeId:
+            obj_id = int(obj_id)
+        return (cls._memcache_key(obj_id),
+                db.Key.from_path(cls.ENTITY.kind(), obj_id))
+
     @classmethod
     def load(cls, obj_id):
         entity = cls._load_entity(obj_id)
@@ -1858,7 +2223,6 @@ class LabelEntity(BaseEntity):
     """A class representing labels that can be applied to Student, Unit, etc."""
     data = db.TextProperty(indexed=False)
 
-    MEMCACHE_KEY = 'labels'
     _PROPERTY_EXPORT_BLACKLIST = []  # No PII in labels.
 
     def put(self):
@@ -1872,7 +2236,7 @@ class LabelEntity(BaseEntity):
         """
 
         result = super(LabelEntity, self).put()
-        MemcacheManager.delete(self.MEMCACHE_KEY)
+        LabelManager.on_labels_changed()
         return result
 
     def delete(self):
@@ -1883,7 +2247,7 @@ class LabelEntity(BaseEntity):
         """
 
         super(LabelEntity, self).delete()
-        MemcacheManager.delete(self.MEMCACHE_KEY)
+        LabelManager.on_labels_changed()
 
 
 class LabelDTO(object):
@@ -1925,26 +2289,169 @@ class LabelDTO(object):
         return self.dict.get('type', self.LABEL_TYPE_GENERAL)
 
 
+class _LabelIndex(object):
+    """All labels of a course, compiled for filtering items by their labels.
+
+    Each label is given one bit of an int. The 'labels' text of an item is
+    parsed once into the mask of the bits of its labels, so testing an item
+    against a set of labels is a single bitwise and.
+
+    Instances may be shared by all requests of a process, so they are never
+    modified once built; only the memo of parsed label texts grows.
+    """
+
+    # Most distinct label texts whose masks are remembered.
+    MAX_PARSED_LABEL_TEXTS = 10000
+
+    def __init__(self, labels):
+        order = {lt.type: lt.menu_order for lt in LabelDTO.LABEL_TYPES}
+        # list of LabelDTO, in the order of LabelDAO.get_all()
+        self.labels = sorted(labels, key=lambda l: (order[l.type], l.title))
+        # dict mapping int label id to its bit
+        self._bits = {}
+        # dict mapping label type to the mask of all labels of the type
+        self._type_masks = {}
+        # dict mapping label type to frozenset of ids of labels of the type
+        self._ids_by_type = {}
+        # dict mapping locale to the mask of its locale labels
+        self._locale_masks = {}
+        ids_by_type = {}
+        for index, label in enumerate(self.labels):
+            bit = 1 << index
+            self._bits[int(label.id)] = bit
+            self._type_masks[label.type] = (
+                self._type_masks.get(label.type, 0) | bit)
+            ids_by_type.setdefault(label.type, set()).add(label.id)
+            if label.type == LabelDTO.LABEL_TYPE_LOCALE:
+                self._locale_masks[label.title] = (
+                    self._locale_masks.get(label.title, 0) | bit)
+        for label_type, ids in ids_by_type.iteritems():
+            self._ids_by_type[label_type] = frozenset(ids)
+        # dict mapping 'labels' text to its mask
+        self._masks = {}
+
+    def get_ids_of_type(self, label_type):
+        return self._ids_by_type.get(label_type, frozenset())
+
+    def get_type_mask(self, label_type):
+        return self._type_masks.get(label_type, 0)
+
+    def get_locale_mask(self, locale):
+        return self._locale_masks.get(locale, 0)
+
+    def get_mask(self, labels_text):
+        """Returns the mask of the labels listed in a 'labels' text.
+
+        Ids of labels which do not exist are ignored.
+        """
+        mask = self._masks.get(labels_text)
+        if mask is None:
+            mask = 0
+            for label_id in common_utils.text_to_list(labels_text):
+                mask |= self._bits.get(int(label_id), 0)
+            if len(self._masks) >= self.MAX_PARSED_LABEL_TEXTS:
+                self._masks = {}
+            self._masks[labels_text] = mask
+        return mask
+
+    def filter(self, items, constraints):
+        """Returns the items whose labels meet all constraints, in order.
+
+        Args:
+          items: iterable of objects, each having a 'labels' attribute.
+          constraints: list of (type_mask, allowed_mask) pairs. An item meets
+            a constraint if it has no label in type_mask, or has a label in
+            allowed_mask.
+        Returns:
+          A new list of the items meeting all constraints.
+        """
+        if not constraints:
+            return list(items)
+        get_mask = self.get_mask
+        ret = []
+        for item in items:
+            mask = get_mask(item.labels)
+            for type_mask, allowed_mask in constraints:
+                if mask & type_mask and not mask & allowed_mask:
+                    break
+            else:
+                ret.append(item)
+        return ret
+
+
+class ProcessScopedLabelIndexCache(caching.ProcessScopedSingleton):
+    """This class holds in-process global cache of compiled labels.
+
+    Entries are keyed by namespace and remember the version stamp they were
+    built for; they are only served while that stamp is current.
+    """
+
+    def __init__(self):
+        self._cache = caching.LRUCache(
+            max_item_count=MAX_CACHED_LABEL_INDEXES)
+
+    def get(self, namespace, version):
+        found, entry = self._cache.get(namespace)
+        if found and entry[0] == version:
+            return entry[1]
+        return None
+
+    def put(self, namespace, version, index):
+        self._cache.put(namespace, (version, index))
+
+
 class LabelManager(caching.RequestScopedSingleton):
-    """Class that manages optimized loading of I18N data from datastore."""
+    """Class that manages optimized loading of labels from datastore."""
 
     def __init__(self):
-        self._key_to_label = None
+        self._index = None
+
+    def _load(self):
+        if not CAN_USE_MEMCACHE.value:
+            return _LabelIndex(LabelDAO.get_all_iter())
+
+        # The stamp must be read before the labels, so the labels are at
+        # least as recent as the stamp they are cached under.
+        namespace = namespace_manager.get_namespace()
+        version = MemcacheManager.get_version_stamp(LABELS_VERSION_KEY)
+        index = ProcessScopedLabelIndexCache.instance().get(namespace, version)
+        if index:
+            LABEL_INDEX_CACHE_HIT.inc()
+        else:
+            LABEL_INDEX_CACHE_MISS.inc()
+            index = _LabelIndex(LabelDAO.get_all_iter())
+            ProcessScopedLabelIndexCache.instance().put(
+                namespace, version, index)
+        return index
 
-    def _preload(self):
-        self._key_to_label = {}
-        for row in LabelDAO.get_all_iter():
-            self._key_to_label[row.id] = row
+    def _get_index(self):
+        if self._index is None:
+            self._index = self._load()
+        return self._index
 
-    def _get_all(self):
-        if self._key_to_label is None:
-            self._preload()
-        return self._key_to_label.values()
+    @classmethod
+    def get_index(cls):
+        """Returns the _LabelIndex of the labels of the current course."""
+        # pylint: disable=protected-access
+        return cls.instance()._get_index()
 
     @classmethod
     def get_all(cls):
-        # pylint: disable=protected-access
-        return cls.instance()._get_all()
+        return list(cls.get_index().labels)
+
+    @classmethod
+    def get_version(cls):
+        """Returns the version stamp of the labels, or None without memcache.
+
+        Caches of anything derived from the labels can be keyed by it.
+        """
+        return MemcacheManager.get_version_stamp(LABELS_VERSION_KEY)
+
+    @classmethod
+    def on_labels_changed(cls):
+        """Makes all processes, and this request, load the labels again."""
+        MemcacheManager.bump_version_stamp(LABELS_VERSION_KEY)
+        cls.instance().clear()
 
 
 class LabelDAO(BaseJsonDao):
@@ -1954,9 +2461,7 @@ class LabelDAO(BaseJsonDao):
 
     @classmethod
     def get_all(cls):
-        items = LabelManager.get_all()
-        order = {lt.type: lt.menu_order for lt in LabelDTO.LABEL_TYPES}
-        return sorted(items, key=lambda l: (order[l.type], l.title))
+        return LabelManager.get_all()
 
     @classmethod
     def get_all_of_type(cls, label_type):
@@ -1965,42 +2470,66 @@ class LabelDAO(BaseJsonDao):
 
     @classmethod
     def get_set_of_ids_of_type(cls, label_type):
-        return set([label.id for label in cls.get_all_of_type(label_type)])
+        return set(LabelManager.get_index().get_ids_of_type(label_type))
+
+    @classmethod
+    def save_all(cls, dtos):
+        # Bulk puts bypass LabelEntity.put().
+        result = super(LabelDAO, cls).save_all(dtos)
+        LabelManager.on_labels_changed()
+        return result
+
+    @classmethod
+    def _locale_constraint(cls, index, locale):
+        """Items with locale labels must have one for the given locale."""
+        return (index.get_type_mask(LabelDTO.LABEL_TYPE_LOCALE),
+                index.get_locale_mask(locale))
+
+    @classmethod
+    def _student_constraint(cls, index, label_type, student):
+        """Items with labels of a type must share one with the student.
+
+        Returns None when all items are taken: the student is transient or
+        has no labels of the type.
+        """
+        if not student or student.is_transient:
+            return None
+        student_mask = (
+            index.get_mask(student.labels) & index.get_type_mask(label_type))
+        if not student_mask:
+            return None
+        return (index.get_type_mask(label_type), student_mask)
 
     @classmethod
     def _apply_locale_labels_to_locale(cls, locale, items):
         """Filter out items not matching locale labels and current locale."""
-        if locale:
-            id_to_label = {}
-            for label in LabelDAO.get_all_of_type(
-                LabelDTO.LABEL_TYPE_LOCALE):
-                id_to_label[int(label.id)] = label
-            for item in list(items):
-                item_matches = set([int(label_id) for label_id in
-                                    common_utils.text_to_list(item.labels)
-                                    if int(label_id) in id_to_label.keys()])
-                found = False
-                for item_match in item_matches:
-                    label = id_to_label[item_match]
-                    if id_to_label and label and label.title == locale:
-                        found = True
-                if id_to_label and item_matches and not found:
-                    items.remove(item)
-        return items
+        if not locale:
+            return items
+        index = LabelManager.get_index()
+        return index.filter(items, [cls._locale_constraint(index, locale)])
 
     @classmethod
     def apply_course_track_labels_to_student_labels(
         cls, course, student, items):
+        """Filter items by the course track and locale of a student.
+
+        All constraints are applied in a single pass over the items.
+        """
         MemcacheManager.begin_readonly()
         try:
-            items = cls._apply_labels_to_student_labels(
-                LabelDTO.LABEL_TYPE_COURSE_TRACK, student, items)
+            index = LabelManager.get_index()
+            constraints = [cls._student_constraint(
+                index, LabelDTO.LABEL_TYPE_COURSE_TRACK, student)]
             if course.get_course_setting('can_student_change_locale'):
-                return cls._apply_locale_labels_to_locale(
-                    course.app_context.get_current_locale(), items)
+                locale = course.app_context.get_current_locale()
+                if locale:
+                    constraints.append(cls._locale_constraint(index, locale))
             else:
-                return cls._apply_labels_to_student_labels(
-                    LabelDTO.LABEL_TYPE_LOCALE, student, items)
+                constraints.append(cls._student_constraint(
+                    index, LabelDTO.LABEL_TYPE_LOCALE, student))
+            return index.filter(
+                items, [constraint for constraint in constraints
+                        if constraint])
         finally:
             MemcacheManager.end_readonly()
 
@@ -2018,17 +2547,11 @@ class LabelDAO(BaseJsonDao):
         Returns:
           A list of item instances whose labels match those on the student.
         """
-        label_ids = LabelDAO.get_set_of_ids_of_type(label_type)
-        if student and not student.is_transient:
-            student_matches = student.get_labels_of_type(label_type)
-            for item in list(items):
-                item_matches = set([int(label_id) for label_id in
-                                    common_utils.text_to_list(item.labels)
-                                    if int(label_id) in label_ids])
-                if (student_matches and item_matches and
-                    student_matches.isdisjoint(item_matches)):
-                    items.remove(item)
-        return items
+        index = LabelManager.get_index()
+        constraint = cls._student_constraint(index, label_type, student)
+        if not constraint:
+            return items
+        return index.filter(items, [constraint])
 
 
 class StudentPreferencesEntity(BaseEntity):
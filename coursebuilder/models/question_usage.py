@@ -0,0 +1,273 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent index of where questions and question groups are used.
+
+Finding the questions used by a course means parsing the HTML of every unit
+and lesson. The index keeps the result of that parse in the datastore, one
+entity per course.
+
+The index is stamped with the content version of the course it was built
+from. When a course is saved, only units and lessons whose HTML changed are
+parsed again, and the index is moved to the new content version. Whenever
+the stamp of the index does not match the course, e.g. after a failed update,
+the index is rebuilt from scratch on its next use.
+
+Courses saved before content versions were introduced, and courses that
+cannot be edited, have no content version. Their index is stored without a
+stamp, and checked on each use against a hash of the HTML of every page;
+only pages whose HTML changed are parsed again.
+
+Question groups have no such stamp: they are saved on their own, and copied
+without hooks on course import. The membership of groups is cheap to read, so
+it is not persisted; it is read from QuestionGroupDAO whenever the index is
+loaded.
+"""
+
+import hashlib
+import logging
+
+import entities
+import models
+import transforms
+from common import tags
+
+from google.appengine.ext import db
+
+
+class QuestionUsageIndexEntity(entities.BaseEntity):
+    """The question usage index of one course."""
+
+    KEY_NAME = 'question_usage_index'
+
+    # Content version of the course the index was built from.
+    content_version = db.StringProperty(indexed=False)
+    # JSON blob holding the index; see QuestionUsageIndex.to_dict().
+    data = db.TextProperty(indexed=False)
+
+    _PROPERTY_EXPORT_BLACKLIST = []  # No PII in the index.
+
+
+def _unit_page_key(unit_id):
+    return 'unit:%s' % unit_id
+
+
+def _lesson_page_key(lesson_id):
+    return 'lesson:%s' % lesson_id
+
+
+def _hash_html(html):
+    if not html:
+        return ''
+    if isinstance(html, unicode):
+        html = html.encode('utf-8')
+    return hashlib.md5(html).hexdigest()
+
+
+def _iter_page_html(units, lessons):
+    """Yields (page key, unit id, lesson id, html) for all pages."""
+    for unit in units:
+        yield (_unit_page_key(unit.unit_id), unit.unit_id, None,
+               getattr(unit, 'html_content', None))
+    for lesson in lessons:
+        yield (_lesson_page_key(lesson.lesson_id), lesson.unit_id,
+               lesson.lesson_id, lesson.objectives)
+
+
+def _parse_usages(html):
+    """Returns the questions and question groups used in the HTML, in order."""
+    usages = []
+    if not html:
+        return usages
+    for component in tags.get_components_from_html(html):
+        if component['cpt_name'] == 'question':
+            usages.append({
+                'usage_id': component['instanceid'],
+                'type': 'question',
+                'id': component.get('quid'),
+                'weight': float(component.get('weight', 1.0))})
+        elif component['cpt_name'] == 'question-group':
+            usages.append({
+                'usage_id': component['instanceid'],
+                'type': 'question-group',
+                'id': component.get('qgid')})
+    return usages
+
+
+def _get_group_members(group):
+    return [str(quid) for quid in group.question_ids]
+
+
+class QuestionUsageIndex(object):
+    """Where each question and question group of a course is used."""
+
+    def __init__(self, pages=None, groups=None):
+        # dict mapping page key to dict with 'unit', 'lesson', 'hash' of the
+        # page HTML and 'usages', the list of questions and question groups
+        # on the page in order.
+        self._pages = pages or {}
+        # dict mapping str question group id to list of str question ids.
+        self._groups = groups or {}
+
+    def to_dict(self):
+        return {'pages': self._pages}
+
+    @classmethod
+    def from_dict(cls, adict, groups=None):
+        return cls(pages=adict.get('pages'), groups=groups)
+
+    @classmethod
+    def build(cls, units, lessons, groups=None):
+        """Builds the index from scratch by parsing all units and lessons."""
+        index = cls(groups=groups)
+        index.update_pages(units, lessons)
+        return index
+
+    def update_pages(self, units, lessons):
+        """Parses again the units and lessons whose HTML has changed.
+
+        Args:
+            units: list of all units of the course.
+            lessons: list of all lessons of the course.
+
+        Returns:
+            Number of pages parsed, moved or dropped; 0 if the index did not
+            change.
+        """
+        pages = {}
+        changed = 0
+        for key, unit_id, lesson_id, html in _iter_page_html(units, lessons):
+            html_hash = _hash_html(html)
+            page = self._pages.get(key)
+            if page is None or page['hash'] != html_hash:
+                page = {'hash': html_hash, 'usages': _parse_usages(html)}
+                changed += 1
+            elif page['unit'] != unit_id or page['lesson'] != lesson_id:
+                changed += 1
+            page['unit'] = unit_id
+            page['lesson'] = lesson_id
+            pages[key] = page
+        changed += len(set(self._pages) - set(pages))
+        self._pages = pages
+        return changed
+
+    def get_page_usages(self, unit_id, lesson_id=None):
+        """Returns the usages on a unit or a lesson page, in order.
+
+        Each usage is a dict with keys 'usage_id', 'type' ('question' or
+        'question-group'), 'id' and, for questions, 'weight'.
+        """
+        if lesson_id is None:
+            key = _unit_page_key(unit_id)
+        else:
+            key = _lesson_page_key(lesson_id)
+        page = self._pages.get(key)
+        return page['usages'] if page else []
+
+    def get_questions_by_usage_id(self):
+        """Returns map: question-usage-ID to {question ID, unit ID, sequence}.
+
+        See event_transforms.get_questions_by_usage_id() for the format.
+        """
+        questions_by_usage_id = {}
+        for page in self._pages.itervalues():
+            sequence_counter = 0
+            for usage in page['usages']:
+                info = {
+                    'unit': page['unit'],
+                    'lesson': page['lesson'],
+                    'sequence': sequence_counter,
+                    'id': usage['id'],
+                }
+                if usage['type'] == 'question':
+                    info['weight'] = usage['weight']
+                    sequence_counter += 1
+                elif usage['id'] in self._groups:
+                    sequence_counter += len(self._groups[usage['id']])
+                questions_by_usage_id[usage['usage_id']] = info
+        return questions_by_usage_id
+
+    @classmethod
+    def _save(cls, index, content_version):
+        QuestionUsageIndexEntity(
+            key_name=QuestionUsageIndexEntity.KEY_NAME,
+            content_version=content_version,
+            data=transforms.dumps(index.to_dict())).put()
+
+    @classmethod
+    def _load_entity(cls, groups=None):
+        entity = QuestionUsageIndexEntity.get_by_key_name(
+            QuestionUsageIndexEntity.KEY_NAME)
+        if not entity:
+            return None
+        return cls.from_dict(transforms.loads(entity.data), groups), entity
+
+    @classmethod
+    def _load_groups(cls):
+        return dict(
+            (str(group.id), _get_group_members(group))
+            for group in models.QuestionGroupDAO.get_all())
+
+    @classmethod
+    def load(cls, course):
+        """Returns the index of a course, building it if out of date.
+
+        Args:
+            course: courses.Course. Must be current in the namespace.
+
+        Returns:
+            QuestionUsageIndex.
+        """
+        units = course.get_units()
+        lessons = course.get_lessons_for_all_units()
+        content_version = course.content_version
+        groups = cls._load_groups()
+        found = cls._load_entity(groups)
+        if not content_version:
+            # With no stamp to check the index against, check its pages.
+            if found:
+                index, entity = found
+                changed = index.update_pages(units, lessons)
+                if not changed and entity.content_version is None:
+                    return index
+            else:
+                index = cls.build(units, lessons, groups)
+            cls._save(index, None)
+            return index
+
+        if found and found[1].content_version == content_version:
+            return found[0]
+        index = cls.build(units, lessons, groups)
+        cls._save(index, content_version)
+        return index
+
+    @classmethod
+    def on_course_saved(cls, units, lessons, old_version, new_version):
+        """Moves the index of a course to a new version of the content.
+
+        Does nothing if the index was not at the old version; it is then
+        rebuilt on its next use.
+        """
+        def update():
+            found = cls._load_entity()
+            if not found or found[1].content_version != old_version:
+                return
+            index = found[0]
+            index.update_pages(units, lessons)
+            cls._save(index, new_version)
+
+        try:
+            db.run_in_transaction(update)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Failed to update question usage index.')
@@ -0,0 +1,290 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Codecs for values passed between the phases of map/reduce jobs.
+
+The map/reduce framework stores every value emitted by a mapper, combiner or
+reducer as a string. By default this string is "str(value)", which jobs turn
+back into Python objects with ast.literal_eval(). That is slow to parse and
+bloats the shuffle with repr() text.
+
+TypedRecordCodec instead writes a compact binary record: every value is a
+one-byte type tag, followed by a fixed-size number for scalars, or by a
+length and then the payload for strings and containers. Jobs opt into it via
+MapReduceJob.RECORD_CODEC.
+"""
+
+import ast
+import struct
+
+
+class LiteralEvalCodec(object):
+    """The historical encoding: str() on the way in, literal_eval() out."""
+
+    NAME = 'literal_eval'
+
+    @classmethod
+    def encode(cls, value):
+        return str(value)
+
+    @classmethod
+    def decode(cls, data):
+        return ast.literal_eval(data)
+
+
+# Type tags of TypedRecordCodec. Strings and containers have a short form,
+# whose length fits in one byte, and a long form with a four-byte length.
+_TAG_NONE = 'N'
+_TAG_TRUE = '+'
+_TAG_FALSE = '-'
+_TAG_INT8 = 'b'
+_TAG_INT32 = 'i'
+_TAG_INT64 = 'q'
+_TAG_BIG_INT = 'g'
+_TAG_LONG_BIG_INT = 'G'
+_TAG_FLOAT = 'f'
+_TAG_STR = 's'
+_TAG_LONG_STR = 'S'
+_TAG_UNICODE = 'u'
+_TAG_LONG_UNICODE = 'U'
+_TAG_LIST = 'l'
+_TAG_LONG_LIST = 'L'
+_TAG_TUPLE = 't'
+_TAG_LONG_TUPLE = 'T'
+_TAG_DICT = 'd'
+_TAG_LONG_DICT = 'D'
+
+_INT8 = struct.Struct('>b')
+_INT32 = struct.Struct('>i')
+_INT64 = struct.Struct('>q')
+_FLOAT = struct.Struct('>d')
+_LENGTH = struct.Struct('>I')
+
+_SHORT_LENGTHS = [chr(length) for length in xrange(256)]
+
+
+def _append_length(out, short_tag, long_tag, length):
+    if length < 256:
+        out.append(short_tag)
+        out.append(_SHORT_LENGTHS[length])
+    else:
+        out.append(long_tag)
+        out.append(_LENGTH.pack(length))
+
+
+def _encode(value, out):
+    # Exact type checks come first; they cover nearly all values and are
+    # much cheaper than isinstance().
+    value_type = type(value)
+    if value_type is str:
+        _append_length(out, _TAG_STR, _TAG_LONG_STR, len(value))
+        out.append(value)
+    elif value_type is unicode:
+        value = value.encode('utf-8')
+        _append_length(out, _TAG_UNICODE, _TAG_LONG_UNICODE, len(value))
+        out.append(value)
+    elif value_type is int or value_type is long:
+        if -0x80 <= value < 0x80:
+            out.append(_TAG_INT8)
+            out.append(_INT8.pack(value))
+        elif -0x80000000 <= value < 0x80000000:
+            out.append(_TAG_INT32)
+            out.append(_INT32.pack(value))
+        elif -0x8000000000000000 <= value < 0x8000000000000000:
+            out.append(_TAG_INT64)
+            out.append(_INT64.pack(value))
+        else:
+            value = str(value)
+            _append_length(out, _TAG_BIG_INT, _TAG_LONG_BIG_INT, len(value))
+            out.append(value)
+    elif value_type is float:
+        out.append(_TAG_FLOAT)
+        out.append(_FLOAT.pack(value))
+    elif value is None:
+        out.append(_TAG_NONE)
+    elif value is True:
+        out.append(_TAG_TRUE)
+    elif value is False:
+        out.append(_TAG_FALSE)
+    elif value_type is list:
+        _append_length(out, _TAG_LIST, _TAG_LONG_LIST, len(value))
+        for item in value:
+            _encode(item, out)
+    elif value_type is tuple:
+        _append_length(out, _TAG_TUPLE, _TAG_LONG_TUPLE, len(value))
+        for item in value:
+            _encode(item, out)
+    elif value_type is dict:
+        _append_length(out, _TAG_DICT, _TAG_LONG_DICT, len(value))
+        for key, item in value.iteritems():
+            _encode(key, out)
+            _encode(item, out)
+
+    # Subclasses of the supported types, e.g. db.Text, are stored as their
+    # base type.
+    elif isinstance(value, bool):
+        _encode(bool(value), out)
+    elif isinstance(value, (int, long)):
+        _encode(long(value), out)
+    elif isinstance(value, float):
+        _encode(float(value), out)
+    elif isinstance(value, unicode):
+        _encode(unicode(value), out)
+    elif isinstance(value, str):
+        _encode(str(value), out)
+    elif isinstance(value, tuple):
+        _encode(tuple(value), out)
+    elif isinstance(value, list):
+        _encode(list(value), out)
+    elif isinstance(value, dict):
+        _encode(dict(value), out)
+    else:
+        raise TypeError('Cannot encode value of type %s' % value_type)
+
+
+_SHORT_FORMS = {
+    _TAG_LONG_BIG_INT: _TAG_BIG_INT,
+    _TAG_LONG_STR: _TAG_STR,
+    _TAG_LONG_UNICODE: _TAG_UNICODE,
+    _TAG_LONG_LIST: _TAG_LIST,
+    _TAG_LONG_TUPLE: _TAG_TUPLE,
+    _TAG_LONG_DICT: _TAG_DICT,
+}
+_LENGTH_PREFIXED_TAGS = frozenset(_SHORT_FORMS.values())
+
+
+def _decode(data, pos):
+    """Decodes the value starting at pos; returns it and the position after.
+
+    Scalars are decoded in line in the loop over the items of a container;
+    only nested containers recurse. Branches are ordered by how often the
+    tags appear in job values.
+    """
+    tag = data[pos]
+    if tag in _SHORT_FORMS:
+        length = _LENGTH.unpack_from(data, pos + 1)[0]
+        pos += 5
+        tag = _SHORT_FORMS[tag]
+    elif tag in _LENGTH_PREFIXED_TAGS:
+        length = ord(data[pos + 1])
+        pos += 2
+    else:
+        return _decode_scalar(data, pos)
+
+    if tag == _TAG_STR:
+        return data[pos:pos + length], pos + length
+    elif tag == _TAG_UNICODE:
+        return data[pos:pos + length].decode('utf-8'), pos + length
+    elif tag == _TAG_BIG_INT:
+        return long(data[pos:pos + length]), pos + length
+    elif tag == _TAG_DICT:
+        result = {}
+        for _ in xrange(length):
+            key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos
+
+    items = []
+    append = items.append
+    unpack_int8 = _INT8.unpack_from
+    unpack_int32 = _INT32.unpack_from
+    unpack_float = _FLOAT.unpack_from
+    for _ in xrange(length):
+        item_tag = data[pos]
+        if item_tag == _TAG_STR:
+            end = pos + 2 + ord(data[pos + 1])
+            append(data[pos + 2:end])
+            pos = end
+        elif item_tag == _TAG_INT8:
+            append(unpack_int8(data, pos + 1)[0])
+            pos += 2
+        elif item_tag == _TAG_INT32:
+            append(unpack_int32(data, pos + 1)[0])
+            pos += 5
+        elif item_tag == _TAG_UNICODE:
+            end = pos + 2 + ord(data[pos + 1])
+            append(data[pos + 2:end].decode('utf-8'))
+            pos = end
+        elif item_tag == _TAG_FLOAT:
+            append(unpack_float(data, pos + 1)[0])
+            pos += 9
+        else:
+            item, pos = _decode(data, pos)
+            append(item)
+    if tag == _TAG_TUPLE:
+        return tuple(items), pos
+    return items, pos
+
+
+def _decode_scalar(data, pos):
+    tag = data[pos]
+    if tag == _TAG_INT8:
+        return _INT8.unpack_from(data, pos + 1)[0], pos + 2
+    elif tag == _TAG_INT32:
+        return _INT32.unpack_from(data, pos + 1)[0], pos + 5
+    elif tag == _TAG_FLOAT:
+        return _FLOAT.unpack_from(data, pos + 1)[0], pos + 9
+    elif tag == _TAG_INT64:
+        return _INT64.unpack_from(data, pos + 1)[0], pos + 9
+    elif tag == _TAG_NONE:
+        return None, pos + 1
+    elif tag == _TAG_TRUE:
+        return True, pos + 1
+    elif tag == _TAG_FALSE:
+        return False, pos + 1
+    raise ValueError('Unknown type tag %r at position %d' % (tag, pos))
+
+
+class TypedRecordCodec(object):
+    """Compact binary encoding with type tags and length prefixes.
+
+    Supports None, bool, int, long, float, str, unicode and lists, tuples and
+    dicts of these; tuples and lists stay distinct. Records start with a
+    format marker, so a record written by another codec is rejected rather
+    than misread.
+    """
+
+    NAME = 'typed'
+
+    _MARKER = '\xcb\x01'
+
+    @classmethod
+    def encode(cls, value):
+        out = [cls._MARKER]
+        _encode(value, out)
+        return ''.join(out)
+
+    @classmethod
+    def decode(cls, data):
+        if not data.startswith(cls._MARKER):
+            raise ValueError('Not a typed record: %r' % data[:16])
+        try:
+            value, pos = _decode(data, len(cls._MARKER))
+        except (IndexError, struct.error):
+            raise ValueError('Truncated record')
+        if pos != len(data):
+            raise ValueError(
+                'Unexpected %d trailing bytes in record' % (len(data) - pos))
+        return value
+
+
+_CODECS = dict((codec.NAME, codec) for codec in [
+    LiteralEvalCodec, TypedRecordCodec])
+
+
+def get_codec(name):
+    """Returns the codec registered under a name; None gives the default."""
+    if name is None:
+        return LiteralEvalCodec
+    return _CODECS[name]
@@ -84,6 +84,30 @@ class Notifications(Service):
         """
         raise NotImplementedError()
 
+    def send_many(
+        self, to, sender, intent, body, subject, audit_trail=None,
+        retention_policy=None):
+        """Asyncronously sends the same notification to many recipients.
+
+        Batches the datastore writes and task enqueues that calling
+        send_async() once per recipient would make.
+
+        Args:
+          to: list of string. Recipient email addresses. See send_async() for
+              the other args.
+
+        Returns:
+          List of (notification_key, payload_key) 2-tuples, one for each
+          distinct recipient, in the order given in to.
+
+        Raises:
+          Exception: if values delegated to model initializers are invalid.
+          ValueError: if any of to or sender are malformed according to App
+              Engine (note that well-formed values do not guarantee success).
+
+        """
+        raise NotImplementedError()
+
 
 class Unsubscribe(Service):
 
@@ -0,0 +1,172 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chooses the number of shards a map/reduce job runs with.
+
+Left to itself, the map/reduce framework runs every job with the same number
+of shards, whatever the size of the input. Small courses then pay for fanning
+out over shards with next to nothing to do, while large courses run a few
+shards that each take hours.
+
+The planner estimates the number of entities of the kind a job maps over in
+the namespace of the course. The estimate comes from the datastore
+statistics when they exist, and otherwise from counting keys, up to the
+number beyond which the count no longer changes the plan. Jobs reading only
+some partitions of a kind have the keys of these partitions counted, as the
+statistics do not break counts down by property value. The number of
+shards is then picked so each shard maps about a target number of entities.
+Splitting the kind into that many key ranges is left to the input reader,
+which places the split points using the datastore's scatter sample of keys.
+"""
+
+import logging
+
+from common.utils import Namespace
+
+from google.appengine.ext import db
+from google.appengine.ext.db import stats
+
+# Default number of entities each shard should map.
+DEFAULT_TARGET_ENTITIES_PER_SHARD = 2500
+
+# Bounds on the number of shards of a job.
+MIN_SHARDS = 1
+MAX_SHARDS = 32
+
+# Sources of the entity count of a plan.
+SOURCE_STATISTICS = 'statistics'
+SOURCE_KEY_SCAN = 'key_scan'
+
+
+class ShardPlan(object):
+    """The number of shards chosen for a job, and why."""
+
+    def __init__(self, kind, namespace, entity_count, source,
+                 target_entities_per_shard, shard_count):
+        self.kind = kind
+        self.namespace = namespace
+        # Estimated number of entities; a lower bound when the key scan
+        # stopped at its limit.
+        self.entity_count = entity_count
+        # SOURCE_STATISTICS or SOURCE_KEY_SCAN.
+        self.source = source
+        self.target_entities_per_shard = target_entities_per_shard
+        self.shard_count = shard_count
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'namespace': self.namespace,
+            'entity_count': self.entity_count,
+            'source': self.source,
+            'target_entities_per_shard': self.target_entities_per_shard,
+            'shard_count': self.shard_count,
+        }
+
+    @classmethod
+    def from_dict(cls, adict):
+        return cls(
+            adict['kind'], adict['namespace'], adict['entity_count'],
+            adict['source'], adict['target_entities_per_shard'],
+            adict['shard_count'])
+
+    def describe(self):
+        """Returns a one-line description for the dashboard."""
+        if self.source == SOURCE_STATISTICS:
+            source = 'datastore statistics'
+        else:
+            source = 'a count of keys'
+        return '%d shard%s for about %d %s entities (estimated from %s).' % (
+            self.shard_count, '' if self.shard_count == 1 else 's',
+            self.entity_count, self.kind, source)
+
+
+def _count_from_statistics(kind):
+    """Returns the count of a kind in the current namespace, or None."""
+    # The statistics hold one entity per kind and namespace, so no sort, and
+    # no composite index, is needed. Only transient errors fall back to the
+    # key scan; others, such as a missing index, are raised.
+    try:
+        stat = stats.NamespaceKindStat.all().filter('kind_name =', kind).get()
+    except (db.Timeout, db.InternalError):
+        logging.exception('Failed to read datastore statistics for %s.', kind)
+        return None
+    if stat is None:
+        return None
+    return stat.count
+
+
+def _count_from_key_scan(kind, limit):
+    """Counts keys of a kind in the current namespace, stopping at limit."""
+    return db.Query(kind, keys_only=True).count(limit=limit)
+
+
+def _count_partitions_from_key_scan(
+    kind, partition_property, partitions, limit):
+    """Counts keys of some partitions of a kind, stopping at limit."""
+    count = 0
+    for partition in partitions:
+        if count >= limit:
+            break
+        count += db.Query(kind, keys_only=True).filter(
+            '%s =' % partition_property, partition).count(limit=limit - count)
+    return count
+
+
+def estimate_entity_count(kind, namespace, scan_limit,
+                          partition_property=None, partitions=None):
+    """Estimates the number of entities of a kind in a namespace.
+
+    Args:
+        kind: string. Name of the datastore kind.
+        namespace: string. Namespace to count the entities of.
+        scan_limit: int. Most keys counted when there are no statistics.
+        partition_property: string. Name of the property partitioning the
+            kind, or None to count all entities.
+        partitions: list. Values of partition_property to count entities of.
+
+    Returns:
+        (count, source) where source is SOURCE_STATISTICS or SOURCE_KEY_SCAN.
+    """
+    with Namespace(namespace):
+        if partition_property is not None:
+            return _count_partitions_from_key_scan(
+                kind, partition_property, partitions,
+                scan_limit), SOURCE_KEY_SCAN
+        count = _count_from_statistics(kind)
+        if count is not None:
+            return count, SOURCE_STATISTICS
+        return _count_from_key_scan(kind, scan_limit), SOURCE_KEY_SCAN
+
+
+def choose_shard_count(entity_count, target_entities_per_shard):
+    shard_count = -(-entity_count // target_entities_per_shard)
+    return max(MIN_SHARDS, min(MAX_SHARDS, shard_count))
+
+
+def plan(entity_class, namespace,
+         target_entities_per_shard=DEFAULT_TARGET_ENTITIES_PER_SHARD,
+         partition_property=None, partitions=None):
+    """Returns the ShardPlan for a job mapping over a kind in a namespace.
+
+    When partition_property is given, only the entities whose value of it is
+    one of partitions are planned for.
+    """
+    kind = entity_class.kind()
+    entity_count, source = estimate_entity_count(
+        kind, namespace, target_entities_per_shard * MAX_SHARDS,
+        partition_property=partition_property, partitions=partitions)
+    return ShardPlan(
+        kind, namespace, entity_count, source, target_entities_per_shard,
+        choose_shard_count(entity_count, target_entities_per_shard))
@@ -16,7 +16,9 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import bisect
 import datetime
+import hashlib
 import os
 import re
 import sys
@@ -29,6 +31,7 @@ from entities import BaseEntity
 from entities import put as entities_put
 import jinja2
 
+import appengine_config
 from common import caching
 from common import jinja_utils
 
@@ -48,6 +51,12 @@ _MAX_VFS_SHARD_SIZE = 1000 * 1000
 # Max number of shards for a single VFS cached file.
 _MAX_VFS_NUM_SHARDS = 4
 
+# Whether LocalReadOnlyFileSystem answers list(), isfile() and stat() for the
+# files bundled with the application from a LocalFileManifest rather than from
+# the disk. Bundled files only change between deployments in production; in
+# development they are edited in place.
+CAN_USE_LOCAL_FILE_MANIFEST = appengine_config.PRODUCTION_MODE
+
 # Global memcache controls.
 CAN_USE_VFS_IN_PROCESS_CACHE = ConfigProperty(
     'gcb_can_use_vfs_in_process_cache', bool, (
@@ -108,6 +117,14 @@ class AbstractFileSystem(object):
         """Returns bytes with the file content, but no metadata."""
         return self.open(filename).read()
 
+    def stat(self, filename):
+        """Returns a FileStat for the file, or None; does not read content."""
+        return self._impl.stat(filename)
+
+    def read_range(self, filename, start, stop):
+        """Returns the bytes [start, stop) of the file content."""
+        return self._impl.read_range(filename, start, stop)
+
     def put(self, filename, stream, **kwargs):
         """Replaces the contents of the file with the bytes in the stream."""
         self._assert_not_readonly()
@@ -137,8 +154,97 @@ class AbstractFileSystem(object):
         return stream.metadata.is_draft
 
 
+def content_hash(content):
+    """Returns the hash stored in the metadata of a file for its content."""
+    return hashlib.sha1(content).hexdigest()
+
+
+class FileStat(object):
+    """What is known of a file without reading its content."""
+
+    def __init__(self, size, updated_on, content_hash=None, is_draft=False):
+        # pylint: disable=redefined-outer-name
+        self.size = size
+        self.updated_on = updated_on
+        self.content_hash = content_hash
+        self.is_draft = is_draft
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        return cls(metadata.size, metadata.updated_on,
+                   content_hash=metadata.content_hash,
+                   is_draft=bool(metadata.is_draft))
+
+
+class LocalFileManifest(object):
+    """Sorted index of the files under a folder, with their size and mtime.
+
+    The folder is walked once, when the manifest of a folder is first asked
+    for; the manifest is then kept for the life of the process. Paths are
+    absolute and use '/' as the separator.
+    """
+
+    _LOCK = threading.Lock()
+    _MANIFESTS = {}
+
+    @classmethod
+    def get(cls, root):
+        root = AbstractFileSystem.normpath(os.path.abspath(root))
+        with cls._LOCK:
+            manifest = cls._MANIFESTS.get(root)
+            if manifest is None:
+                manifest = cls(root)
+                cls._MANIFESTS[root] = manifest
+            return manifest
+
+    @classmethod
+    def get_for_bundle(cls):
+        """Gets the manifest of the files bundled with the application."""
+        return cls.get(appengine_config.BUNDLE_ROOT)
+
+    def __init__(self, root):
+        self._root = root
+        self._stats = {}
+        for dirname, unused_dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = AbstractFileSystem.normpath(
+                    os.path.join(dirname, filename))
+                stat = os.stat(path)
+                self._stats[path] = (stat.st_size, stat.st_mtime)
+        self._paths = sorted(self._stats.keys())
+
+    @property
+    def root(self):
+        return self._root
+
+    def covers(self, path):
+        """Checks whether an absolute path is within the indexed folder."""
+        return path == self._root or path.startswith(self._root + '/')
+
+    def isfile(self, path):
+        return path in self._stats
+
+    def stat(self, path):
+        """Returns (size, mtime) of a file, or None."""
+        return self._stats.get(path)
+
+    def list(self, dir_path):
+        """Returns the sorted paths of all files under a folder."""
+        prefix = dir_path.rstrip('/') + '/'
+        start = bisect.bisect_left(self._paths, prefix)
+
+        # '0' follows '/'; paths starting with prefix[:-1] + '0' are the first
+        # ones past those under the folder.
+        stop = bisect.bisect_left(self._paths, prefix[:-1] + '0', start)
+        return self._paths[start:stop]
+
+
 class LocalReadOnlyFileSystem(object):
-    """A read-only file system serving only local files."""
+    """A read-only file system serving only local files.
+
+    Files bundled with the application are found in the manifest of the
+    bundle when CAN_USE_LOCAL_FILE_MANIFEST is set; others on the disk.
+    """
 
     def __init__(self, logical_home_folder=None, physical_home_folder=None):
         """Creates a new instance of the disk-backed read-only file system.
@@ -173,14 +279,48 @@ class LocalReadOnlyFileSystem(object):
             os.path.relpath(filename, self._physical_home_folder))
         return AbstractFileSystem.normpath(filename)
 
+    def _get_manifest_and_path(self, physical_filename):
+        """Gets a manifest covering an absolute path, and the path."""
+        if not (CAN_USE_LOCAL_FILE_MANIFEST and physical_filename):
+            return None, None
+        manifest = LocalFileManifest.get_for_bundle()
+        path = AbstractFileSystem.normpath(os.path.abspath(physical_filename))
+        if not manifest.covers(path):
+            return None, None
+        return manifest, path
+
     def isfile(self, filename):
-        return os.path.isfile(self._logical_to_physical(filename))
+        physical_filename = self._logical_to_physical(filename)
+        manifest, path = self._get_manifest_and_path(physical_filename)
+        if manifest:
+            return manifest.isfile(path)
+        return os.path.isfile(physical_filename)
 
     def get(self, filename):
         if not self.isfile(filename):
             return None
         return open(self._logical_to_physical(filename), 'rb')
 
+    def stat(self, filename):
+        physical_filename = self._logical_to_physical(filename)
+        manifest, path = self._get_manifest_and_path(physical_filename)
+        if manifest:
+            stat = manifest.stat(path)
+            if not stat:
+                return None
+            size, mtime = stat
+        elif os.path.isfile(physical_filename):
+            stat = os.stat(physical_filename)
+            size, mtime = stat.st_size, stat.st_mtime
+        else:
+            return None
+        return FileStat(size, datetime.datetime.utcfromtimestamp(mtime))
+
+    def read_range(self, filename, start, stop):
+        with open(self._logical_to_physical(filename), 'rb') as stream:
+            stream.seek(start)
+            return stream.read(stop - start)
+
     def put(self, unused_filename, unused_stream):
         raise Exception('Not implemented.')
 
@@ -192,9 +332,17 @@ class LocalReadOnlyFileSystem(object):
     # pylint: disable=unused-argument
     def list(self, root_dir, include_inherited=False):
         """Lists all files in a directory."""
+        physical_root_dir = self._logical_to_physical(root_dir)
+        manifest, path = self._get_manifest_and_path(physical_root_dir)
+        if manifest:
+            # Paths are given relative to root_dir, as os.walk() gives them.
+            return sorted([
+                self._physical_to_logical(os.path.join(
+                    physical_root_dir, filename[len(path) + 1:]))
+                for filename in manifest.list(path)])
+
         files = []
-        for dirname, unused_dirnames, filenames in os.walk(
-                self._logical_to_physical(root_dir)):
+        for dirname, unused_dirnames, filenames in os.walk(physical_root_dir):
             for filename in filenames:
                 files.append(
                     self._physical_to_logical(os.path.join(dirname, filename)))
@@ -228,6 +376,10 @@ class FileMetadataEntity(BaseEntity):
 
     size = db.IntegerProperty(indexed=False)
 
+    # SHA-1 of the content, as hex; None for files written before it was
+    # recorded.
+    content_hash = db.StringProperty(indexed=False)
+
 
 class FileDataEntity(BaseEntity):
     """An entity to represent file content; absolute file name is a key."""
@@ -590,6 +742,45 @@ class DatastoreBackedFileSystem(object):
         VfsCacheConnection.CACHE_NOT_FOUND.inc()
         return None
 
+    def stat(self, afilename):
+        """Gets what is known of a file from its metadata only."""
+        filename = self._logical_to_physical(afilename)
+        found, stream = self.cache.get(filename)
+        if found and stream:
+            return FileStat.from_metadata(stream.metadata)
+        if not found:
+            metadata = FileMetadataEntity.get_by_key_name(filename)
+            if metadata:
+                return FileStat.from_metadata(metadata)
+        if self._inherits_from and self._can_inherit(filename):
+            return self._inherits_from.stat(afilename)
+        return None
+
+    def read_range(self, afilename, start, stop):
+        """Gets bytes [start, stop) of a file, loading only their shards."""
+        filename = self._logical_to_physical(afilename)
+        found, stream = self.cache.get(filename)
+        if found and stream:
+            return stream.read()[start:stop]
+        metadata = None
+        if not found:
+            metadata = FileMetadataEntity.get_by_key_name(filename)
+        if not metadata:
+            if self._inherits_from and self._can_inherit(filename):
+                return self._inherits_from.read_range(afilename, start, stop)
+            return ''
+        stop = min(stop, metadata.size)
+        if start >= stop:
+            return ''
+        keys = self._generate_file_key_names(filename, metadata.size)
+        first = start // _MAX_VFS_SHARD_SIZE
+        last = (stop - 1) // _MAX_VFS_SHARD_SIZE
+        data = ''.join([
+            data_entity.data for data_entity in
+            FileDataEntity.get_by_key_name(keys[first:last + 1])])
+        offset = first * _MAX_VFS_SHARD_SIZE
+        return data[start - offset:stop - offset]
+
     def put(self, filename, stream, is_draft=False, metadata_only=False):
         """Puts a file stream to a database. Raw bytes stream, no encodings."""
         if stream:  # Must be outside the transactional operation
@@ -656,6 +847,7 @@ class DatastoreBackedFileSystem(object):
         if not metadata_only:
             # We operate with raw bytes. The consumer must deal with encoding.
             metadata.size = len(content)
+            metadata.content_hash = content_hash(content)
 
             # Chunk the data into entites based on max entity size limits
             # imposed by AppEngine
@@ -713,6 +905,7 @@ class DatastoreBackedFileSystem(object):
             raw_bytes = stream.read()
 
             metadata.size = len(raw_bytes)
+            metadata.content_hash = content_hash(raw_bytes)
 
             data = FileDataEntity(key_name=filename)
             data_list.append(data)
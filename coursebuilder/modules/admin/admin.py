@@ -375,11 +375,16 @@ class BaseAdminHandler(ConfigPropertyEditor):
         # add all registered counters
         all_counters = counters.Registry.registered.copy()
         for name in all_counters.keys():
-            global_value = all_counters[name].global_value
+            counter = all_counters[name]
+            if isinstance(counter, counters.LatencyHistogram):
+                perf_counters[name] = '%s / %s' % (
+                    counter.format_buckets(counter.buckets),
+                    counter.format_buckets(counter.global_buckets))
+                continue
+            global_value = counter.global_value
             if not global_value:
                 global_value = 'NA'
-            perf_counters[name] = '%s / %s' % (
-                all_counters[name].value, global_value)
+            perf_counters[name] = '%s / %s' % (counter.value, global_value)
 
         template_values['main_content'] = self.render_dict(
             perf_counters, 'In-process Performance Counters (local/global)')
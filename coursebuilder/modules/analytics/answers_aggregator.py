@@ -181,6 +181,18 @@ class AnswersAggregator(student_aggregate.AbstractStudentAggregationComponent):
                     assessment['min_score'] = min_score
         return {'assessments': assessments}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, previous,
+                        event_items):
+        # Scores are recomputed from the submissions of all events.
+        items = [{
+            'unit_id': assessment['unit_id'],
+            'lesson_id': assessment['lesson_id'],
+            'submissions': assessment['submissions'],
+            } for assessment in previous['assessments']]
+        return cls.produce_aggregate(
+            course, student, static_params, items + event_items)
+
     @classmethod
     def get_schema(cls):
         answer = schema_fields.FieldRegistry('answer')
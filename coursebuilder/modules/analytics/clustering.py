@@ -26,6 +26,7 @@ import urllib
 import zlib
 
 from mapreduce import context
+from mapreduce import operation
 
 from common import schema_fields
 from controllers import utils
@@ -770,7 +771,19 @@ class StudentVectorGenerator(jobs.MapReduceJob):
         return 0
 
 
-def hamming_distance(vector, student_vector):
+def _student_values(student_vector):
+    """Maps (type, id) of each dimension in student_vector to its value.
+
+    If the same dimension is present more than once, the first value wins,
+    matching StudentVector.get_dimension_value.
+    """
+    values = {}
+    for dim in student_vector:
+        values.setdefault((dim[DIM_TYPE], str(dim[DIM_ID])), dim[DIM_VALUE])
+    return values
+
+
+def hamming_distance(vector, student_vector, max_distance=None):
     """Return the hamming distance between a ClusterEntity and a StudentVector.
 
     The hamming distance between an ClusterEntity and a StudentVector is the
@@ -782,10 +795,9 @@ def hamming_distance(vector, student_vector):
     Params:
         vector: the vector field of a ClusterEntity instance.
         student_vector: the vector field of a StudentVector instance.
+        max_distance: optional number. Once the distance is greater than this
+            value the calculation stops, and max_distance + 1 is returned.
     """
-    # TODO(milit): As we are discarding all distances greater than
-    # ClusteringGenerator.MAX_DISTANCE, add it as a parameter so we stop
-    # calculating the distance once this limit is reached.
     def fits_left_side(dim, value):
         """_has_left_side(dim) -> dim[DIM_LOW] <= value"""
         return not _has_left_side(dim) or dim[DIM_LOW] <= value
@@ -794,17 +806,122 @@ def hamming_distance(vector, student_vector):
         """_has_right_side(dim) -> dim[DIM_HIGH] >= value"""
         return not _has_right_side(dim) or dim[DIM_HIGH] >= value
 
+    values = _student_values(student_vector)
     distance = 0
     for dim in vector:
-        value = StudentVector.get_dimension_value(student_vector,
-                                                  dim[DIM_ID], dim[DIM_TYPE])
+        value = values.get((dim[DIM_TYPE], str(dim[DIM_ID])))
         if not value:
             value = 0
         if not fits_left_side(dim, value) or not fits_right_side(dim, value):
             distance += 1
+            if max_distance is not None and distance > max_distance:
+                break
     return distance
 
 
+def _bounded_popcount(bits, limit=None):
+    """Counts the bits set in bits, stopping once the count exceeds limit."""
+    if limit is None:
+        return bin(bits).count('1')
+    count = 0
+    while bits:
+        bits &= bits - 1  # Clears the lowest set bit.
+        count += 1
+        if count > limit:
+            break
+    return count
+
+
+class HammingDistanceEngine(object):
+    """Calculates the distances from a StudentVector to many clusters at once.
+
+    Each distinct range condition (dimension, low, high) used by any of the
+    clusters gets a bit position. A cluster is compiled into the integer mask
+    of its conditions, and a student vector is packed into the integer
+    bitset of the conditions it does not fit. The Hamming distance to a
+    cluster is then the number of bits set in the intersection of both, so
+    a condition shared by several clusters is evaluated only once per student.
+
+    If the same dimension appears several times in one cluster, each
+    appearance gets its own bit, so it is counted as many times as
+    hamming_distance would count it.
+    """
+
+    def __init__(self, clusters, max_distance=None):
+        """Compiles the clusters.
+
+        Args:
+            clusters: a list of dictionaries with the keys 'id' and 'vector',
+                as built by ClusteringGenerator.build_additional_mapper_params.
+            max_distance: optional number. Clusters at a greater distance
+                are not reported by distances.
+        """
+        self._max_distance = max_distance
+        self._conditions = []
+        self._clusters = []
+        self._pair_keys = {}
+        condition_bits = {}
+        for cluster in clusters:
+            mask = 0
+            seen = collections.defaultdict(int)
+            for dim in cluster['vector']:
+                low = dim[DIM_LOW] if _has_left_side(dim) else None
+                high = dim[DIM_HIGH] if _has_right_side(dim) else None
+                if low is None and high is None:
+                    continue  # Every value is inside the range.
+                condition = ((dim[DIM_TYPE], str(dim[DIM_ID])), low, high)
+                occurrence = seen[condition]
+                seen[condition] += 1
+                bit = condition_bits.get((condition, occurrence))
+                if bit is None:
+                    bit = len(self._conditions)
+                    condition_bits[(condition, occurrence)] = bit
+                    self._conditions.append(condition)
+                mask |= 1 << bit
+            self._clusters.append((cluster['id'], mask))
+
+    def pack(self, student_vector):
+        """Returns the bitset of the conditions student_vector does not fit.
+
+        Args:
+            student_vector: the vector field of a StudentVector instance.
+        """
+        values = _student_values(student_vector)
+        bits = 0
+        for bit, (key, low, high) in enumerate(self._conditions):
+            value = values.get(key) or 0
+            if ((low is not None and value < low) or
+                (high is not None and value > high)):
+                bits |= 1 << bit
+        return bits
+
+    def distances(self, packed_vector):
+        """Returns the clusters not farther than max_distance from a student.
+
+        Args:
+            packed_vector: a bitset obtained with pack.
+
+        Returns:
+            A list of 2-uples (cluster_id, distance), in the same order the
+            clusters were given to the constructor.
+        """
+        result = []
+        for cluster_id, mask in self._clusters:
+            distance = _bounded_popcount(
+                packed_vector & mask, self._max_distance)
+            if self._max_distance is None or distance <= self._max_distance:
+                result.append((cluster_id, distance))
+        return result
+
+    def pair_key(self, cluster1_id, cluster2_id):
+        """Returns the json key used to yield a pair of clusters."""
+        key = self._pair_keys.get((cluster1_id, cluster2_id))
+        if key is None:
+            key = transforms.dumps((cluster1_id, cluster2_id))
+            self._pair_keys[(cluster1_id, cluster2_id)] = key
+        return key
+
+
 class ClusteringGenerator(jobs.MapReduceJob):
     """A map reduce job to calculate which students belong to each cluster.
 
@@ -823,6 +940,10 @@ class ClusteringGenerator(jobs.MapReduceJob):
     """
     MAX_DISTANCE = 2
 
+    # (mapreduce_id, HammingDistanceEngine) of the last job mapped by this
+    # process.
+    _distance_engine = None
+
     # TODO(milit): Add settings to disable heavy statistics.
     @staticmethod
     def get_description():
@@ -840,6 +961,25 @@ class ClusteringGenerator(jobs.MapReduceJob):
             'max_distance': getattr(self, 'MAX_DISTANCE', 2)
         }
 
+    @staticmethod
+    def _get_distance_engine():
+        """Returns the HammingDistanceEngine for the running job.
+
+        The clusters are the same for every item of a job, so the engine is
+        compiled once per mapreduce and reused by all the map calls of the
+        process.
+        """
+        ctx = context.get()
+        mapreduce_id = ctx.mapreduce_spec.mapreduce_id
+        cached = ClusteringGenerator._distance_engine
+        if cached and cached[0] == mapreduce_id:
+            return cached[1]
+        mapper_params = ctx.mapreduce_spec.mapper.params
+        engine = HammingDistanceEngine(mapper_params['clusters'],
+                                       mapper_params['max_distance'])
+        ClusteringGenerator._distance_engine = (mapreduce_id, engine)
+        return engine
+
     @staticmethod
     def map(item):
         """Calculates the distance from the StudentVector to ClusterEntites.
@@ -859,26 +999,27 @@ class ClusteringGenerator(jobs.MapReduceJob):
             One result is yielded for every cluster id and pair of clusters
             ids. If (cluster1_id, cluster2_id) is yielded, then
             (cluster2_id, cluster1_id) won't be yielded.
+            The StudentClusters entity is also yielded as a put operation,
+            so the framework writes them in batches.
         """
         student = StudentVector.get_by_key_name(item.user_id)
         if student:
-            mapper_params = context.get().mapreduce_spec.mapper.params
-            max_distance = mapper_params['max_distance']
-            clusters = {}
+            engine = ClusteringGenerator._get_distance_engine()
             item_vector = transforms.loads(student.vector)
-            for cluster in mapper_params['clusters']:
-                distance = hamming_distance(cluster['vector'], item_vector)
-                if distance > max_distance:
-                    continue
+            clusters = {}
+            for cluster_id, distance in engine.distances(
+                    engine.pack(item_vector)):
                 for cluster2_id, distance2 in clusters.items():
-                    key = transforms.dumps((cluster2_id, cluster['id']))
+                    key = engine.pair_key(cluster2_id, cluster_id)
                     value = (item.user_id, distance, distance2)
                     yield (key, transforms.dumps(value))
-                clusters[cluster['id']] = distance
+                clusters[cluster_id] = distance
                 to_yield = (item.user_id, distance)
-                yield(cluster['id'], transforms.dumps(to_yield))
+                yield(cluster_id, transforms.dumps(to_yield))
             clusters = transforms.dumps(clusters)
-            StudentClusters(key_name=item.user_id, clusters=clusters).put()
+            # The mutation pool batches the puts of the whole slice.
+            yield operation.db.Put(
+                StudentClusters(key_name=item.user_id, clusters=clusters))
         yield ('student_count', 1)
 
     @staticmethod
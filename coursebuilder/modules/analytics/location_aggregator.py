@@ -47,15 +47,29 @@ class LocationAggregator(student_aggregate.AbstractStudentAggregationComponent):
 
     @classmethod
     def produce_aggregate(cls, course, student, static_params, event_items):
+        return cls._build_aggregate(collections.defaultdict(int), event_items)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, previous,
+                        event_items):
         locations = collections.defaultdict(int)
+        for item in previous['location_frequencies']:
+            locations[(item.get('country'), item.get('region'),
+                       item.get('city'))] += item['count']
+        return cls._build_aggregate(locations, event_items)
+
+    @classmethod
+    def _build_aggregate(cls, locations, event_items):
         for location in event_items:
             locations[tuple(location)] += 1
+        total = sum(locations.itervalues())
 
         ret = []
         for location, count in locations.iteritems():
             country, region, city = location
             item = {
-                'frequency': float(count) / len(event_items),
+                'frequency': float(count) / total,
+                'count': count,
                 }
             if country:
                 item['country'] = country
@@ -91,6 +105,10 @@ class LocationAggregator(student_aggregate.AbstractStudentAggregationComponent):
             'location in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'location is listed first in the array.'))
+        location_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer', optional=True,
+            description='Number of responses from this user coming from '
+            'the location.'))
         return schema_fields.FieldArray(
           'location_frequencies', 'Location Frequencies',
           item_type=location_frequency,
@@ -125,15 +143,28 @@ class LocaleAggregator(student_aggregate.AbstractStudentAggregationComponent):
 
     @classmethod
     def produce_aggregate(cls, course, student, static_params, event_items):
+        return cls._build_aggregate(collections.defaultdict(int), event_items)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, previous,
+                        event_items):
         locales = collections.defaultdict(int)
+        for item in previous['locale_frequencies']:
+            locales[item['locale']] += item['count']
+        return cls._build_aggregate(locales, event_items)
+
+    @classmethod
+    def _build_aggregate(cls, locales, event_items):
         for locale in event_items:
             locales[locale] += 1
+        total = sum(locales.itervalues())
 
         ret = []
         for locale, count in locales.iteritems():
             ret.append({
                 'locale': locale,
-                'frequency': float(count) / len(event_items)
+                'frequency': float(count) / total,
+                'count': count,
                 })
         return {'locale_frequencies': ret}
 
@@ -156,6 +187,9 @@ class LocaleAggregator(student_aggregate.AbstractStudentAggregationComponent):
             'locale in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'locale is listed first in the array.'))
+        locale_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer', optional=True,
+            description='Number of responses from this user in the locale.'))
         return schema_fields.FieldArray(
             'locale_frequencies', 'Locale Frequencies',
             item_type=locale_frequency,
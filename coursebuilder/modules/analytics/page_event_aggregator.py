@@ -18,6 +18,7 @@ __author__ = ['Michael Gainer (mgainer@google.com)']
 
 import collections
 import datetime
+import re
 import urlparse
 
 from common import schema_fields
@@ -29,6 +30,49 @@ from tools import verify
 
 UNIX_EPOCH = datetime.datetime(year=1970, month=1, day=1)
 
+# Matches the "location" field of the JSON data of an event, when its value is
+# a string without escaped characters.
+_LOCATION_PATTERN = re.compile(r'"location"\s*:\s*"([^"\\]*)"')
+
+
+def _get_location(data):
+    """Returns the "location" field of the JSON data of an event.
+
+    Page events are recorded with their location as their only field of that
+    name, so the field is usually read without parsing all the data, which
+    holds more fields. The data is parsed if it could hold "location" more
+    than once, or if its value holds escaped characters.
+    """
+    if data.count('"location"') == 1:
+        match = _LOCATION_PATTERN.search(data)
+        if match:
+            return match.group(1)
+    return transforms.loads(data).get('location', '')
+
+
+def _split_location(location):
+    """Returns the path and query of a URL, as urlparse.urlparse() does."""
+    end = location.find('#')
+    if end < 0:
+        end = len(location)
+    query = ''
+    query_start = location.find('?', 0, end)
+    if query_start >= 0:
+        query = location[query_start + 1:end]
+        end = query_start
+    start = 0
+    scheme_end = location.find('://', 0, end)
+    if scheme_end >= 0:
+        start = location.find('/', scheme_end + 3, end)
+        if start < 0:
+            return '', query
+    path = location[start:end]
+    if ';' in path:
+        # Leave URLs with path parameters to urlparse.
+        url_parts = urlparse.urlparse(location)
+        return url_parts.path, url_parts.query
+    return path, query
+
 
 class AbstractPageEventMatcher(object):
 
@@ -59,6 +103,11 @@ class AbstractPageEventMatcher(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def uses_query_params(cls):
+        """Whether match() reads its query_params; if not, it is given {}."""
+        return True
+
     @classmethod
     def build_static_params(cls, unused_app_context):
         """Build any expensive-to-calculate items at course level.
@@ -88,6 +137,9 @@ class PathOnlyMatcher(AbstractPageEventMatcher):
     def get_path_match(self):
         return self._path_match
 
+    def uses_query_params(self):
+        return False
+
     def match(self, static_params, query_params):
         return (self._name, None)
 
@@ -188,6 +240,10 @@ class PageEventAggregator(
 
     _matchers_by_name = {}
     _matchers_by_path = collections.defaultdict(list)
+    # Matchers by full path of the URLs they match, course slug included, and
+    # whether any of them reads query parameters; by course slug. Compiled
+    # on the first event of each course and dropped when matchers change.
+    _dispatch_by_slug = {}
 
     @classmethod
     def get_name(cls):
@@ -210,15 +266,31 @@ class PageEventAggregator(
                 ret[name] = value
         return ret
 
+    @classmethod
+    def _get_dispatch(cls, slug):
+        dispatch = cls._dispatch_by_slug.get(slug)
+        if dispatch is None:
+            dispatch = {}
+            for path, matchers in cls._matchers_by_path.iteritems():
+                if matchers:
+                    dispatch[slug + path] = (list(matchers), any(
+                        [matcher.uses_query_params() for matcher in matchers]))
+            cls._dispatch_by_slug[slug] = dispatch
+        return dispatch
+
     @classmethod
     def process_event(cls, event, static_params):
         ret = []
-        data = transforms.loads(event.data)
-        url_parts = urlparse.urlparse(data.get('location', ''))
-        query_params = urlparse.parse_qs(url_parts.query)
-        path = url_parts.path.replace(static_params['slug'], '')
-
-        for matcher in cls._matchers_by_path.get(path, []):
+        path, query = _split_location(_get_location(event.data))
+        matchers, uses_query_params = cls._get_dispatch(
+            static_params['slug']).get(path, ((), False))
+        if not matchers:
+            return ret
+        query_params = {}
+        if uses_query_params:
+            query_params = urlparse.parse_qs(query)
+
+        for matcher in matchers:
             matcher_params = static_params.get(matcher.get_name())
             value = matcher.match(matcher_params, query_params)
             if value:
@@ -266,6 +338,19 @@ class PageEventAggregator(
         page_views.sort(key=lambda v: v['start'])
         return {'page_views': page_views}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_value, previous,
+                        event_items):
+        # Views are clustered again from the activities of all of them.
+        items = []
+        for view in previous['page_views']:
+            items.append([
+                [view['name'], view.get('item_id'), activity['timestamp'],
+                 activity['action']]
+                for activity in view['activities']])
+        return cls.produce_aggregate(
+            course, student, static_value, items + event_items)
+
     @classmethod
     def get_schema(cls):
         activity = schema_fields.FieldRegistry('activity')
@@ -318,6 +403,7 @@ class PageEventAggregator(
                 'Page event matcher named "%s" already registered.' % name)
         cls._matchers_by_name[name] = matcher
         cls._matchers_by_path[matcher.get_path_match()].append(matcher)
+        cls._dispatch_by_slug = {}
 
     @classmethod
     def unregister_matcher(cls, matcher):
@@ -325,8 +411,10 @@ class PageEventAggregator(
         if name in cls._matchers_by_name:
             matcher = cls._matchers_by_name[name]
             del cls._matchers_by_name[name]
-            for matcher_list in cls._matcher_by_path.itervalues():
-                matcher_list.remove(matcher)
+            for matcher_list in cls._matchers_by_path.itervalues():
+                if matcher in matcher_list:
+                    matcher_list.remove(matcher)
+            cls._dispatch_by_slug = {}
 
 
 def register_base_course_matchers():
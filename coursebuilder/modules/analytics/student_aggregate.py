@@ -17,6 +17,7 @@
 __author__ = ['Michael Gainer (mgainer@google.com)']
 
 import collections
+import datetime
 import logging
 import zlib
 
@@ -28,6 +29,7 @@ from controllers import sites
 from models import courses
 from models import data_sources
 from models import entities
+from models import event_partitions
 from models import jobs
 from models import models
 from models import transforms
@@ -132,6 +134,33 @@ class AbstractStudentAggregationComponent(object):
         """
         raise NotImplementedError()
 
+    def merge_aggregate(self, course, student, static_params, previous,
+                        event_items):
+        """Merge new event-items into an aggregate.  Called from reduce phase.
+
+        Incremental runs of the job only map events recorded since the
+        previous run, and only students with such events are reduced.  For
+        these, this function is called instead of produce_aggregate(), with
+        the value produce_aggregate() or merge_aggregate() returned for the
+        student last time, and the items produced by process_event() for
+        the new events only.  The result must be what produce_aggregate()
+        would return given the items for all events.
+
+        Components that do not override this function make all runs of the
+        job read all events.
+
+        Args:
+          course: The Course in which the student and the events are found.
+          student: the Student for which the events occurred.
+          static_params: the value from build_static_params(), if any.
+          previous: the dict stored for this component for the Student.
+          event_items: a list of the items produced by process_event()
+              for the new events of the given Student.
+        Returns:
+          A dict corresponding to the declared schema.
+        """
+        raise NotImplementedError()
+
     def get_schema(self):
         """Provide the partial schema for results produced.
 
@@ -160,7 +189,21 @@ class StudentAggregateEntity(entities.BaseEntity):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.id_or_name()))
 
 
-class StudentAggregateGenerator(jobs.MapReduceJob):
+class StudentAggregateWatermarkEntity(entities.BaseEntity):
+    """Up to when events are in the aggregates of the course's students.
+
+    Written when StudentAggregateGenerator is submitted: once the run with
+    sequence_num has completed, events recorded up to recorded_on have
+    been aggregated, and the next run need only map later events.
+    """
+
+    KEY_NAME = 'watermark'
+
+    recorded_on = db.DateTimeProperty(indexed=False)
+    sequence_num = db.IntegerProperty(indexed=False)
+
+
+class StudentAggregateGenerator(event_partitions.PartitionedEventsJob):
     """M/R job to aggregate data by student using registered plug-ins.
 
     This class coordinates the work of plugin classes registered with
@@ -169,23 +212,72 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
     insulated from one another, and are permitted to fail individually without
     compromising the results contributed for a Student by other plugins.
 
+    Each run maps the events recorded up to a watermark, a little before it
+    was started.  When the previous run completed and all components
+    implement merge_aggregate(), a run is incremental: it only maps the
+    events recorded since the previous watermark, and merges them into the
+    stored aggregates of the students having such events.  Otherwise, and
+    after a run failed or was canceled part way, aggregates are rebuilt
+    from all events.
+
     """
 
+    # Events become visible to queries shortly after they are recorded;
+    # the watermark lags behind the start of the run so none are missed.
+    WATERMARK_LAG = datetime.timedelta(minutes=1)
+
+    # Shortest range of recorded_on mapped by a run; shards split it.
+    MIN_RANGE = datetime.timedelta(seconds=1)
+
     @staticmethod
     def get_description():
         return 'student_aggregate'
 
+    def get_event_sources_wanted(self):
+        return StudentAggregateComponentRegistry.get_event_sources()
+
     @staticmethod
-    def entity_class():
-        return models.EventEntity
+    def _components_can_merge():
+        base_merge = AbstractStudentAggregationComponent.merge_aggregate.im_func
+        for component in StudentAggregateComponentRegistry.get_components():
+            if component.merge_aggregate.im_func is base_merge:
+                return False
+        return True
+
+    def _get_previous_watermark(self):
+        """Returns up to when events are aggregated, or None if unknown."""
+        watermark = StudentAggregateWatermarkEntity.get_by_key_name(
+            StudentAggregateWatermarkEntity.KEY_NAME)
+        job = self.load()
+        if (watermark is None or job is None or
+            job.sequence_num != watermark.sequence_num or
+            job.status_code != jobs.STATUS_CODE_COMPLETED):
+            return None
+        return watermark.recorded_on
 
     def build_additional_mapper_params(self, app_context):
         schemas = {}
         schema_names = {}
+        since = None
+        if self._components_can_merge():
+            since = self._get_previous_watermark()
+        incremental = since is not None
+        if not incremental:
+            first = models.EventEntity.all().order('recorded_on').get()
+            if first:
+                since = first.recorded_on - datetime.timedelta(microseconds=1)
+        self._watermark = datetime.datetime.utcnow() - self.WATERMARK_LAG
+        if since is None:
+            since = self._watermark - self.MIN_RANGE
+        self._watermark = max(self._watermark, since + self.MIN_RANGE)
         ret = {
             'course_namespace': app_context.get_namespace_name(),
             'schemas': schemas,
             'schema_names': schema_names,
+            'incremental': incremental,
+            'filters': [
+                ('recorded_on', '>', since),
+                ('recorded_on', '<=', self._watermark)],
             }
         for component in StudentAggregateComponentRegistry.get_components():
             component_name = component.get_name()
@@ -201,6 +293,16 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
             schemas[component_name] = schema.get_json_schema_dict()
         return ret
 
+    def non_transactional_submit(self):
+        sequence_num = super(
+            StudentAggregateGenerator, self).non_transactional_submit()
+        if sequence_num != -1:
+            StudentAggregateWatermarkEntity(
+                key_name=StudentAggregateWatermarkEntity.KEY_NAME,
+                recorded_on=self._watermark,
+                sequence_num=sequence_num).put()
+        return sequence_num
+
     @staticmethod
     def map(event):
         for component in (StudentAggregateComponentRegistry.
@@ -248,18 +350,32 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
             component_name, payload = value.split(':', 1)
             event_items[component_name].append(transforms.loads(payload))
 
+        # Incremental runs merge into the aggregate from the previous run.
+        # Components failing to merge keep their previous value.
+        aggregate = {}
+        if params['incremental']:
+            entity = StudentAggregateEntity.get_by_key_name(user_id)
+            if entity:
+                aggregate = transforms.loads(zlib.decompress(entity.data))
+
         # Build up per-Student aggregate by calling each component.  Note that
         # we call each component whether or not its mapper produced any
         # output.
-        aggregate = {}
         for component in StudentAggregateComponentRegistry.get_components():
             component_name = component.get_name()
             static_value = params.get(component_name)
+            schema_name = params['schema_names'][component_name]
             value = {}
             try:
-                value = component.produce_aggregate(
-                    course, student, static_value,
-                    event_items.get(component_name, []))
+                if schema_name in aggregate:
+                    value = component.merge_aggregate(
+                        course, student, static_value,
+                        {schema_name: aggregate[schema_name]},
+                        event_items.get(component_name, []))
+                else:
+                    value = component.produce_aggregate(
+                        course, student, static_value,
+                        event_items.get(component_name, []))
                 if not value:
                     continue
             # pylint: disable=broad-except
@@ -270,7 +386,6 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                                  component_name, str(ex))
                 continue
 
-            schema_name = params['schema_names'][component_name]
             if schema_name not in value:
                 logging.critical(
                     'Student aggregation reduce handler %s produced '
@@ -404,6 +519,11 @@ class StudentAggregateComponentRegistry(
     def get_components_for_event_source(cls, source):
         return cls._components_for_event_source.get(source, [])
 
+    @classmethod
+    def get_event_sources(cls):
+        return [source for source, components
+                in cls._components_for_event_source.iteritems() if components]
+
     @classmethod
     def get_components(cls):
         return cls._components
@@ -45,15 +45,28 @@ class UserAgentAggregator(
 
     @classmethod
     def produce_aggregate(cls, course, student, static_params, event_items):
+        return cls._build_aggregate(collections.defaultdict(int), event_items)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, previous,
+                        event_items):
         user_agents = collections.defaultdict(int)
+        for item in previous['user_agent_frequencies']:
+            user_agents[item['user_agent']] += item['count']
+        return cls._build_aggregate(user_agents, event_items)
+
+    @classmethod
+    def _build_aggregate(cls, user_agents, event_items):
         for user_agent in event_items:
             user_agents[user_agent] += 1
+        total = sum(user_agents.itervalues())
 
         ret = []
         for user_agent, count in user_agents.iteritems():
             ret.append({
                 'user_agent': user_agent,
-                'frequency': float(count) / len(event_items),
+                'frequency': float(count) / total,
+                'count': count,
                 })
         return {'user_agent_frequencies': ret}
 
@@ -71,6 +84,10 @@ class UserAgentAggregator(
             'user_agent in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'user_agent is listed first in the array.'))
+        user_agent_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer', optional=True,
+            description='Number of responses from this user with the '
+            'user_agent.'))
         return schema_fields.FieldArray(
           'user_agent_frequencies', 'User Agent Frequencies',
           item_type=user_agent_frequency,
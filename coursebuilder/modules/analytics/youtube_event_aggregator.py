@@ -33,6 +33,8 @@ ACTION_ID_TO_NAME = {
     3: 'buffering',
     5: 'video cued'
 }
+ACTION_NAME_TO_ID = dict(
+    (name, action_id) for action_id, name in ACTION_ID_TO_NAME.iteritems())
 
 
 class YouTubeEventAggregator(
@@ -97,6 +99,20 @@ class YouTubeEventAggregator(
 
         return {'youtube': youtube_interactions}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, previous,
+                        event_items):
+        # Interactions are split again from the events of all of them.
+        items = []
+        for interaction in previous['youtube']:
+            for event in interaction['events']:
+                items.append((
+                    interaction['video_id'], event['position'],
+                    ACTION_NAME_TO_ID.get(event['action'], event['action']),
+                    event['timestamp']))
+        return cls.produce_aggregate(
+            course, student, static_params, items + event_items)
+
     @classmethod
     def get_schema(cls):
         youtube_event = schema_fields.FieldRegistry('event')
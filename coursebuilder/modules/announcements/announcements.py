@@ -18,6 +18,7 @@ __author__ = 'Saifu Angto (saifu@google.com)'
 
 
 import datetime
+import hashlib
 import urllib
 
 from common import tags
@@ -43,6 +44,16 @@ from modules.oeditor import oeditor
 
 from google.appengine.ext import db
 
+# Number of announcements on each page of the list shown to users.
+ANNOUNCEMENTS_PER_PAGE = 20
+
+# Number of announcements held by each of the pages in which announcements
+# are cached; together they stay far below the memcache size limit.
+ANNOUNCEMENTS_PER_CACHED_PAGE = 50
+
+# Most announcements shown, newest first.
+MAX_ANNOUNCEMENTS = 1000
+
 
 class AnnouncementsRights(object):
     """Manages view/edit rights for announcements."""
@@ -96,33 +107,45 @@ class AnnouncementsHandler(BaseHandler, ReflectiveRequestHandler):
         return self.canonicalize_url(
             '/announcements?%s' % urllib.urlencode(args))
 
-    def format_items_for_template(self, items):
-        """Formats a list of entities into template values."""
-        template_items = []
-        for item in items:
-            item = transforms.entity_to_dict(item)
-
-            # add 'edit' actions
-            if AnnouncementsRights.can_edit(self):
-                item['edit_action'] = self.get_action_url(
-                    'edit', key=item['key'])
-
-                item['delete_xsrf_token'] = self.create_xsrf_token('delete')
-                item['delete_action'] = self.get_action_url(
-                    'delete', key=item['key'])
-
-            template_items.append(item)
+    def format_item_for_template(self, item):
+        """Formats an entity into template values; they may be cached."""
+        item = transforms.entity_to_dict(item)
 
+        # add 'edit' actions
+        if AnnouncementsRights.can_edit(self):
+            item['edit_action'] = self.get_action_url(
+                'edit', key=item['key'])
+            item['delete_action'] = self.get_action_url(
+                'delete', key=item['key'])
+        return item
+
+    def format_items_for_template(self, template_items, page_number,
+                                  page_count):
+        """Formats a page of formatted items into template values."""
         output = {}
         output['children'] = template_items
 
-        # add 'add' action
+        if page_number > 0:
+            output['newer_action'] = self.get_page_url(page_number - 1)
+        if page_number < page_count - 1:
+            output['older_action'] = self.get_page_url(page_number + 1)
+
+        # add 'add' action; all items share one token for 'delete'
         if AnnouncementsRights.can_edit(self):
             output['add_xsrf_token'] = self.create_xsrf_token('add')
             output['add_action'] = self.get_action_url('add')
+            if template_items:
+                output['delete_xsrf_token'] = self.create_xsrf_token(
+                    'delete')
 
         return output
 
+    def get_page_url(self, page_number):
+        if not page_number:
+            return self.canonicalize_url('/announcements')
+        return self.canonicalize_url(
+            '/announcements?%s' % urllib.urlencode({'page': page_number}))
+
     def _render(self):
         self.template_value['navbar'] = {'announcements': True}
         self.render('announcements.html')
@@ -140,14 +163,15 @@ class AnnouncementsHandler(BaseHandler, ReflectiveRequestHandler):
                 transient_student = True
         self.template_value['transient_student'] = transient_student
 
-        items = AnnouncementEntity.get_announcements()
-        items = AnnouncementsRights.apply_rights(self, items)
-        if not roles.Roles.is_course_admin(self.get_course().app_context):
-            items = models.LabelDAO.apply_course_track_labels_to_student_labels(
-                self.get_course(), student, items)
+        try:
+            page_number = max(0, int(self.request.get('page') or 0))
+        except ValueError:
+            page_number = 0
+        template_items, page_count = AnnouncementsFeed.get_page(
+            self, student, page_number)
 
         self.template_value['announcements'] = self.format_items_for_template(
-            items)
+            template_items, page_number, page_count)
         self._render()
 
     def get_edit(self):
@@ -353,30 +377,130 @@ class AnnouncementEntity(entities.BaseEntity):
     is_draft = db.BooleanProperty()
     send_email = db.BooleanProperty()
 
-    memcache_key = 'announcements'
-
     @classmethod
     def get_announcements(cls, allow_cached=True):
-        items = MemcacheManager.get(cls.memcache_key)
-        if not allow_cached or items is None:
-            items = AnnouncementEntity.all().order('-date').fetch(1000)
-
-            # TODO(psimakov): prepare to exceed 1MB max item size
-            # read more here: http://stackoverflow.com
-            #   /questions/5081502/memcache-1-mb-limit-in-google-app-engine
-            MemcacheManager.set(cls.memcache_key, items)
-        return items
+        """Returns all announcements, newest first."""
+        if not allow_cached:
+            return AnnouncementsFeed.load_announcements()
+        return AnnouncementsFeed.get_announcements()
 
     def put(self):
         """Do the normal put() and also invalidate memcache."""
         result = super(AnnouncementEntity, self).put()
-        MemcacheManager.delete(self.memcache_key)
+        AnnouncementsFeed.on_announcements_changed()
         return result
 
     def delete(self):
         """Do the normal delete() and invalidate memcache."""
         super(AnnouncementEntity, self).delete()
-        MemcacheManager.delete(self.memcache_key)
+        AnnouncementsFeed.on_announcements_changed()
+
+
+class AnnouncementsFeed(object):
+    """Pages of announcements, cached in memcache.
+
+    Announcements are cached in date-ordered pages of
+    ANNOUNCEMENTS_PER_CACHED_PAGE entities. The pages of the list shown to
+    users are cached too, as template values formatted for the audience
+    that sees them: editors, or viewers with a given set of course track and
+    locale labels. All keys include a version stamp that is incremented on
+    every change to an announcement, so changes invalidate all pages at
+    once.
+    """
+
+    VERSION_KEY = 'announcements_version'
+
+    @classmethod
+    def _get_version(cls):
+        return MemcacheManager.get_version_stamp(cls.VERSION_KEY)
+
+    @classmethod
+    def on_announcements_changed(cls):
+        MemcacheManager.bump_version_stamp(cls.VERSION_KEY)
+
+    @classmethod
+    def load_announcements(cls):
+        """Loads all announcements from the datastore, newest first."""
+        return AnnouncementEntity.all().order('-date').fetch(
+            MAX_ANNOUNCEMENTS)
+
+    @classmethod
+    def get_announcements(cls):
+        """Returns all announcements, newest first."""
+        prefix = 'announcements:%s:' % cls._get_version()
+        count_key = prefix + 'page_count'
+        page_count = MemcacheManager.get(count_key)
+        if page_count is not None:
+            keys = [prefix + str(index) for index in xrange(page_count)]
+            pages = MemcacheManager.get_multi(keys)
+            if len(pages) == page_count:
+                return [item for key in keys for item in pages[key]]
+
+        items = cls.load_announcements()
+        pages = {}
+        for start in xrange(0, len(items), ANNOUNCEMENTS_PER_CACHED_PAGE):
+            pages[prefix + str(len(pages))] = (
+                items[start:start + ANNOUNCEMENTS_PER_CACHED_PAGE])
+        MemcacheManager.set_multi(pages)
+        MemcacheManager.set(count_key, len(pages))
+        return items
+
+    @classmethod
+    def _get_audience(cls, handler, student):
+        """Returns a name for all users who see the same announcements."""
+        if AnnouncementsRights.can_edit(handler):
+            return 'editor'
+        course = handler.get_course()
+        parts = [
+            'viewer',
+            course.app_context.get_current_locale() or '',
+            str(bool(course.get_course_setting('can_student_change_locale'))),
+            str(models.LabelManager.get_version())]
+        if student and not student.is_transient:
+            for label_type in [models.LabelDTO.LABEL_TYPE_COURSE_TRACK,
+                               models.LabelDTO.LABEL_TYPE_LOCALE]:
+                parts.append(utils.list_to_text(
+                    sorted(student.get_labels_of_type(label_type))))
+        return hashlib.md5(u'|'.join(parts).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_page(cls, handler, student, page_number):
+        """Returns a page of the announcements a user can see.
+
+        Args:
+            handler: AnnouncementsHandler serving the user.
+            student: Student or None. The enrolled student, if any.
+            page_number: int. Index of the page, starting at 0 for the page
+                of the newest announcements.
+
+        Returns:
+            (items, page_count) where items is a list of template values made
+            by handler.format_item_for_template(), and page_count the number
+            of pages, at least 1.
+        """
+        prefix = 'announcements:%s:%s:' % (
+            cls._get_version(), cls._get_audience(handler, student))
+        cached = MemcacheManager.get(prefix + str(page_number))
+        if cached is not None:
+            return cached
+
+        items = AnnouncementsRights.apply_rights(
+            handler, cls.get_announcements())
+        if not AnnouncementsRights.can_edit(handler):
+            items = models.LabelDAO.apply_course_track_labels_to_student_labels(
+                handler.get_course(), student, items)
+        template_items = [
+            handler.format_item_for_template(item) for item in items]
+
+        page_count = max(1, -(-len(template_items) // ANNOUNCEMENTS_PER_PAGE))
+        pages = {}
+        for index in xrange(page_count):
+            start = index * ANNOUNCEMENTS_PER_PAGE
+            pages[prefix + str(index)] = (
+                template_items[start:start + ANNOUNCEMENTS_PER_PAGE],
+                page_count)
+        MemcacheManager.set_multi(pages)
+        return pages.get(prefix + str(page_number), ([], page_count))
 
 
 custom_module = None
@@ -409,7 +409,7 @@ class CertificatesEarnedDataSource(data_sources.SynchronousQuery):
             })
         # Override with actual values from m/r job, if present.
         template_values.update(
-            jobs.MapReduceJob.get_results(certificates_earned_job))
+            jobs.MapReduceJob.iter_results(certificates_earned_job))
 
 
 def register_analytic():
@@ -446,6 +446,12 @@ class CertificateAggregator(
                           unused_event_items):
         return {'earned_certificate': student_is_qualified(student, course)}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params,
+                        unused_previous, event_items):
+        return cls.produce_aggregate(
+            course, student, static_params, event_items)
+
     @classmethod
     def get_schema(cls):
         return schema_fields.SchemaField(
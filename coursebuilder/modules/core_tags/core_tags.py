@@ -16,20 +16,25 @@
 
 __author__ = 'John Orr (jorr@google.com)'
 
+import copy
+import hashlib
 import os
 import re
 import urllib
 import urlparse
 from xml.etree import cElementTree
+from jinja2 import meta as jinja2_meta
 import markdown
 
 import appengine_config
+from common import caching
 from common import crypto
 from common import jinja_utils
 from common import schema_fields
 from common import tags
 from common import utils as common_utils
 from controllers import utils
+from models import counters
 from models import courses
 from models import custom_modules
 from models import models
@@ -37,6 +42,8 @@ from models import roles
 from models import transforms
 from modules.oeditor import oeditor
 
+from google.appengine.api import namespace_manager
+
 
 _RESOURCE_PREFIX = '/modules/core_tags'
 RESOURCE_FOLDER = _RESOURCE_PREFIX + '/resources/'
@@ -52,6 +59,33 @@ _TEMPLATES_ABSPATH = os.path.join(os.path.dirname(__file__), 'templates')
 _GOOGLE_DRIVE_TAG_PATH = _RESOURCE_PREFIX + '/googledrivetag'
 _GOOGLE_DRIVE_TAG_RENDERER_PATH = _RESOURCE_PREFIX + '/googledrivetagrenderer'
 
+# Bounds on the rendered Drive items each process caches.
+_MAX_CACHED_DRIVE_ITEMS_BYTES = 8 * 1024 * 1024
+_MAX_CACHED_DRIVE_ITEM_BYTES = 1024 * 1024
+
+DRIVE_ITEM_CACHE_HIT = counters.PerfCounter(
+    'gcb-core-tags-drive-item-cache-hit',
+    'Number of times a rendered Drive item was served from a cache.')
+DRIVE_ITEM_CACHE_MISS = counters.PerfCounter(
+    'gcb-core-tags-drive-item-cache-miss',
+    'Number of times a Drive item was loaded and rendered.')
+
+# Bound on the parsed includes each process caches.
+_MAX_CACHED_INCLUDES = 256
+
+# Template values an include may use and still be the same for all students;
+# the values of the others may depend on the student viewing the page.
+_STUDENT_INDEPENDENT_INCLUDE_VALUES = frozenset([
+    '_', 'base_path', 'gettext', 'gcb_course_base', 'ngettext',
+    'page_locale'])
+
+INCLUDE_CACHE_HIT = counters.PerfCounter(
+    'gcb-core-tags-include-cache-hit',
+    'Number of times a parsed include was served from the in-process cache.')
+INCLUDE_CACHE_MISS = counters.PerfCounter(
+    'gcb-core-tags-include-cache-miss',
+    'Number of times an include was rendered and parsed.')
+
 
 def _escape_url(url, force_https=True):
     """Escapes/quotes url parts to sane user input."""
@@ -350,27 +384,62 @@ class GoogleDriveRESTHandler(utils.BaseRESTHandler):
             self, 200, 'Success.', payload_dict={'key': str(key)})
 
     def _save_content_chunk(self, contents, type_id, resource_id):
-        key = None
-        uid = models.ContentChunkDAO.make_uid(type_id, resource_id)
-        matches = models.ContentChunkDAO.get_by_uid(uid)
-
-        if not matches:
-            key = models.ContentChunkDAO.save(models.ContentChunkDTO({
-                'content_type': 'text/html',
-                'contents': contents,
-                'resource_id': resource_id,
-                'type_id': type_id,
-            }))
-        else:
-            # There is a data race in the DAO -- it's possible to create two
-            # entries at the same time with the same UID. If that happened,
-            # use the first one saved.
-            dto = matches[0]
-            dto.contents = contents
-            dto.content_type = 'text/html'
-            key = models.ContentChunkDAO.save(dto)
+        return models.ContentChunkDAO.save_by_uid(models.ContentChunkDTO({
+            'content_type': 'text/html',
+            'contents': contents,
+            'resource_id': resource_id,
+            'type_id': type_id,
+        }))
+
 
-        return key
+class ProcessScopedDriveItemCache(caching.ProcessScopedSingleton):
+    """This class holds in-process global cache of rendered Drive items.
+
+    Entries are keyed by namespace, the version stamp of the content chunks
+    and the uid of the chunk, so saving any chunk of a course makes all of
+    them stale.
+    """
+
+    def __init__(self):
+        self._cache = caching.LRUCache(
+            max_size_bytes=_MAX_CACHED_DRIVE_ITEMS_BYTES,
+            max_item_size_bytes=_MAX_CACHED_DRIVE_ITEM_BYTES)
+
+    @classmethod
+    def _render(cls, uid):
+        chunk = models.ContentChunkDAO.get_one_by_uid(uid)
+        if not chunk:
+            return None
+        template = jinja_utils.get_template(
+            'drive_item.html', [_TEMPLATES_ABSPATH])
+        return template.render({'contents': chunk.contents})
+
+    @classmethod
+    def get_html(cls, uid):
+        """Returns the rendered Drive item of a content chunk uid, or None."""
+        version = models.ContentChunkDAO.get_version()
+        if version is None:
+            DRIVE_ITEM_CACHE_MISS.inc()
+            return cls._render(uid)
+
+        key = (namespace_manager.get_namespace(), version, uid)
+        found, html = cls.instance()._cache.get(key)
+        if found:
+            DRIVE_ITEM_CACHE_HIT.inc()
+            return html
+
+        memcache_key = 'drive_item:%s:%s' % (version, uid)
+        html = models.MemcacheManager.get(memcache_key)
+        if html is not None:
+            DRIVE_ITEM_CACHE_HIT.inc()
+        else:
+            DRIVE_ITEM_CACHE_MISS.inc()
+            html = cls._render(uid)
+            if html is None:
+                return None
+            models.MemcacheManager.set(memcache_key, html)
+        cls.instance()._cache.put(key, html)
+        return html
 
 
 class GoogleDriveTagRenderer(utils.BaseHandler):
@@ -387,21 +456,14 @@ class GoogleDriveTagRenderer(utils.BaseHandler):
             self._handle_error(400, 'Bad request')
             return
 
-        matches = models.ContentChunkDAO.get_by_uid(
+        html = ProcessScopedDriveItemCache.get_html(
             models.ContentChunkDAO.make_uid(type_id, resource_id))
 
-        if not matches:
+        if html is None:
             self._handle_error(404, 'Content chunk not found')
             return
 
-        # There is a data race in the DAO -- it's possible to create two entries
-        # at the same time with the same UID. If that happened, use the first
-        # one saved.
-        chunk = matches[0]
-
-        template = jinja_utils.get_template(
-            'drive_item.html', [_TEMPLATES_ABSPATH])
-        self.response.out.write(template.render({'contents': chunk.contents}))
+        self.response.out.write(html)
 
     def _handle_error(self, code, message):
         template = jinja_utils.get_template(
@@ -661,23 +723,126 @@ class IFrame(CoreTag):
         return reg
 
 
-class Include(CoreTag):
+class ProcessScopedIncludeCache(caching.ProcessScopedSingleton):
+    """This class holds in-process global cache of parsed includes.
 
-    def render(self, node, handler):
-        template_path = re.sub('^/+', '', node.attrib.get('path'))
-        base_path = os.path.dirname(template_path)
-        base_file = os.path.basename(template_path)
-        handler.init_template_values(handler.app_context.get_environ())
-        handler.template_value['base_path'] = base_path
-        html_text = handler.render_template_to_html(
-            handler.template_value, base_file,
-            additional_dirs=[
+    Entries are keyed by everything the output of an include depends on,
+    including a hash of the source of its template, so changed files are
+    never served from the cache. Includes that may depend on the student
+    are remembered as such, and not cached.
+    """
+
+    NOT_CACHEABLE = object()
+
+    def __init__(self):
+        self._cache = caching.LRUCache(max_item_count=_MAX_CACHED_INCLUDES)
+
+    def get(self, key):
+        found, value = self._cache.get(key)
+        return value if found else None
+
+    def put(self, key, value):
+        self._cache.put(key, value)
+
+
+class IncludeRenderer(caching.RequestScopedSingleton):
+    """Renders the <gcb-include> tags of the pages of a request.
+
+    The template values of the handler are initialized once per request,
+    if the handler has not done so already, and all includes share one
+    jinja environment, which keeps the templates it has compiled. The parsed
+    output of includes which do not depend on the student is cached across
+    requests by ProcessScopedIncludeCache.
+    """
+
+    def __init__(self):
+        self._handler = None
+        self._template_environs = {}
+
+    def _bind(self, handler):
+        if handler is self._handler:
+            return
+        self._handler = handler
+        self._template_environs = {}
+        if utils.COURSE_INFO_KEY not in handler.template_value:
+            handler.init_template_values(handler.app_context.get_environ())
+
+    def _get_template_environ(self, base_path):
+        template_environ = self._template_environs.get(base_path)
+        if template_environ is None:
+            template_environ = self._handler.get_template_environ([
                 os.path.join(appengine_config.BUNDLE_ROOT, 'views'),
                 appengine_config.BUNDLE_ROOT,
                 os.path.join(appengine_config.BUNDLE_ROOT, base_path),
             ])
+            self._template_environs[base_path] = template_environ
+        return template_environ
+
+    @classmethod
+    def _is_student_independent(cls, template_environ, source):
+        ast = template_environ.parse(source)
+        if list(jinja2_meta.find_referenced_templates(ast)):
+            return False
+        return jinja2_meta.find_undeclared_variables(ast).issubset(
+            _STUDENT_INDEPENDENT_INCLUDE_VALUES)
+
+    def _render(self, template_environ, base_file, base_path):
+        handler = self._handler
+        courses.Course.set_current(handler.get_course())
+        models.MemcacheManager.begin_readonly()
+        try:
+            html_text = template_environ.get_template(base_file).render(
+                handler.template_value, base_path=base_path)
+        finally:
+            models.MemcacheManager.end_readonly()
+            courses.Course.clear_current()
         return tags.html_string_to_element_tree(html_text)
 
+    def render(self, handler, path):
+        """Returns the parsed output of the template at a path.
+
+        Args:
+            handler: CourseHandler serving the page with the include.
+            path: string. Path of the template, relative to the bundle root.
+
+        Returns:
+            cElementTree.Element holding the output, wrapped in a <div>.
+        """
+        self._bind(handler)
+        template_path = re.sub('^/+', '', path)
+        base_path = os.path.dirname(template_path)
+        base_file = os.path.basename(template_path)
+        template_environ = self._get_template_environ(base_path)
+
+        source, filename, _ = template_environ.loader.get_source(
+            template_environ, base_file)
+        key = (
+            models.MemcacheManager.get_namespace(),
+            handler.app_context.get_current_locale(),
+            handler.template_value.get(utils.COURSE_BASE_KEY),
+            filename, hashlib.md5(source.encode('utf-8')).hexdigest())
+        cache = ProcessScopedIncludeCache.instance()
+        cached = cache.get(key)
+        if cached is not None and cached is not cache.NOT_CACHEABLE:
+            INCLUDE_CACHE_HIT.inc()
+            return copy.deepcopy(cached)
+
+        INCLUDE_CACHE_MISS.inc()
+        tree = self._render(template_environ, base_file, base_path)
+        if cached is None:
+            if self._is_student_independent(template_environ, source):
+                cache.put(key, copy.deepcopy(tree))
+            else:
+                cache.put(key, cache.NOT_CACHEABLE)
+        return tree
+
+
+class Include(CoreTag):
+
+    def render(self, node, handler):
+        return IncludeRenderer.instance().render(
+            handler, node.attrib.get('path'))
+
     def get_icon_url(self):
         return self.create_icon_url('include.png')
 
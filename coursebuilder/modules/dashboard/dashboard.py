@@ -17,7 +17,6 @@
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 import collections
-import copy
 import datetime
 import jinja2
 import logging
@@ -1184,17 +1183,13 @@ class DashboardHandler(
     def _get_question_locations(self, quid, location_maps, used_by_groups):
         """Calculates the locations of a question and its containing groups."""
         (qulocations_map, qglocations_map) = location_maps
-        locations = qulocations_map.get(quid, None)
-        if locations is None:
-            locations = {'lessons': {}, 'assessments': {}}
-        else:
-            locations = copy.deepcopy(locations)
-        # At this point locations holds counts of the number of times quid
-        # appears in each lesson and assessment. Now adjust the counts by
-        # counting the number of times quid appears in a question group in that
-        # lesson or assessment.
-        lessons = locations['lessons']
-        assessments = locations['assessments']
+        # Counts of the number of times quid appears in each lesson and
+        # assessment, in new dicts: the maps are shared by all questions.
+        locations = qulocations_map.get(quid, {})
+        lessons = dict(locations.get('lessons', {}))
+        assessments = dict(locations.get('assessments', {}))
+        # Now adjust the counts by counting the number of times quid appears
+        # in a question group in that lesson or assessment.
         for group in used_by_groups:
             qglocations = qglocations_map.get(group.id, None)
             if not qglocations:
@@ -1204,7 +1199,7 @@ class DashboardHandler(
             for assessment in qglocations['assessments']:
                 assessments[assessment] = assessments.get(assessment, 0) + 1
 
-        return locations
+        return {'lessons': lessons, 'assessments': assessments}
 
     def list_questions(self, all_questions, all_question_groups, location_maps):
         """Prepare a list of the question bank contents."""
@@ -1254,6 +1249,10 @@ class DashboardHandler(
             for quid in group.question_ids:
                 question_to_group.setdefault(long(quid), []).append(group)
 
+        # The same on every row, so rendered once and shared.
+        preview_button = self._create_preview_button().freeze()
+        add_to_group_button = self._create_add_to_group_button().freeze()
+
         for question in all_questions:
             tr = safe_dom.Element('tr', data_quid=str(question.id))
             # Add description including action icons
@@ -1261,7 +1260,7 @@ class DashboardHandler(
             tr.add_child(td)
             td.add_child(self._create_edit_button(
                 'dashboard?action=edit_question&key=%s' % question.id))
-            td.add_child(self._create_preview_button())
+            td.add_child(preview_button)
             td.add_child(self._create_clone_button(question.id))
             td.add_text(question.description)
 
@@ -1269,7 +1268,7 @@ class DashboardHandler(
             used_by_groups = question_to_group.get(question.id, [])
             cell = safe_dom.Element('td', className='groups')
             if all_question_groups:
-                cell.add_child(self._create_add_to_group_button())
+                cell.add_child(add_to_group_button)
             cell.add_child(self._create_list(
                 [safe_dom.Text(group.description) for group in sorted(
                     used_by_groups, key=lambda g: g.description)]
@@ -16,10 +16,10 @@
 
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
-import ast
 import datetime
 
 from mapreduce import context
+from mapreduce import operation
 
 from common import crypto
 from common import schema_fields
@@ -27,9 +27,11 @@ from common import tags
 from models import courses
 from models import data_sources
 from models import entities
+from models import event_partitions
 from models import event_transforms
 from models import jobs
 from models import models
+from models import record_codec
 from models import transforms
 from tools import verify
 
@@ -48,16 +50,19 @@ class QuestionAnswersEntity(entities.BaseEntity):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.id_or_name()))
 
 
-class RawAnswersGenerator(jobs.MapReduceJob):
+class RawAnswersGenerator(event_partitions.PartitionedEventsJob):
     """Extract answers from all event types into QuestionAnswersEntity table."""
 
+    RECORD_CODEC = record_codec.TypedRecordCodec
+    MAP_BATCH_SIZE = 100
+    EVENT_SOURCES = ('submit-assessment', 'attempt-lesson', 'tag-assessment')
+
     @staticmethod
     def get_description():
         return 'raw question answers'
 
-    @staticmethod
-    def entity_class():
-        return models.EventEntity
+    def get_event_sources_wanted(self):
+        return list(self.EVENT_SOURCES)
 
     def build_additional_mapper_params(self, app_context):
         return {
@@ -77,10 +82,7 @@ class RawAnswersGenerator(jobs.MapReduceJob):
     def map(event):
         """Extract question responses from all event types providing them."""
 
-        if event.source not in (
-            'submit-assessment',
-            'attempt-lesson',
-            'tag-assessment'):
+        if event.source not in RawAnswersGenerator.EVENT_SOURCES:
             return
 
         # Fetch global params set up in build_additional_mapper_params(), above.
@@ -123,15 +125,23 @@ class RawAnswersGenerator(jobs.MapReduceJob):
 
         yield (event.user_id, [list(answer) for answer in answers])
 
+    @staticmethod
+    def combine_in_mapper(unused_key, combined, answers):
+        if combined is None:
+            return list(answers)
+        combined.extend(answers)
+        return combined
+
     @staticmethod
     def reduce(key, answers_lists):
         """Does not produce output to Job.  Instead, stores values to DB."""
 
         answers = []
         for data in answers_lists:
-            answers += ast.literal_eval(data)
+            answers += data
         data = transforms.dumps(answers)
-        QuestionAnswersEntity(key_name=key, data=data).put()
+        # Puts are batched by the map/reduce framework.
+        yield operation.db.Put(QuestionAnswersEntity(key_name=key, data=data))
 
 
 class RawAnswersDataSource(data_sources.AbstractDbTableRestDataSource):
@@ -486,6 +496,9 @@ class OrderedQuestionsDataSource(data_sources.SynchronousQuery):
 
 class StudentAnswersStatsGenerator(jobs.MapReduceJob):
 
+    RECORD_CODEC = record_codec.TypedRecordCodec
+    MAP_BATCH_SIZE = 100
+
     @staticmethod
     def get_description():
         return 'student answers'
@@ -542,36 +555,51 @@ class StudentAnswersStatsGenerator(jobs.MapReduceJob):
             # XBlocks responses.  Do that in a follow-on CL.
 
     @staticmethod
-    def reduce(key, answers_and_score_list):
+    def combine_in_mapper(key, combined, answers_and_score):
+        """Counts answers into a pair of correct and incorrect histograms."""
+        if combined is None:
+            combined = ({}, {})
+        correct_answers, incorrect_answers = combined
+        question_type = StudentAnswersStatsGenerator.parse_key(key)[3]
+        answers, score = answers_and_score
+        if question_type == 'SaQuestion':
+            if score > 0:
+                # Note: 'answers' only contains one item (not a list) for
+                # SaQuestion.
+                correct_answers.setdefault(answers, 0)
+                correct_answers[answers] += 1
+            else:
+                incorrect_answers.setdefault(answers, 0)
+                incorrect_answers[answers] += 1
+        elif question_type == 'McQuestion':
+            # For multiple-choice questions, we only get one overall score
+            # for the question as a whole.  This means that some choices
+            # may be incorrect.  Happily, though, the only reason we care
+            # about the distinction between correct/incorrect is to limit
+            # the quantity of output for incorrect answers.  Since
+            # multiple-choice questions are inherently limited, just
+            # call all of the answers 'correct'.
+            for sub_answer in answers:
+                correct_answers.setdefault(sub_answer, 0)
+                correct_answers[sub_answer] += 1
+        return combined
+
+    @staticmethod
+    def reduce(key, histograms):
         correct_answers = {}
         incorrect_answers = {}
-        unit_id, sequence, question_id, question_type = (
+        unit_id, sequence, question_id, unused_question_type = (
             StudentAnswersStatsGenerator.parse_key(key))
         unit_id = int(unit_id)
         question_id = long(question_id)
 
-        for packed_data in answers_and_score_list:
-            answers, score = ast.literal_eval(packed_data)
-            if question_type == 'SaQuestion':
-                if score > 0:
-                    # Note: 'answers' only contains one item (not a list) for
-                    # SaQuestion.
-                    correct_answers.setdefault(answers, 0)
-                    correct_answers[answers] += 1
-                else:
-                    incorrect_answers.setdefault(answers, 0)
-                    incorrect_answers[answers] += 1
-            elif question_type == 'McQuestion':
-                # For multiple-choice questions, we only get one overall score
-                # for the question as a whole.  This means that some choices
-                # may be incorrect.  Happily, though, the only reason we care
-                # about the distinction between correct/incorrect is to limit
-                # the quantity of output for incorrect answers.  Since
-                # multiple-choice questions are inherently limited, just
-                # call all of the answers 'correct'.
-                for sub_answer in answers:
-                    correct_answers.setdefault(sub_answer, 0)
-                    correct_answers[sub_answer] += 1
+        # Merge the histograms built in the mappers by combine_in_mapper().
+        for correct, incorrect in histograms:
+            for answer, count in correct.iteritems():
+                correct_answers[answer] = correct_answers.get(answer, 0) + count
+            for answer, count in incorrect.iteritems():
+                incorrect_answers[answer] = (
+                    incorrect_answers.get(answer, 0) + count)
 
         def build_reduce_dict(unit_id, sequence, question_id, is_valid,
                               answer, count):
@@ -561,7 +561,7 @@ class LabelsOnStudentsDataSource(data_sources.AbstractRestDataSource):
     @classmethod
     def fetch_values(cls, app_context, source_context, schema, log, page_number,
                      labels_on_students_job):
-        label_counts = jobs.MapReduceJob.get_results(labels_on_students_job)
+        label_counts = jobs.MapReduceJob.iter_results(labels_on_students_job)
         counts = {int(x[0]): int(x[1]) for x in label_counts}
         type_titles = {lt.type: lt.title for lt in models.LabelDTO.LABEL_TYPES}
         ret = []
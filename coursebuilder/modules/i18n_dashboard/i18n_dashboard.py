@@ -64,6 +64,7 @@ from modules.oeditor import oeditor
 from tools import verify
 
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 RESOURCES_PATH = '/modules/i18n_dashboard/resources'
 
@@ -2373,8 +2374,95 @@ class TranslationConsoleRestHandler(utils.BaseRESTHandler):
         return binding, sections
 
 
+class I18nProgressJournalEntity(models.BaseEntity):
+    """Parent of the journal of changes; notes whether a run is scheduled."""
+
+    scheduled = db.BooleanProperty(indexed=False, default=False)
+
+
+class I18nProgressJournalEntryEntity(models.BaseEntity):
+    """Resources changed together, whose progress needs updating."""
+
+    # JSON list of the string forms of resource.Key.
+    resource_keys = db.TextProperty(indexed=False)
+
+
+class I18nProgressJournal(object):
+    """Journal of the resources of a course whose progress is out of date.
+
+    Entries all belong to one entity group, so a run sees every entry
+    written before it starts.  The first entry written while no run is
+    scheduled schedules one, in the same transaction; the run unschedules
+    the journal before reading it, so changes made while it runs schedule
+    the next run.
+    """
+
+    KEY_NAME = 'journal'
+
+    @classmethod
+    def _get_parent_key(cls):
+        return db.Key.from_path(
+            I18nProgressJournalEntity.kind(), cls.KEY_NAME)
+
+    @classmethod
+    def append(cls, resource_key_list, schedule):
+        """Adds an entry; calls schedule() in the transaction if needed."""
+        parent_key = cls._get_parent_key()
+        entry = I18nProgressJournalEntryEntity(
+            parent=parent_key, resource_keys=transforms.dumps(
+                [str(resource_key) for resource_key in resource_key_list]))
+
+        def _append():
+            parent = I18nProgressJournalEntity.get(parent_key)
+            if parent is None:
+                parent = I18nProgressJournalEntity(key_name=cls.KEY_NAME)
+            to_put = [entry]
+            if not parent.scheduled:
+                parent.scheduled = True
+                to_put.append(parent)
+                schedule()
+            db.put(to_put)
+
+        db.run_in_transaction(_append)
+
+    @classmethod
+    def take(cls):
+        """Unschedules the journal; returns its entries and resource keys.
+
+        Entries are left in place; delete them once their resources are
+        updated.
+        """
+        parent_key = cls._get_parent_key()
+
+        def _unschedule():
+            parent = I18nProgressJournalEntity.get(parent_key)
+            if parent is not None and parent.scheduled:
+                parent.scheduled = False
+                parent.put()
+
+        db.run_in_transaction(_unschedule)
+        entries = I18nProgressJournalEntryEntity.all().ancestor(
+            parent_key).fetch(None)
+        resource_keys = []
+        seen = set()
+        for entry in entries:
+            for key_str in transforms.loads(entry.resource_keys):
+                if key_str not in seen:
+                    seen.add(key_str)
+                    resource_keys.append(resource.Key.fromstring(key_str))
+        return entries, resource_keys
+
+
 class I18nProgressDeferredUpdater(jobs.DurableJob):
-    """Deferred job to update progress state."""
+    """Deferred job to update progress state.
+
+    Changes are written to the I18nProgressJournal of the course.  A run
+    starts DEBOUNCE_SECONDS after the first change not yet seen by a run,
+    and updates the progress of all the resources changed since the last
+    run, in one batch.
+    """
+
+    DEBOUNCE_SECONDS = 10
 
     @staticmethod
     def is_translatable_course():
@@ -2439,39 +2527,63 @@ class I18nProgressDeferredUpdater(jobs.DurableJob):
     @classmethod
     def update_resource_list(cls, resource_key_list):
         app_context = sites.get_course_for_current_request()
-        cls(app_context, resource_key_list).submit()
+        namespace = app_context.get_namespace_name()
+        with common_utils.Namespace(namespace):
+            I18nProgressJournal.append(
+                resource_key_list, lambda: deferred.defer(
+                    cls.submit_for_namespace, namespace,
+                    _countdown=cls.DEBOUNCE_SECONDS, _transactional=True))
 
-    def __init__(self, app_context, resource_key_list):
-        super(I18nProgressDeferredUpdater, self).__init__(app_context)
-        self._resource_key_list = resource_key_list
+    @classmethod
+    def submit_for_namespace(cls, namespace):
+        """Starts a run for a course; waits if the previous one is active."""
+        app_context = sites.get_app_context_for_namespace(namespace)
+        if cls(app_context).submit() == -1:
+            deferred.defer(cls.submit_for_namespace, namespace,
+                           _countdown=cls.DEBOUNCE_SECONDS)
 
     def run(self):
+        entries, resource_keys = I18nProgressJournal.take()
+
         # Fake a request URL to make sites.get_course_for_current_request work
         sites.set_path_info(self._app_context.slug)
-
         try:
-            for resource_key in self._resource_key_list:
-                self._update_progress_for_resource(resource_key)
+            self._update_progress(resource_keys)
         finally:
             sites.unset_path_info()
+        db.delete(entries)
 
-    def _update_progress_for_resource(self, resource_key):
-        i18n_progress_dto = I18nProgressDAO.load_or_create(str(resource_key))
-        for locale in self._app_context.get_all_locales():
-            if locale != self._app_context.default_locale:
-                key = ResourceBundleKey.from_resource_key(resource_key, locale)
-                self._update_progress_for_locale(key, i18n_progress_dto)
-        I18nProgressDAO.save(i18n_progress_dto)
-
-    def _update_progress_for_locale(self, key, i18n_progress_dto):
+    def _update_progress(self, resource_keys):
+        if not resource_keys:
+            return
+        locales = [
+            locale for locale in self._app_context.get_all_locales()
+            if locale != self._app_context.default_locale]
         course = courses.Course(None, app_context=self._app_context)
-        resource_bundle_dto = ResourceBundleDAO.load(str(key))
         transformer = xcontent.ContentTransformer(
             config=I18nTranslationContext.get(self._app_context))
-        _, sections = TranslationConsoleRestHandler.build_sections_for_key(
-            key, course, resource_bundle_dto, transformer)
-        TranslationConsoleRestHandler.update_dtos_with_section_data(
-            key, sections, resource_bundle_dto, i18n_progress_dto)
+
+        progress_dtos = I18nProgressDAO.bulk_load(
+            [str(resource_key) for resource_key in resource_keys])
+        bundle_keys = [
+            str(ResourceBundleKey.from_resource_key(resource_key, locale))
+            for resource_key in resource_keys for locale in locales]
+        bundles = dict(zip(
+            bundle_keys, ResourceBundleDAO.bulk_load(bundle_keys)))
+
+        for index, resource_key in enumerate(resource_keys):
+            if progress_dtos[index] is None:
+                progress_dtos[index] = I18nProgressDAO.create_blank(
+                    resource_key)
+            for locale in locales:
+                key = ResourceBundleKey.from_resource_key(resource_key, locale)
+                resource_bundle_dto = bundles[str(key)]
+                _, sections = (
+                    TranslationConsoleRestHandler.build_sections_for_key(
+                        key, course, resource_bundle_dto, transformer))
+                TranslationConsoleRestHandler.update_dtos_with_section_data(
+                    key, sections, resource_bundle_dto, progress_dtos[index])
+        I18nProgressDAO.save_all(progress_dtos)
 
 
 class LazyTranslator(object):
@@ -14,7 +14,8 @@
 
 """Notification module.
 
-Provides Manager.send_async, which sends notifications; and Manager.query, which
+Provides Manager.send_async, which sends notifications; Manager.send_many, which
+sends the same notification to many recipients; and Manager.query, which
 queries the current status of notifications.
 
 Notifications are transported by email. Every message you send consumes email
@@ -88,17 +89,30 @@ _LOG = logging.getLogger('modules.notifications.notifications')
 logging.basicConfig()
 
 
+# Tasks of Manager.send_many() are run by the deferred handler, which
+# app.yaml installs at this URL and which reads payloads of this type.
+_DEFERRED_TASK_HEADERS = {'Content-Type': 'application/octet-stream'}
+_DEFERRED_TASK_URL = '/_ah/queue/deferred'
+# Queue the tasks of Manager.send_many() go to; send_async() uses the same.
+_QUEUE_NAME = 'default'
+
 _APP_ENGINE_MAIL_FATAL_ERRORS = frozenset([
     mail_errors.BadRequestError, mail_errors.InvalidSenderError,
 ])
 _ENQUEUED_BUFFER_MULTIPLIER = 1.5
 _KEY_DELIMITER = ':'
+# Maximum number of entities written by one datastore put() call.
+_MAX_ENTITIES_PER_PUT = 500
+# Maximum number of tasks taskqueue.Queue.add() accepts in one call.
+_MAX_TASKS_PER_ADD = 100
 _MAX_ENQUEUED_HOURS = 3
 _MAX_RETRY_DAYS = 3
 # Number of times past which recoverable failure of send_mail() calls becomes
 # hard failure. Used as a brake on runaway queues. Should be larger than the
 # expected cap on the number of retries imposed by taskqueue.
 _RECOVERABLE_FAILURE_CAP = 20
+# Number of messages sent by one task enqueued by Manager.send_many().
+_SEND_MANY_MESSAGES_PER_TASK = 10
 _SECONDS_PER_HOUR = 60 * 60
 _SECONDS_PER_DAY = 24 * _SECONDS_PER_HOUR
 _USECS_PER_SECOND = 10 ** 6
@@ -123,6 +137,22 @@ COUNTER_SEND_ASYNC_SUCCESS = counters.PerfCounter(
     'gcb-notifications-send-async-success',
     'number of times send_async succeeded'
 )
+COUNTER_SEND_MANY_START = counters.PerfCounter(
+    'gcb-notifications-send-many-called',
+    'number of times send_many has been called'
+)
+COUNTER_SEND_MANY_SUCCESS = counters.PerfCounter(
+    'gcb-notifications-send-many-success',
+    'number of times send_many succeeded'
+)
+COUNTER_SEND_MAIL_GROUP_TASK_STARTED = counters.PerfCounter(
+    'gcb-notifications-send-mail-group-task-started',
+    'number of times the send mail group task has been started'
+)
+COUNTER_SEND_MAIL_GROUP_TASK_FAILED = counters.PerfCounter(
+    'gcb-notifications-send-mail-group-task-failed',
+    'number of times the send mail group task failed, but could be retried'
+)
 COUNTER_SEND_MAIL_TASK_FAILED = counters.PerfCounter(
     'gcb-notifications-send-mail-task-failed',
     'number of times the send mail task failed, but could be retried'
@@ -429,11 +459,157 @@ class Manager(object):
 
         deferred.defer(
             cls._transactional_send_mail_task, notification_key, payload_key,
-            _retry_options=cls._get_retry_options())
+            _queue=_QUEUE_NAME, _retry_options=cls._get_retry_options())
         COUNTER_SEND_ASYNC_SUCCESS.inc()
 
         return notification_key, payload_key
 
+    @classmethod
+    def send_many(
+            cls, to, sender, intent, body, subject, audit_trail=None,
+            retention_policy=None):
+        """Asyncronously sends the same notification to many recipients.
+
+        Equivalent to calling send_async() once per recipient, but the
+        notification and payload entities are written with batched datastore
+        puts, and the messages are sent by tasks that each handle a small group
+        of recipients. Tasks are added to the queue in batches.
+
+        Unlike send_async(), entities are not written in a transaction. If a
+        datastore error is raised, some of the entities may have been written
+        but no task has been enqueued; the cron will pick up any notification
+        that was saved.
+
+        Args:
+            to: list of string. Recipient email addresses. Duplicates are sent
+                    only one message. See send_async() for the other args.
+
+        Returns:
+            List of (notification_key, payload_key) 2-tuples, one for each
+            distinct recipient, in the order given in to.
+
+        Raises:
+            Exception: if values delegated to model initializers are invalid.
+            ValueError: if any of to or sender are malformed according to App
+                    Engine (note that well-formed values do not guarantee
+                    success).
+
+        """
+        COUNTER_SEND_MANY_START.inc()
+        enqueue_date = datetime.datetime.utcnow()
+        retention_policy = (
+            retention_policy if retention_policy else RetainAuditTrail)
+
+        recipients = []
+        seen = set()
+        for address in to:
+            if address not in seen:
+                seen.add(address)
+                recipients.append(address)
+
+        for email in [sender] + recipients:
+            if not mail.is_email_valid(email):
+                COUNTER_SEND_ASYNC_FAILED_BAD_ARGUMENTS.inc()
+                raise ValueError('Malformed email address: "%s"' % email)
+
+        if retention_policy.NAME not in _RETENTION_POLICIES:
+            COUNTER_SEND_ASYNC_FAILED_BAD_ARGUMENTS.inc()
+            raise ValueError('Invalid retention policy: ' +
+                             str(retention_policy))
+
+        entities_to_put = []
+        try:
+            for address in recipients:
+                # pylint: disable=unbalanced-tuple-unpacking
+                notification, payload = cls._make_unsaved_models(
+                    audit_trail, body, enqueue_date, intent,
+                    retention_policy.NAME, sender, subject, address,
+                    )
+                cls._mark_enqueued(notification, enqueue_date)
+                entities_to_put.extend([notification, payload])
+        except Exception, e:
+            COUNTER_SEND_ASYNC_FAILED_BAD_ARGUMENTS.inc()
+            raise e
+
+        try:
+            keys = []
+            for start in xrange(
+                    0, len(entities_to_put), _MAX_ENTITIES_PER_PUT):
+                keys.extend(db.put(
+                    entities_to_put[start:start + _MAX_ENTITIES_PER_PUT]))
+        except Exception, e:
+            COUNTER_SEND_ASYNC_FAILED_DATASTORE_ERROR.inc()
+            raise e
+
+        key_pairs = zip(keys[::2], keys[1::2])
+        cls._enqueue_send_mail_group_tasks(key_pairs)
+        COUNTER_SEND_MANY_SUCCESS.inc()
+
+        return key_pairs
+
+    @classmethod
+    def _enqueue_send_mail_group_tasks(cls, key_pairs):
+        tasks = []
+        for start in xrange(0, len(key_pairs), _SEND_MANY_MESSAGES_PER_TASK):
+            # Same wire format as deferred.defer(), so the tasks are run by
+            # the deferred handler.
+            tasks.append(taskqueue.Task(
+                payload=deferred.serialize(
+                    cls._send_mail_group_task,
+                    key_pairs[start:start + _SEND_MANY_MESSAGES_PER_TASK]),
+                url=_DEFERRED_TASK_URL,
+                headers=_DEFERRED_TASK_HEADERS,
+                retry_options=cls._get_retry_options()))
+
+        queue = taskqueue.Queue(_QUEUE_NAME)
+        for start in xrange(0, len(tasks), _MAX_TASKS_PER_ADD):
+            queue.add(tasks[start:start + _MAX_TASKS_PER_ADD])
+
+    @classmethod
+    def _send_mail_group_task(cls, key_pairs):
+        """Sends each message of a group enqueued by send_many().
+
+        Each message is sent in its own transaction and its status is recorded
+        on its own Notification, exactly as done for messages enqueued by
+        send_async(). A message that fails permanently does not stop the rest
+        of the group. If any message fails in a recoverable way, an error is
+        raised once the whole group has been processed so the task is retried;
+        messages that were already sent or failed are skipped on retry.
+
+        Args:
+            key_pairs: list of (notification_key, payload_key) 2-tuples.
+
+        Returns:
+            Dict of notification key string -> Status state string. Messages
+            to be retried are Status.PENDING.
+        """
+        COUNTER_SEND_MAIL_GROUP_TASK_STARTED.inc()
+        results = {}
+        recoverable_exception = None
+
+        for notification_key, payload_key in key_pairs:
+            try:
+                notification = cls._transactional_send_mail_task(
+                    notification_key, payload_key)
+                results[str(notification_key)] = Status.from_notification(
+                    notification).state
+            except deferred.PermanentTaskFailure, e:
+                _LOG.error(
+                    'Permanent failure sending notification with key %s: %s',
+                    str(notification_key), str(e))
+                results[str(notification_key)] = Status.FAILED
+            # Must be vague. pylint: disable=broad-except
+            except Exception, e:
+                recoverable_exception = e
+                results[str(notification_key)] = Status.PENDING
+
+        if recoverable_exception:
+            COUNTER_SEND_MAIL_GROUP_TASK_FAILED.inc()
+            # pylint: disable=raising-bad-type
+            raise recoverable_exception
+
+        return results
+
     @classmethod
     def _make_unsaved_models(
         cls, audit_trail, body, enqueue_date, intent, retention_policy, sender,
@@ -493,7 +669,7 @@ class Manager(object):
                 cls._sent(notification)):
             COUNTER_SEND_MAIL_TASK_SKIPPED.inc()
             COUNTER_SEND_MAIL_TASK_SUCCESS.inc()
-            return
+            return notification
 
         if notification._recoverable_failure_count > _RECOVERABLE_FAILURE_CAP:
             message = (
@@ -578,6 +754,7 @@ class Manager(object):
             COUNTER_SEND_MAIL_TASK_FAILED_PERMANENTLY.inc()
 
         COUNTER_SEND_MAIL_TASK_SUCCESS.inc()
+        return notification
 
     @classmethod
     @db.transactional(
@@ -636,7 +813,7 @@ class Manager(object):
     @classmethod
     def _transactional_send_mail_task(cls, notification_key, payload_key):
         # Can't use decorator because of taskqueue serialization.
-        db.run_in_transaction_options(
+        return db.run_in_transaction_options(
             db.create_transaction_options(xg=True), cls._send_mail_task,
             notification_key, payload_key)
 
@@ -996,5 +1173,12 @@ def register_module():
                 to, sender, intent, body, subject, audit_trail=audit_trail,
                 retention_policy=retention_policy)
 
+        def send_many(
+            self, to, sender, intent, body, subject, audit_trail=None,
+            retention_policy=None):
+            return Manager.send_many(
+                to, sender, intent, body, subject, audit_trail=audit_trail,
+                retention_policy=retention_policy)
+
     services.notifications = Service()
     return custom_module
@@ -120,7 +120,7 @@ class NotificationsDataSource(data_sources.SynchronousQuery):
         now = datetime.datetime.utcnow()
         result = _Result(now)
 
-        for state_name, create_dates in jobs.MapReduceJob.get_results(job):
+        for state_name, create_dates in jobs.MapReduceJob.iter_results(job):
             for create_date in create_dates:
                 result.add(
                     state_name, datetime.datetime.strptime(
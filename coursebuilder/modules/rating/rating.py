@@ -17,11 +17,13 @@
 __author__ = 'John Orr (jorr@google.com)'
 
 import os
+import random
 import urlparse
 
 import jinja2
 
 import appengine_config
+from common import safe_dom
 from common import schema_fields
 from common import tags
 from controllers import lessons
@@ -31,8 +33,10 @@ from models import custom_modules
 from models import data_sources
 from models import models
 from models import transforms
+from modules.dashboard import dashboard
 
 from google.appengine.api import users
+from google.appengine.ext import db
 
 RESOURCES_PATH = '/modules/rating/resources'
 
@@ -45,6 +49,18 @@ EVENT_SRC = 'rating-event'
 TEMPLATES_DIR = os.path.join(
     appengine_config.BUNDLE_ROOT, 'modules', 'rating', 'templates')
 
+# Ratings of the content of each unit are counted over this many shards, so
+# that students rating the same unit at once seldom write the same entity.
+RATING_COUNTER_SHARD_COUNT = 16
+
+# How long the counts of the ratings of a unit are cached in memcache. Counts
+# are dropped from memcache when a rating is recorded, so this only bounds how
+# stale they get if a read races with a rating being recorded.
+RATING_COUNTS_CACHE_TTL_SECS = 60
+
+# The ratings the widget offers, from "Not at all useful" to "Extremely useful".
+RATINGS = range(5)
+
 rating_module = None
 
 
@@ -53,6 +69,10 @@ class StudentRatingProperty(models.StudentPropertyEntity):
 
     PROPERTY_NAME = 'student-rating-property'
 
+    # JSON list of the keys whose rating is in the counts of RatingAggregates.
+    # Ratings recorded before the counts existed are not in them.
+    counted_keys = db.TextProperty(indexed=False)
+
     @classmethod
     def load_or_create(cls, student):
         entity = cls.get(student, cls.PROPERTY_NAME)
@@ -71,6 +91,15 @@ class StudentRatingProperty(models.StudentPropertyEntity):
         value_dict[key] = value
         self.value = transforms.dumps(value_dict)
 
+    def is_counted(self, key):
+        return key in transforms.loads(self.counted_keys or '[]')
+
+    def set_counted(self, key):
+        counted_keys = transforms.loads(self.counted_keys or '[]')
+        if key not in counted_keys:
+            counted_keys.append(key)
+            self.counted_keys = transforms.dumps(counted_keys)
+
 
 class StudentRatingEvent(models.EventEntity):
 
@@ -86,6 +115,166 @@ class StudentRatingEvent(models.EventEntity):
         return model
 
 
+class RatingCounterShard(models.BaseEntity):
+    """One shard of the counts of ratings of the content of a unit.
+
+    The key name is UNIT_ID:SHARD. The counts are a JSON dict of counts by
+    rating, by lesson ID; ratings of the unit page itself are under ''. A
+    student changing their rating moves one count from the old rating to the
+    new one in a single shard, so a count of one shard may be negative; only
+    sums over all the shards are meaningful.
+    """
+
+    counts = db.TextProperty(indexed=False)
+
+    @classmethod
+    def create_key(cls, unit_id, shard):
+        return db.Key.from_path(cls.kind(), '%s:%s' % (unit_id, shard))
+
+    def get_counts(self):
+        return transforms.loads(self.counts or '{}')
+
+    def add_count(self, lesson_id, rating, delta):
+        counts = self.get_counts()
+        lesson_counts = counts.setdefault(lesson_id or '', {})
+        rating = str(rating)
+        lesson_counts[rating] = lesson_counts.get(rating, 0) + delta
+        self.counts = transforms.dumps(counts)
+
+
+class RatingAggregates(object):
+    """Live counts of the ratings of units and lessons."""
+
+    @classmethod
+    def _memcache_key(cls, unit_id):
+        return 'rating-counts:%s' % unit_id
+
+    @classmethod
+    def _load_counts(cls, unit_id):
+        """Sums the counts of all the shards of a unit, by lesson ID."""
+        counts = models.MemcacheManager.get(cls._memcache_key(unit_id))
+        if counts is not None:
+            return counts
+
+        counts = {}
+        for shard in db.get([
+                RatingCounterShard.create_key(unit_id, index)
+                for index in xrange(RATING_COUNTER_SHARD_COUNT)]):
+            if shard is None:
+                continue
+            for lesson_id, lesson_counts in shard.get_counts().iteritems():
+                total_counts = counts.setdefault(lesson_id, {})
+                for rating, count in lesson_counts.iteritems():
+                    total_counts[rating] = total_counts.get(rating, 0) + count
+        models.MemcacheManager.set(
+            cls._memcache_key(unit_id), counts,
+            ttl=RATING_COUNTS_CACHE_TTL_SECS)
+        return counts
+
+    @classmethod
+    def get_summary(cls, unit_id, lesson_id=None):
+        """Summarizes the current ratings of a unit or a lesson.
+
+        Args:
+            unit_id: the ID of the unit.
+            lesson_id: the ID of a lesson of the unit, or None for the ratings
+                of the unit page and of all the lessons of the unit.
+
+        Returns:
+            A dict with the 'count' of ratings, their 'average' (None if there
+            are none) and their 'histogram', a dict of counts by rating.
+        """
+        counts = cls._load_counts(str(unit_id))
+        if lesson_id is None:
+            lessons_counts = counts.values()
+        else:
+            lessons_counts = [counts.get(str(lesson_id), {})]
+
+        histogram = {}
+        for lesson_counts in lessons_counts:
+            for rating in RATINGS:
+                count = lesson_counts.get(str(rating), 0)
+                histogram[str(rating)] = histogram.get(str(rating), 0) + count
+        histogram = dict([
+            (rating, count) for rating, count in histogram.iteritems()
+            if count > 0])
+
+        total = sum(histogram.values())
+        average = None
+        if total:
+            average = sum([
+                float(rating) * count
+                for rating, count in histogram.iteritems()]) / total
+        return {'count': total, 'average': average, 'histogram': histogram}
+
+    @classmethod
+    def _get_counted_item(cls, course, content_url):
+        """Returns the unit and lesson IDs whose counts a rating goes to.
+
+        Both are None if the URL does not name a unit of the course, or names
+        a lesson that is not in the unit; such ratings are not counted.
+        """
+        # pylint: disable=protected-access
+        unit_id, lesson_id = RatingEventDataSource._parse_content_url(
+            content_url)
+        unit = course.find_unit_by_id(unit_id) if unit_id else None
+        if unit is None:
+            return None, None
+        if lesson_id is None:
+            return str(unit.unit_id), None
+        for lesson in course.get_lessons(unit.unit_id):
+            if str(lesson.lesson_id) == lesson_id:
+                return str(unit.unit_id), lesson_id
+        return None, None
+
+    @classmethod
+    def record(cls, course, student, content_url, rating):
+        """Records the rating of a student and updates the counts with it."""
+        assert rating in RATINGS
+        unit_id, lesson_id = cls._get_counted_item(course, content_url)
+        shard_key = None
+        if unit_id is not None:
+            shard_key = RatingCounterShard.create_key(
+                unit_id, random.randrange(RATING_COUNTER_SHARD_COUNT))
+        prop = cls._record_in_txn(
+            student, content_url, rating, shard_key, lesson_id)
+
+        # Memcache is written once the transaction has committed.
+        models.MemcacheManager.set(
+            prop._memcache_key(prop.key().name()), prop)
+        if unit_id is not None:
+            models.MemcacheManager.delete(cls._memcache_key(unit_id))
+
+    @classmethod
+    @db.transactional(xg=True)
+    def _record_in_txn(cls, student, content_url, rating, shard_key,
+                       lesson_id):
+        prop = StudentRatingProperty.get_by_key_name(
+            StudentRatingProperty.create_key(
+                student.user_id, StudentRatingProperty.PROPERTY_NAME))
+        if prop is None:
+            prop = StudentRatingProperty.create(
+                student, StudentRatingProperty.PROPERTY_NAME)
+            prop.value = '{}'
+        old_rating = prop.get_rating(content_url)
+        is_counted = prop.is_counted(content_url)
+        prop.set_rating(content_url, rating)
+        to_put = [prop]
+
+        if shard_key is not None and not (is_counted and old_rating == rating):
+            shard = RatingCounterShard.get(shard_key)
+            if shard is None:
+                shard = RatingCounterShard(key_name=shard_key.name())
+            if is_counted:
+                shard.add_count(lesson_id, old_rating, -1)
+            shard.add_count(lesson_id, rating, 1)
+            prop.set_counted(content_url)
+            to_put.append(shard)
+
+        db.put(to_put)
+        return prop
+
+
 class RatingHandler(utils.BaseRESTHandler):
     """REST handler for recording and displaying rating scores."""
 
@@ -142,9 +331,13 @@ class RatingHandler(utils.BaseRESTHandler):
         additional_comments = payload.get('additional_comments')
 
         if rating is not None:
-            prop = StudentRatingProperty.load_or_create(student)
-            prop.set_rating(key, rating)
-            prop.put()
+            if (not isinstance(rating, (int, long)) or
+                isinstance(rating, bool) or rating not in RATINGS):
+                # I18N: Message displayed when a rating is not one offered.
+                invalid_msg = self.gettext('Invalid rating.')
+                transforms.send_json_response(self, 400, invalid_msg, {})
+                return
+            RatingAggregates.record(self.get_course(), student, key, rating)
 
         StudentRatingEvent.record(EVENT_SRC, self.get_user(), transforms.dumps({
             'key': key,
@@ -279,6 +472,16 @@ def extra_content(app_context):
         template_environ.get_template('widget.html').render(template_data))
 
 
+def course_outline_extra_info_decorator(course, lesson):
+    if not _rating__is_enabled_in_course_settings(course.app_context):
+        return None
+    summary = RatingAggregates.get_summary(lesson.unit_id, lesson.lesson_id)
+    if not summary['count']:
+        return None
+    return safe_dom.Element('span', className='gcb-rating-summary').add_text(
+        '%.1f of 4 (%s ratings)' % (summary['average'], summary['count']))
+
+
 def get_course_settings_fields(unused_course):
     return schema_fields.SchemaField(
         'unit:ratings_module:enabled', 'Ratings widget', 'boolean',
@@ -294,6 +497,10 @@ def register_module():
         ].append(get_course_settings_fields)
         lessons.UnitHandler.EXTRA_CONTENT.append(extra_content)
         data_sources.Registry.register(RatingEventDataSource)
+        dashboard.DashboardHandler.COURSE_OUTLINE_EXTRA_INFO_ANNOTATORS.append(
+            course_outline_extra_info_decorator)
+        dashboard.DashboardHandler.COURSE_OUTLINE_EXTRA_INFO_TITLES.append(
+            'Ratings')
 
     global_routes = [
         (os.path.join(RESOURCES_PATH, 'js', '.*'), tags.JQueryHandler),
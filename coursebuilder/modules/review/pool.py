@@ -0,0 +1,139 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of precomputed candidates for automatic review assignment.
+
+Manager.get_new_review() normally queries the head of the assignment
+candidates query on every call. When many reviewers ask for work at the same
+moment, they all see the same few candidates and most assignment attempts
+collide. The pool instead keeps, for each unit, NUM_SHARDS shards holding
+disjoint, shuffled slices of the head of that query. A reviewer pops from one
+randomly chosen shard inside a single transaction, so concurrent reviewers
+only contend when they pick the same shard.
+
+The pool is a cache: it is refilled in the background from the candidates
+query whenever a shard runs low and whenever a new submission enters review,
+and Manager falls back to the query when the pool cannot satisfy a request.
+
+Like the other entities of the review subsystem, the entity declared here
+should not be used by external clients.
+"""
+
+import random
+
+from common import safe_dom
+from models import config
+from models import counters
+from models import entities
+from google.appengine.ext import db
+
+
+CAN_USE_CANDIDATE_POOL = config.ConfigProperty(
+    'gcb_can_use_review_candidate_pool', bool, safe_dom.Text(
+        'Whether automatic peer review assignment takes candidates from a '
+        'sharded pool that is refilled in the background. This reduces write '
+        'contention when many students request reviews at the same time.'),
+    default_value=False)
+
+COUNTER_POOL_REFILL = counters.PerfCounter(
+    'gcb-pr-candidate-pool-refill',
+    'number of times the review candidate pool of a unit has been refilled')
+COUNTER_POOL_REFILL_CANDIDATES = counters.PerfCounter(
+    'gcb-pr-candidate-pool-refill-candidates',
+    'number of candidates written to review candidate pools')
+
+# Number of shards each unit's pool is split into. More shards mean less
+# contention between concurrent reviewers, but fewer candidates per shard.
+NUM_SHARDS = 8
+# Maximum number of candidates held by each shard.
+SHARD_SIZE = 25
+# A refill is requested once the shard popped from holds fewer candidates.
+REFILL_THRESHOLD = SHARD_SIZE / 4
+
+
+class CandidatePoolShard(entities.BaseEntity):
+    """One shuffled bucket of the assignment candidates of a unit.
+
+    summary_keys and reviewee_keys are parallel lists; the reviewee is kept
+    so candidates for a reviewer's own work can be skipped without loading
+    their review summary.
+    """
+
+    # UTC last modification timestamp.
+    change_date = db.DateTimeProperty(auto_now=True, indexed=False)
+    # Keys of the students who wrote the candidate submissions.
+    reviewee_keys = db.ListProperty(db.Key, indexed=False)
+    # Keys of the peer.ReviewSummary entities of the candidates.
+    summary_keys = db.ListProperty(db.Key, indexed=False)
+    # Identifier of the unit the candidates belong to.
+    unit_id = db.StringProperty(indexed=False)
+
+    # Keys embed student identifiers. The pool is transient, so drop them.
+    _PROPERTY_EXPORT_BLACKLIST = [reviewee_keys, summary_keys]
+
+    @classmethod
+    def key_name(cls, unit_id, shard):
+        """Creates a key_name string for datastore operations."""
+        return '(candidate_pool:%s:%s)' % (unit_id, shard)
+
+    @classmethod
+    def get_keys(cls, unit_id):
+        """Returns the keys of all the shards of the pool of a unit."""
+        return [
+            db.Key.from_path(cls.kind(), cls.key_name(unit_id, shard))
+            for shard in xrange(NUM_SHARDS)]
+
+    def __len__(self):
+        return len(self.summary_keys)
+
+    def remove(self, index):
+        """Removes the candidate at the given index; does not save."""
+        del self.summary_keys[index]
+        del self.reviewee_keys[index]
+
+
+def refill(unit_id, candidates):
+    """Replaces the pool of a unit with the given candidates.
+
+    Args:
+        unit_id: string. Id of the unit the pool belongs to.
+        candidates: [peer.ReviewSummary]. The candidates, best first. At most
+            NUM_SHARDS * SHARD_SIZE of them are kept.
+
+    Returns:
+        Number of candidates written to the pool.
+    """
+    candidates = list(candidates[:NUM_SHARDS * SHARD_SIZE])
+    random.shuffle(candidates)
+    shards = [
+        CandidatePoolShard(
+            key_name=CandidatePoolShard.key_name(unit_id, shard),
+            unit_id=unit_id)
+        for shard in xrange(NUM_SHARDS)]
+    for index, candidate in enumerate(candidates):
+        shard = shards[index % NUM_SHARDS]
+        shard.summary_keys.append(candidate.key())
+        shard.reviewee_keys.append(candidate.reviewee_key)
+
+    entities.put(shards)
+    COUNTER_POOL_REFILL.inc()
+    COUNTER_POOL_REFILL_CANDIDATES.inc(increment=len(candidates))
+    return len(candidates)
+
+
+def choose_shard_keys(unit_id):
+    """Returns the keys of all shards of a unit's pool, in random order."""
+    keys = CandidatePoolShard.get_keys(unit_id)
+    random.shuffle(keys)
+    return keys
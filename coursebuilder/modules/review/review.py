@@ -19,8 +19,11 @@ __author__ = [
 ]
 
 import datetime
+import hashlib
 import random
+import time
 
+from common import utils as common_utils
 from models import counters
 from models import custom_modules
 from models import entities
@@ -29,8 +32,12 @@ from models import utils
 import models.review
 from modules.review import domain
 from modules.review import peer
+from modules.review import pool
 from modules.review import stats
+from google.appengine.api import namespace_manager
+from google.appengine.api import taskqueue
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 
 # In-process increment-only performance counters.
@@ -159,6 +166,18 @@ COUNTER_GET_NEW_REVIEW_SUMMARY_CHANGED = counters.PerfCounter(
     ('number of times get_new_review() rejected a candidate because the review '
      'summary changed during processing'))
 
+COUNTER_GET_NEW_REVIEW_POOL_CONTENTION = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-contention',
+    ('number of times get_new_review() could not pop from a candidate pool '
+     'shard because of concurrent updates'))
+COUNTER_GET_NEW_REVIEW_POOL_MISS = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-miss',
+    ('number of times get_new_review() fell back to querying candidates '
+     'because the candidate pool had none assignable'))
+COUNTER_GET_NEW_REVIEW_POOL_SUCCESS = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-success',
+    'number of times get_new_review() assigned a review from the pool')
+
 COUNTER_GET_REVIEW_STEP_KEYS_BY_KEYS_RETURNED = counters.PerfCounter(
     'gcb-pr-get-review-step-keys-by-keys-returned',
     'number of keys get_review_step_keys_by() returned')
@@ -243,6 +262,14 @@ COUNTER_WRITE_REVIEW_UPDATED_EXISTING_REVIEW = counters.PerfCounter(
 # ceiling, but for now let's allow as many removed results as unremoved.
 _REVIEW_STEP_QUERY_LIMIT = 2 * domain.MAX_UNREMOVED_REVIEW_STEPS
 
+# Maximum number of candidates from one pool shard that are considered in a
+# single assignment transaction. Each costs two entity groups in the
+# transaction, which is limited to 25.
+_POOL_CANDIDATES_PER_ATTEMPT = 5
+# Refills of the candidate pool of a unit are requested at most once per this
+# number of seconds.
+_POOL_REFILL_INTERVAL_SEC = 10
+
 
 class Manager(object):
     """Object that manages the review subsystem."""
@@ -622,6 +649,10 @@ class Manager(object):
         new review assignments per second and because it can raise
         domain.NotAssignableError when there are in fact assignable reviews.
 
+        If pool.CAN_USE_CANDIDATE_POOL is set, we first try to pop a candidate
+        from the unit's candidate pool, and only query as described above if
+        the pool has nothing assignable for the reviewer.
+
         Args:
             unit_id: string. The unit to assign work from.
             reviewer_key: db.Key of models.models.Student. The reviewer to
@@ -647,6 +678,15 @@ class Manager(object):
         """
         try:
             COUNTER_GET_NEW_REVIEW_START.inc()
+            if pool.CAN_USE_CANDIDATE_POOL.value:
+                assigned_key = cls._get_new_review_from_pool(
+                    unit_id, reviewer_key, max_retries)
+                if assigned_key:
+                    COUNTER_GET_NEW_REVIEW_POOL_SUCCESS.inc()
+                    COUNTER_GET_NEW_REVIEW_SUCCESS.inc()
+                    return assigned_key
+                COUNTER_GET_NEW_REVIEW_POOL_MISS.inc()
+
             # Filter out candidates that are for submissions by the reviewer.
             raw_candidates = cls.get_assignment_candidates_query(unit_id).fetch(
                 candidate_count)
@@ -678,6 +718,120 @@ class Manager(object):
             COUNTER_GET_NEW_REVIEW_FAILED.inc()
             raise e
 
+    @classmethod
+    def _get_new_review_from_pool(cls, unit_id, reviewer_key, max_retries):
+        """Attempts to assign a review from the candidate pool of a unit.
+
+        Shards are tried in random order. A shard that is being updated by a
+        concurrent reviewer is skipped rather than waited for.
+
+        Returns:
+            db.Key of peer.ReviewStep, or None if no shard that was tried had
+            an assignable candidate.
+        """
+        refill_needed = False
+        assigned_key = None
+        for shard_key in pool.choose_shard_keys(unit_id)[:max_retries]:
+            try:
+                assigned_key, remaining = cls._attempt_pool_assignment(
+                    shard_key, reviewer_key)
+            except db.TransactionFailedError:
+                COUNTER_GET_NEW_REVIEW_POOL_CONTENTION.inc()
+                continue
+            if remaining < pool.REFILL_THRESHOLD:
+                refill_needed = True
+            if assigned_key:
+                break
+
+        if refill_needed:
+            cls._schedule_candidate_pool_refill(unit_id)
+        return assigned_key
+
+    @classmethod
+    @db.transactional(xg=True, retries=0)
+    def _attempt_pool_assignment(cls, shard_key, reviewer_key):
+        """Pops the first candidate of a shard the reviewer can be assigned.
+
+        Candidates that cannot be assigned to this reviewer, but might be to
+        others, are left in the shard. Candidates whose review summary no
+        longer exists are dropped.
+
+        Returns:
+            (db.Key of peer.ReviewStep or None, int number of candidates left
+            in the shard).
+        """
+        shard = entities.get(shard_key)
+        if not shard:
+            return None, 0
+
+        changed = False
+        assigned_key = None
+        attempts = 0
+        index = 0
+        while index < len(shard) and attempts < _POOL_CANDIDATES_PER_ATTEMPT:
+            if shard.reviewee_keys[index] == reviewer_key:
+                index += 1
+                continue
+
+            attempts += 1
+            COUNTER_GET_NEW_REVIEW_ASSIGNMENT_ATTEMPTED.inc()
+            summary = entities.get(shard.summary_keys[index])
+            if not summary:
+                shard.remove(index)
+                changed = True
+                continue
+
+            assigned_key = cls._assign_review_step(summary, reviewer_key)
+            if assigned_key:
+                shard.remove(index)
+                changed = True
+                break
+            index += 1
+
+        if changed:
+            entities.put(shard)
+        return assigned_key, len(shard)
+
+    @classmethod
+    def refill_candidate_pool(cls, unit_id):
+        """Refills the candidate pool of a unit from the candidates query.
+
+        Args:
+            unit_id: string. Id of the unit to refill the pool of.
+
+        Returns:
+            Number of candidates in the refilled pool.
+        """
+        candidates = cls.get_assignment_candidates_query(unit_id).fetch(
+            pool.NUM_SHARDS * pool.SHARD_SIZE)
+        COUNTER_ASSIGNMENT_CANDIDATES_QUERY_RESULTS_RETURNED.inc(
+            increment=len(candidates))
+        return pool.refill(unit_id, candidates)
+
+    @classmethod
+    def _refill_candidate_pool_task(cls, namespace, unit_id):
+        with common_utils.Namespace(namespace):
+            cls.refill_candidate_pool(unit_id)
+
+    @classmethod
+    def _schedule_candidate_pool_refill(cls, unit_id):
+        """Requests a background refill of the candidate pool of a unit.
+
+        Requests made within the same _POOL_REFILL_INTERVAL_SEC are coalesced
+        into a single task by naming the task after the interval.
+        """
+        namespace = namespace_manager.get_namespace()
+        task_name = 'review-pool-refill-%s-%s' % (
+            hashlib.md5('%s:%s' % (namespace, unit_id)).hexdigest(),
+            int(time.time() / _POOL_REFILL_INTERVAL_SEC))
+        try:
+            deferred.defer(
+                cls._refill_candidate_pool_task, namespace, unit_id,
+                _name=task_name)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
     @classmethod
     def _choose_assignment_candidate(cls, candidates):
         """Seam that allows different choice functions in tests."""
@@ -699,6 +853,16 @@ class Manager(object):
             COUNTER_GET_NEW_REVIEW_SUMMARY_CHANGED.inc()
             return
 
+        return cls._assign_review_step(summary, reviewer_key)
+
+    @classmethod
+    def _assign_review_step(cls, summary, reviewer_key):
+        """Assigns the review of a summary to a reviewer; must be in a txn.
+
+        Returns:
+            db.Key of the assigned peer.ReviewStep, or None if the reviewer
+            already has or had a step for this submission.
+        """
         step = peer.ReviewStep.get_by_key_name(
             peer.ReviewStep.key_name(summary.submission_key, reviewer_key))
 
@@ -916,6 +1080,8 @@ class Manager(object):
             COUNTER_START_REVIEW_PROCESS_FOR_START.inc()
             key = cls._create_review_summary(
                 reviewee_key, submission_key, unit_id)
+            if pool.CAN_USE_CANDIDATE_POOL.value:
+                cls._schedule_candidate_pool_refill(unit_id)
             COUNTER_START_REVIEW_PROCESS_FOR_SUCCESS.inc()
             return key
         except Exception as e:
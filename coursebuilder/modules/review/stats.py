@@ -64,7 +64,7 @@ class PeerReviewStatsSource(data_sources.SynchronousQuery):
         # a ragged right edge.
         counts_by_unit = {}
         max_completed_count = 0
-        for unit_and_count, quantity in jobs.MapReduceJob.get_results(job):
+        for unit_and_count, quantity in jobs.MapReduceJob.iter_results(job):
 
             # Burst values
             unit, completed_count = unit_and_count.rsplit(':')
@@ -16,6 +16,7 @@
 
 __author__ = 'John Orr (jorr@google.com)'
 
+import copy
 import json
 import jinja2
 import logging
@@ -23,6 +24,7 @@ import os
 import time
 
 from collections import defaultdict
+from collections import deque
 
 import appengine_config
 from common import caching
@@ -31,11 +33,13 @@ from common import resource
 from common import safe_dom
 from common import schema_fields
 from common import tags
+from common import utils as common_utils
 from controllers import lessons
 from controllers import sites
 from controllers import utils
 from mapreduce import context
 from models import analytics
+from models import counters
 from models import courses
 from models import custom_modules
 from models import data_sources
@@ -68,6 +72,20 @@ RESOURCES_URI = '/modules/skill_map/resources'
 # Key for storing list of skill id's in the properties table of a Lesson
 LESSON_SKILL_LIST_KEY = 'modules.skill_map.skill_list'
 
+# Memcache key of the stamp identifying the current version of the skills of a
+# course; it is incremented on every write to the skill graph.
+SKILL_GRAPH_VERSION_KEY = 'modules.skill_map.skill_graph_version'
+
+# Maximum number of courses whose skill graphs are cached by each process.
+MAX_CACHED_SKILL_GRAPHS = 64
+
+SKILL_GRAPH_CACHE_HIT = counters.PerfCounter(
+    'gcb-skill-map-skill-graph-cache-hit',
+    'Number of times a skill graph was served from the in-process cache.')
+SKILL_GRAPH_CACHE_MISS = counters.PerfCounter(
+    'gcb-skill-map-skill-graph-cache-miss',
+    'Number of times a skill graph was loaded from the datastore.')
+
 
 def _assert(condition, message, errors):
     """Assert a condition and either log exceptions or raise AssertionError."""
@@ -249,25 +267,224 @@ class TranslatableResourceSkill(
         return ret
 
 
+# Marks topological levels which have not been computed yet.
+_LEVELS_NOT_COMPUTED = object()
+
+
+def _compute_levels(skills, successors):
+    """Computes the topological level of every skill.
+
+    Skills with no prerequisites are at level 0; every other skill is one
+    level above its highest prerequisite.
+
+    Args:
+        skills: dict mapping skill id to Skill.
+        successors: dict mapping skill id to list of successor Skills.
+
+    Returns:
+        dict mapping skill id to int level, or None if the graph has a cycle.
+    """
+    pending = {}
+    frontier = []
+    for skill in skills.values():
+        count = len([pid for pid in skill.prerequisite_ids if pid in skills])
+        pending[skill.id] = count
+        if not count:
+            frontier.append(skill.id)
+
+    levels = {}
+    level = 0
+    while frontier:
+        next_frontier = []
+        for sid in frontier:
+            levels[sid] = level
+            for successor in successors.get(sid, []):
+                pending[successor.id] -= 1
+                if not pending[successor.id]:
+                    next_frontier.append(successor.id)
+        frontier = next_frontier
+        level += 1
+
+    if len(levels) != len(skills):
+        return None
+    return levels
+
+
+def _update_levels(levels, skills, successors, changed_ids):
+    """Updates topological levels after the given skills have changed.
+
+    Only the changed skills and those downstream of them whose level actually
+    moves are visited.
+
+    Args:
+        levels: dict mapping skill id to int level before the change.
+        skills: dict mapping skill id to Skill after the change.
+        successors: dict mapping skill id to list of successor Skills after
+            the change.
+        changed_ids: iterable of ids of the skills added or whose
+            prerequisites were changed.
+
+    Returns:
+        dict mapping skill id to int level, or None if the levels could not be
+        updated incrementally; this is the case when the change made a cycle.
+    """
+    levels = dict(
+        (sid, level) for sid, level in levels.iteritems() if sid in skills)
+    queue = deque(sid for sid in changed_ids if sid in skills)
+    while queue:
+        sid = queue.popleft()
+        prerequisite_levels = [
+            levels.get(pid, 0) for pid in skills[sid].prerequisite_ids
+            if pid in skills]
+        level = max(prerequisite_levels) + 1 if prerequisite_levels else 0
+        if levels.get(sid) == level:
+            continue
+        if level >= len(skills):
+            # Levels keep growing only when they chase each other in a cycle.
+            return None
+        levels[sid] = level
+        queue.extend(successor.id for successor in successors.get(sid, []))
+    return levels
+
+
+class _SkillGraphState(object):
+    """The skills of a course, with the structures derived from them.
+
+    Instances may be shared by all requests of a process, so they are never
+    modified once built. SkillGraph derives a new one on every write.
+    """
+
+    def __init__(self, skills):
+        # dict mapping skill id to skill
+        self.skills = skills
+        # dict mapping skill id to list of successor SkillDTO's
+        self.successors = {}
+        for other in skills.values():
+            for pid in other.prerequisite_ids:
+                self.successors.setdefault(pid, []).append(other)
+        self._levels = _LEVELS_NOT_COMPUTED
+
+    def get_levels(self):
+        """Returns dict mapping skill id to level, or None for a cycle."""
+        if self._levels is _LEVELS_NOT_COMPUTED:
+            self._levels = _compute_levels(self.skills, self.successors)
+        return self._levels
+
+    def derive(self, skills, changed_ids):
+        """Returns the state of the given skills after some have changed.
+
+        Args:
+            skills: dict mapping skill id to Skill after the change.
+            changed_ids: iterable of ids of the skills added or whose
+                prerequisites were changed.
+
+        Returns:
+            _SkillGraphState.
+        """
+        state = _SkillGraphState(skills)
+        if self._levels not in (_LEVELS_NOT_COMPUTED, None):
+            levels = _update_levels(
+                self._levels, skills, state.successors, changed_ids)
+            if levels is not None:
+                state._levels = levels  # pylint: disable=protected-access
+        return state
+
+
+def _on_course_imported(course):
+    """Makes skills copied into a course visible to cached skill graphs."""
+    with common_utils.Namespace(course.app_context.get_namespace_name()):
+        models.MemcacheManager.delete(
+            _SkillDao._memcache_all_key())  # pylint: disable=protected-access
+        models.MemcacheManager.bump_version_stamp(SKILL_GRAPH_VERSION_KEY)
+
+
+class ProcessScopedSkillGraphCache(caching.ProcessScopedSingleton):
+    """This class holds in-process global cache of skill graphs.
+
+    Entries are keyed by namespace and remember the version stamp they were
+    built for; they are only served while that stamp is current.
+    """
+
+    def __init__(self):
+        self._cache = caching.LRUCache(max_item_count=MAX_CACHED_SKILL_GRAPHS)
+
+    @classmethod
+    def can_use(cls):
+        # Translations are stored apart from skills and do not change their
+        # version, so translated skills are always loaded afresh.
+        return (
+            models.CAN_USE_MEMCACHE.value and
+            not i18n_dashboard.is_translation_required())
+
+    def get(self, namespace, version):
+        found, entry = self._cache.get(namespace)
+        if found and entry[0] == version:
+            return entry[1]
+        return None
+
+    def put(self, namespace, version, state):
+        self._cache.put(namespace, (version, state))
+
+
 class SkillGraph(caching.RequestScopedSingleton):
     """Facade to handle the CRUD lifecycle of the skill dependency graph."""
 
     def __init__(self):
-        # dict mapping skill id to skill
-        self._skills = _SkillDao.get_all_mapped()
+        self._version = None
+        self._state = None
+        if ProcessScopedSkillGraphCache.can_use():
+            # The stamp must be read before the skills, so the skills are at
+            # least as recent as the stamp they are cached under.
+            self._version = models.MemcacheManager.get_version_stamp(
+                SKILL_GRAPH_VERSION_KEY)
+            self._state = ProcessScopedSkillGraphCache.instance().get(
+                namespace_manager.get_namespace(), self._version)
+        if self._state:
+            SKILL_GRAPH_CACHE_HIT.inc()
+        elif self._version is not None:
+            SKILL_GRAPH_CACHE_MISS.inc()
+            # The DAO's memcache entry of all skills has no stamp of its own,
+            # and may be older than the stamp, e.g. after a course import; the
+            # graph cached under the stamp is read from the datastore. Skills
+            # are never translated here, so there are no load hooks to run.
+            self._state = _SkillGraphState(dict(
+                (skill.id, skill) for skill in _SkillDao.get_all_iter()))
+            ProcessScopedSkillGraphCache.instance().put(
+                namespace_manager.get_namespace(), self._version, self._state)
+        else:
+            SKILL_GRAPH_CACHE_MISS.inc()
+            self._state = _SkillGraphState(_SkillDao.get_all_mapped())
+
+        # dict mapping skill id to skill; a copy, as the state may be shared
+        self._skills = dict(self._state.skills)
         # dict mapping skill id to list of successor SkillDTO's
-        self._successors = None
-        self._rebuild()
+        self._successors = self._state.successors
+        SkillMap.clear_all()
 
-    def _rebuild(self):
-        self.build_successors()
+    def _rebuild(self, changed_ids):
+        self._state = self._state.derive(dict(self._skills), changed_ids)
+        self._successors = self._state.successors
         SkillMap.clear_all()
 
-    def build_successors(self):
-        self._successors = {}
-        for other in self._skills.values():
-            for pid in other.prerequisite_ids:
-                self._successors.setdefault(pid, []).append(other)
+        # Other processes learn about the write from the new version stamp.
+        # This process can keep the graph it derived, unless another write
+        # got in since the graph was loaded.
+        version = models.MemcacheManager.bump_version_stamp(
+            SKILL_GRAPH_VERSION_KEY)
+        if (version is not None and self._version is not None and
+            version == self._version + 1):
+            ProcessScopedSkillGraphCache.instance().put(
+                namespace_manager.get_namespace(), version, self._state)
+        else:
+            version = None
+        self._version = version
+
+    def _get_for_update(self, skill_id):
+        """Returns a private copy of a skill, safe to modify in place."""
+        skill = self._skills[skill_id]
+        skill = Skill(skill.id, copy.deepcopy(skill.dict))
+        self._skills[skill_id] = skill
+        return skill
 
     @classmethod
     def load(cls):
@@ -300,7 +517,7 @@ class SkillGraph(caching.RequestScopedSingleton):
         skill_id = _SkillDao.save(skill)
         new_skill = Skill(skill_id, skill.dict)
         self._skills[skill_id] = new_skill
-        self._rebuild()
+        self._rebuild([skill_id])
 
         return new_skill
 
@@ -325,7 +542,7 @@ class SkillGraph(caching.RequestScopedSingleton):
 
         skill_id = _SkillDao.save(Skill(sid, attributes))
         self._skills[skill_id] = Skill(skill_id, attributes)
-        self._rebuild()
+        self._rebuild([skill_id])
 
         return skill_id
 
@@ -335,7 +552,9 @@ class SkillGraph(caching.RequestScopedSingleton):
             skill_id in self._skills,
             'Skill is not present in the skill map', errors)
 
-        successors = self.successors(skill_id)
+        successors = [
+            self._get_for_update(successor.id)
+            for successor in self.successors(skill_id)]
         for successor in successors:
             prerequisite_ids = successor.prerequisite_ids
             prerequisite_ids.remove(skill_id)
@@ -346,7 +565,7 @@ class SkillGraph(caching.RequestScopedSingleton):
         _SkillDao.save_all(successors)
 
         del self._skills[skill_id]
-        self._rebuild()
+        self._rebuild([successor.id for successor in successors])
 
     def prerequisites(self, skill_id):
         """Get the immediate prerequisites of the given skill.
@@ -384,7 +603,7 @@ class SkillGraph(caching.RequestScopedSingleton):
     def add_prerequisite(self, skill_id, prerequisite_skill_id, errors=None):
         self._validate_prerequisite(skill_id, prerequisite_skill_id, errors)
 
-        skill = self._skills.get(skill_id)
+        skill = self._get_for_update(skill_id)
         prerequisite_skills = skill.prerequisite_ids
         _assert(
             prerequisite_skill_id not in prerequisite_skills,
@@ -394,7 +613,7 @@ class SkillGraph(caching.RequestScopedSingleton):
         skill._set_prerequisite_ids(prerequisite_skills)
 
         _SkillDao.save(skill)
-        self._rebuild()
+        self._rebuild([skill_id])
 
     def delete_prerequisite(self, skill_id, prerequisite_skill_id, errors=None):
         _assert(
@@ -403,7 +622,7 @@ class SkillGraph(caching.RequestScopedSingleton):
             prerequisite_skill_id in self._skills,
             'Prerequisite does not exist', errors)
 
-        skill = self._skills[skill_id]
+        skill = self._get_for_update(skill_id)
         prerequisite_skills = skill.prerequisite_ids
         _assert(
             prerequisite_skill_id in prerequisite_skills,
@@ -413,7 +632,7 @@ class SkillGraph(caching.RequestScopedSingleton):
         skill._set_prerequisite_ids(prerequisite_skills)
 
         _SkillDao.save(skill)
-        self._rebuild()
+        self._rebuild([skill_id])
 
     def successors(self, skill_id):
         """Get the immediate successors of the given skill.
@@ -426,6 +645,19 @@ class SkillGraph(caching.RequestScopedSingleton):
         """
         return self._successors.get(skill_id, [])
 
+    def topological_levels(self):
+        """Get the level of every skill in topological order.
+
+        Skills with no prerequisites are at level 0; every other skill is one
+        level above its highest prerequisite. Levels are kept up to date
+        incrementally as the graph is edited.
+
+        Returns:
+            dict mapping skill id to int level, or None if the graph has a
+            cycle.
+        """
+        return self._state.get_levels()
+
 
 class LocationInfo(object):
     """Info object for mapping skills to content locations."""
@@ -592,33 +824,25 @@ class SkillMap(caching.RequestScopedSingleton):
 
     def _topo_sort(self):
         """Returns topologically sorted co-sets."""
-        successors = self.build_successors()
-        ret = []
-        co_set = set(
-            successors.keys()) - reduce(
-            set.union, successors.values())  # Skills with no prerequisites.
-        while True:
-            if not co_set:
-                break
-            ret.append(co_set)
-            for x in co_set:
-                del successors[x]
-            for src, dst in successors.items():
-                successors[src] = dst - co_set
-            co_set = set(successors.keys()) - reduce(
-                set.union, successors.values(), set())
-        if successors:  # There is unvisited nodes -> there is a cycle.
+        levels = self._skill_graph.topological_levels()
+        if levels is None:  # There is a cycle.
             return None
-        else:
-            return ret
+        ret = []
+        for skill_id, level in levels.iteritems():
+            while len(ret) <= level:
+                ret.append(set())
+            ret[level].add(skill_id)
+        return ret
 
     def _set_topological_sort_index(self):
         chain = []
         for x in self._topo_sort():
-            chain.extend(list(x))
+            chain.extend(sorted(x))
+        chain_index = dict(
+            (skill_id, index) for index, skill_id in enumerate(chain))
         for skill in self._skill_graph.skills:
             self._skill_infos[skill.id].set_topo_sort_index(
-                chain.index(skill.id))
+                chain_index[skill.id])
 
     @classmethod
     def load(cls, course):
@@ -1119,9 +1343,9 @@ class SkillMapDataSource(data_sources.SynchronousQuery):
             skill name, count of completions, counts of 'in progress'
         Adds a row for each skill in the output of CountSkillCompletion job.
         """
-        result = jobs.MapReduceJob.get_results(counts_generator)
         # remove the id of the skill
-        result = [i[1:] for i in result]
+        result = [
+            i[1:] for i in jobs.MapReduceJob.iter_results(counts_generator)]
         template_values['counts'] = transforms.dumps(sorted(result))
 
 
@@ -1340,6 +1564,12 @@ def post_update_progress(course, student, lprogress, event_entity, event_key):
         student, lprogress, lesson_id)
 
 
+def prefetch_skill_completion(unused_handler, user):
+    """Adds the skill progress of the user to what pages prefetch."""
+    return [models.StudentPropertyEntity.get_prefetch_key(
+        user.user_id(), SkillCompletionTracker.PROPERTY_KEY)]
+
+
 def register_tabs():
     tabs.Registry.register(
         'skill_map', 'skills_table', 'Skills Table',
@@ -1571,6 +1801,7 @@ def notify_module_enabled():
     WelcomeHandler.COPY_SAMPLE_COURSE_HOOKS.append(
         welcome_handler_import_skills_callback)
     courses.ADDITIONAL_ENTITIES_FOR_COURSE_IMPORT.add(_SkillEntity)
+    courses.Course.POST_IMPORT_HOOKS.append(_on_course_imported)
 
     courses.Course.OPTIONS_SCHEMA_PROVIDERS.setdefault(
         courses.Course.SCHEMA_SECTION_COURSE, []).append(
@@ -1578,6 +1809,7 @@ def notify_module_enabled():
 
     progress.UnitLessonCompletionTracker.POST_UPDATE_PROGRESS_HOOK.append(
         post_update_progress)
+    utils.CourseHandler.PREFETCH_HOOKS.append(prefetch_skill_completion)
 
     data_sources.Registry.register(SkillMapDataSource)
 
@@ -38,7 +38,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.admin_settings.HtmlHookTest': 17,
     'tests.functional.admin_settings.JinjaContextTest': 2,
     'tests.functional.admin_settings.WelcomePageTests': 6,
-    'tests.functional.assets_rest.AssetsRestTest': 13,
+    'tests.functional.assets_rest.AssetsRestTest': 14,
     'tests.functional.common_crypto.EncryptionManagerTests': 5,
     'tests.functional.common_crypto.XsrfTokenManagerTests': 3,
     'tests.functional.common_crypto.PiiObfuscationHmac': 2,
@@ -58,18 +58,26 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_analytics.ProgressAnalyticsTest': 8,
     'tests.functional.model_analytics.QuestionAnalyticsTest': 3,
     'tests.functional.model_courses.CourseCachingTest': 5,
+    'tests.functional.model_courses.QuestionUsageIndexTest': 4,
     'tests.functional.model_data_sources.PaginatedTableTest': 17,
     'tests.functional.model_data_sources.PiiExportTest': 4,
-    'tests.functional.model_entities.BaseEntityTestCase': 3,
+    'tests.functional.model_entities.BaseEntityTestCase': 4,
     'tests.functional.model_entities.ExportEntityTestCase': 2,
     'tests.functional.model_entities.EntityTransformsTest': 4,
+    'tests.functional.model_event_partitions.PartitionedEventsJobTest': 2,
     'tests.functional.model_jobs.JobOperationsTest': 15,
+    'tests.functional.model_jobs.MapCombiningTest': 2,
+    'tests.functional.model_jobs.MapReduceResultsTest': 3,
+    'tests.functional.model_jobs.PartitionedInputReaderTest': 2,
+    'tests.functional.model_jobs.ShardPlanTest': 4,
     'tests.functional.model_models.BaseJsonDaoTestCase': 1,
-    'tests.functional.model_models.ContentChunkTestCase': 15,
-    'tests.functional.model_models.EventEntityTestCase': 1,
-    'tests.functional.model_models.MemcacheManagerTestCase': 4,
+    'tests.functional.model_models.ContentChunkTestCase': 17,
+    'tests.functional.model_models.EventEntityTestCase': 2,
+    'tests.functional.model_models.LabelDAOTestCase': 3,
+    'tests.functional.model_models.MemcacheManagerTestCase': 8,
     'tests.functional.model_models.PersonalProfileTestCase': 1,
     'tests.functional.model_models.QuestionDAOTestCase': 3,
+    'tests.functional.model_models.RequestPrefetchTestCase': 1,
     'tests.functional.model_models.StudentAnswersEntityTestCase': 1,
     'tests.functional.model_models.StudentProfileDAOTestCase': 6,
     'tests.functional.model_models.StudentPropertyEntityTestCase': 1,
@@ -78,12 +86,13 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_student_work.ReviewTest': 3,
     'tests.functional.model_student_work.SubmissionTest': 3,
     'tests.functional.model_utils.QueryMapperTest': 4,
-    'tests.functional.model_vfs.VfsLargeFileSupportTest': 6,
+    'tests.functional.model_vfs.VfsLargeFileSupportTest': 7,
     'tests.functional.module_config_test.ManipulateAppYamlFileTest': 8,
     'tests.functional.module_config_test.ModuleIncorporationTest': 8,
     'tests.functional.module_config_test.ModuleManifestTest': 7,
     'tests.functional.modules_admin.AdminDashboardTabTests': 4,
-    'tests.functional.modules_analytics.StudentAggregateTest': 6,
+    'tests.functional.modules_analytics.StudentAggregateTest': 7,
+    'tests.functional.modules_announcements.AnnouncementsFeedTest': 3,
     'tests.functional.modules_balancer.ExternalTaskTest': 3,
     'tests.functional.modules_balancer.ManagerTest': 10,
     'tests.functional.modules_balancer.ProjectRestHandlerTest': 5,
@@ -93,9 +102,9 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_certificate.CertificateCriteriaTestCase': 6,
     'tests.functional.modules_code_tags.CodeTagTests': 4,
     'tests.functional.modules_core_tags.GoogleDriveRESTHandlerTest': 8,
-    'tests.functional.modules_core_tags.GoogleDriveTagRendererTest': 6,
+    'tests.functional.modules_core_tags.GoogleDriveTagRendererTest': 7,
     'tests.functional.modules_core_tags.RuntimeTest': 13,
-    'tests.functional.modules_core_tags.TagsInclude': 8,
+    'tests.functional.modules_core_tags.TagsInclude': 10,
     'tests.functional.modules_core_tags.TagsMarkdown': 1,
     'tests.functional.modules_courses.AccessDraftsTestCase': 2,
     'tests.functional.modules_dashboard.CourseOutlineTestCase': 1,
@@ -115,7 +124,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_i18n_dashboard.IsTranslatableRestHandlerTests': 3,
     'tests.functional.modules_i18n_dashboard.I18nDashboardHandlerTests': 4,
     'tests.functional.modules_i18n_dashboard'
-        '.I18nProgressDeferredUpdaterTests': 5,
+        '.I18nProgressDeferredUpdaterTests': 6,
     'tests.functional.modules_i18n_dashboard.LazyTranslatorTests': 5,
     'tests.functional.modules_i18n_dashboard.ResourceBundleKeyTests': 2,
     'tests.functional.modules_i18n_dashboard.ResourceRowTests': 6,
@@ -140,7 +149,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_math.MathTagTests': 3,
     'tests.functional.modules_notifications.CronTest': 9,
     'tests.functional.modules_notifications.DatetimeConversionTest': 1,
-    'tests.functional.modules_notifications.ManagerTest': 31,
+    'tests.functional.modules_notifications.ManagerTest': 34,
     'tests.functional.modules_notifications.NotificationTest': 8,
     'tests.functional.modules_notifications.PayloadTest': 6,
     'tests.functional.modules_notifications.SerializedPropertyTest': 2,
@@ -150,13 +159,13 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_questionnaire.QuestionnaireTagTests': 3,
     'tests.functional.modules_questionnaire.QuestionnaireRESTHandlerTests': 5,
     'tests.functional.modules_rating.ExtraContentProvideTests': 4,
-    'tests.functional.modules_rating.RatingHandlerTests': 15,
+    'tests.functional.modules_rating.RatingHandlerTests': 18,
     'tests.functional.modules_search.SearchTest': 12,
     'tests.functional.modules_skill_map.CountSkillCompletionsTests': 3,
     'tests.functional.modules_skill_map.LocationListRestHandlerTests': 2,
     'tests.functional.modules_skill_map.SkillAggregateRestHandlerTests': 6,
     'tests.functional.modules_skill_map.SkillCompletionTrackerTests': 6,
-    'tests.functional.modules_skill_map.SkillGraphTests': 11,
+    'tests.functional.modules_skill_map.SkillGraphTests': 14,
     'tests.functional.modules_skill_map.SkillI18nTests': 5,
     'tests.functional.modules_skill_map.SkillMapAnalyticsTabTests': 2,
     'tests.functional.modules_skill_map.SkillMapHandlerTests': 4,
@@ -176,7 +185,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.modules_usage_reporting.MessagingTests': 8,
     'tests.functional.modules_usage_reporting.UsageReportingTests': 3,
     'tests.functional.progress_percent.ProgressPercent': 4,
-    'tests.functional.review_module.ManagerTest': 55,
+    'tests.functional.review_module.ManagerTest': 59,
     'tests.functional.review_peer.ReviewStepTest': 3,
     'tests.functional.review_peer.ReviewSummaryTest': 5,
     'tests.functional.student_answers.StudentAnswersAnalyticsTest': 1,
@@ -229,7 +238,7 @@ ALL_TEST_CLASSES = {
     'tests.unit.common_schema_fields.FieldRegistryTests': 7,
     'tests.unit.common_safe_dom.NodeListTests': 4,
     'tests.unit.common_safe_dom.TextTests': 2,
-    'tests.unit.common_safe_dom.ElementTests': 17,
+    'tests.unit.common_safe_dom.ElementTests': 21,
     'tests.unit.common_safe_dom.ScriptElementTests': 3,
     'tests.unit.common_safe_dom.EntityTests': 11,
     'tests.unit.common_tags.CustomTagTests': 13,
@@ -237,10 +246,14 @@ ALL_TEST_CLASSES = {
     'tests.unit.common_utils.ZipAwareOpenTests': 2,
     'tests.unit.javascript_tests.AllJavaScriptTests': 9,
     'tests.unit.models_analytics.AnalyticsTests': 5,
+    'tests.unit.models_counters.LatencyHistogramTests': 3,
     'tests.unit.models_courses.WorkflowValidationTests': 13,
+    'tests.unit.models_record_codec.TypedRecordCodecTests': 3,
     'tests.unit.models_transforms.JsonToDictTests': 13,
     'tests.unit.models_transforms.JsonParsingTests': 3,
     'tests.unit.models_transforms.StringValueConversionTests': 2,
+    'tests.unit.models_vfs.LocalFileManifestTests': 2,
+    'tests.unit.modules_analytics.PageEventAggregatorTests': 2,
     'tests.unit.modules_dashboard.TabTests': 6,
     'tests.unit.modules_search.ParserTests': 10,
     'tests.unit.test_classes.DeepDictionaryMergeTest': 5,
@@ -17,6 +17,7 @@
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
 import cgi
+import hashlib
 import os
 import urllib
 
@@ -223,3 +224,40 @@ class AssetsRestTest(actions.TestBase):
         asset_url = '/%s/%s/%s' % (COURSE_NAME, base, name)
         response = self.get(asset_url, expect_errors=True)
         self.assertEquals(404, response.status_int)
+
+    def test_conditional_and_range_requests(self):
+        base = 'assets/img'
+        name = 'foo.jpg'
+        content = '0123456789'
+        _post_asset(self, base, name, name, content)
+        asset_url = '/%s/%s/%s' % (COURSE_NAME, base, name)
+
+        response = self.get(asset_url)
+        self.assertEquals(content, response.body)
+        self.assertEquals('bytes', response.headers['Accept-Ranges'])
+        etag = response.headers['ETag']
+        self.assertEquals('"%s"' % hashlib.sha1(content).hexdigest(), etag)
+
+        response = self.get(asset_url, headers={'If-None-Match': etag})
+        self.assertEquals(304, response.status_int)
+        self.assertEquals('', response.body)
+        response = self.get(asset_url, headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEquals(304, response.status_int)
+        response = self.get(asset_url, headers={'If-None-Match': '"other"'})
+        self.assertEquals(200, response.status_int)
+
+        response = self.get(asset_url, headers={'Range': 'bytes=2-4'})
+        self.assertEquals(206, response.status_int)
+        self.assertEquals('234', response.body)
+        self.assertEquals('bytes 2-4/10', response.headers['Content-Range'])
+        response = self.get(asset_url, headers={'Range': 'bytes=-3'})
+        self.assertEquals('789', response.body)
+        response = self.get(asset_url, headers={
+            'Range': 'bytes=8-', 'If-Range': '"other"'})
+        self.assertEquals(200, response.status_int)
+        self.assertEquals(content, response.body)
+        response = self.get(
+            asset_url, headers={'Range': 'bytes=10-'}, expect_errors=True)
+        self.assertEquals(416, response.status_int)
+        self.assertEquals('bytes */10', response.headers['Content-Range'])
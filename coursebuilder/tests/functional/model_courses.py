@@ -21,7 +21,10 @@ __author__ = [
 from common import utils as common_utils
 from models import config
 from models import courses
+from models import event_transforms
 from models import models
+from models import question_usage
+from models import transforms
 from models import vfs
 from tests.functional import actions
 
@@ -184,3 +187,150 @@ class CourseCachingTest(actions.TestBase):
             memcache_keys[0:1],
             memcache_values.keys(),
             'Only shard zero should be present in memcache.')
+
+
+class QuestionUsageIndexTest(actions.TestBase):
+
+    COURSE_NAME = 'test_course'
+    ADMIN_EMAIL = 'admin@foo.com'
+    NAMESPACE = 'ns_%s' % COURSE_NAME
+
+    def setUp(self):
+        super(QuestionUsageIndexTest, self).setUp()
+        self.app_context = actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Test Course')
+        self.course = courses.Course(handler=None, app_context=self.app_context)
+        self.unit = self.course.add_unit()
+        self.lesson = self.course.add_lesson(self.unit)
+        self.lesson.objectives = (
+            '<question quid="5" weight="2" instanceid="Q1"></question>'
+            '<question-group qgid="9" instanceid="G1"></question-group>')
+        self.course.save()
+
+    def _get_index_entity(self):
+        with common_utils.Namespace(self.NAMESPACE):
+            return question_usage.QuestionUsageIndexEntity.get_by_key_name(
+                question_usage.QuestionUsageIndexEntity.KEY_NAME)
+
+    def _save_group(self, question_ids):
+        with common_utils.Namespace(self.NAMESPACE):
+            return models.QuestionGroupDAO.save(models.QuestionGroupDTO(None, {
+                'description': 'group',
+                'introduction': '',
+                'items': [{'question': str(quid)} for quid in question_ids],
+                'version': '1.5'}))
+
+    def test_index_is_built_and_moved_to_new_content_versions(self):
+        course = courses.Course(handler=None, app_context=self.app_context)
+        index = course.get_question_usage_index()
+        self.assertEquals(
+            ['Q1', 'G1'],
+            [usage['usage_id'] for usage in index.get_page_usages(
+                self.unit.unit_id, self.lesson.lesson_id)])
+        self.assertEquals(
+            course.content_version, self._get_index_entity().content_version)
+
+        # Saving the course updates the index in place and stamps it with the
+        # new version, so the next load does not rebuild it.
+        lesson = course.add_lesson(course.find_unit_by_id(self.unit.unit_id))
+        lesson.objectives = (
+            '<question quid="6" weight="1" instanceid="Q2"></question>')
+        course.save()
+        self.assertEquals(
+            course.content_version, self._get_index_entity().content_version)
+        index = courses.Course(
+            handler=None, app_context=self.app_context
+        ).get_question_usage_index()
+        self.assertEquals(
+            ['Q2'],
+            [usage['usage_id'] for usage in index.get_page_usages(
+                self.unit.unit_id, lesson.lesson_id)])
+
+    def test_index_of_course_without_content_version_is_kept(self):
+        # Courses saved before content versions existed load without one.
+        self.swap(
+            courses.CourseModel13, 'content_version',
+            property(lambda unused_self: None))
+        parsed = []
+        parse_usages = question_usage._parse_usages
+
+        def counting_parse_usages(html):
+            parsed.append(html)
+            return parse_usages(html)
+        self.swap(question_usage, '_parse_usages', counting_parse_usages)
+
+        course = courses.Course(handler=None, app_context=self.app_context)
+        course.get_question_usage_index()
+        self.assertEquals(2, len(parsed))
+        self.assertIsNone(self._get_index_entity().content_version)
+
+        # The stored index is used, without parsing pages again.
+        del parsed[:]
+        index = courses.Course(
+            handler=None, app_context=self.app_context
+        ).get_question_usage_index()
+        self.assertEquals([], parsed)
+        self.assertEquals(
+            ['Q1', 'G1'],
+            [usage['usage_id'] for usage in index.get_page_usages(
+                self.unit.unit_id, self.lesson.lesson_id)])
+
+        # Only the page whose HTML changed is parsed again.
+        lesson = course.find_lesson_by_id(
+            course.find_unit_by_id(self.unit.unit_id), self.lesson.lesson_id)
+        lesson.objectives = (
+            '<question quid="6" weight="1" instanceid="Q2"></question>')
+        course.save()
+        index = courses.Course(
+            handler=None, app_context=self.app_context
+        ).get_question_usage_index()
+        self.assertEquals([lesson.objectives], parsed)
+        self.assertEquals(
+            ['Q2'],
+            [usage['usage_id'] for usage in index.get_page_usages(
+                self.unit.unit_id, self.lesson.lesson_id)])
+
+    def test_question_groups_are_read_as_the_index_is_loaded(self):
+        group_id = self._save_group([7, 8, 7])
+        self.lesson.objectives = (
+            '<question-group qgid="%s" instanceid="G1"></question-group>'
+            '<question quid="5" weight="2" instanceid="Q1"></question>'
+            % group_id)
+        self.course.save()
+        index = self.course.get_question_usage_index()
+        questions = index.get_questions_by_usage_id()
+        self.assertEquals(3, questions['Q1']['sequence'])
+        entity = self._get_index_entity()
+        self.assertNotIn('groups', transforms.loads(entity.data))
+
+        # Groups change without the course being saved, and without the
+        # stored index being rewritten.
+        with common_utils.Namespace(self.NAMESPACE):
+            models.QuestionGroupDAO.delete(
+                models.QuestionGroupDAO.load(group_id))
+        index = self.course.get_question_usage_index()
+        questions = index.get_questions_by_usage_id()
+        self.assertEquals(0, questions['Q1']['sequence'])
+        self.assertEquals(entity.data, self._get_index_entity().data)
+
+    def test_questions_by_usage_id_and_locations(self):
+        group_id = self._save_group([7, 8])
+        self.lesson.objectives = (
+            '<question-group qgid="%s" instanceid="G1"></question-group>'
+            '<question quid="5" weight="2" instanceid="Q1"></question>'
+            % group_id)
+        self.course.save()
+
+        questions = event_transforms.get_questions_by_usage_id(
+            self.app_context)
+        self.assertEquals(0, questions['G1']['sequence'])
+        self.assertEquals(2, questions['Q1']['sequence'])
+        self.assertEquals(2.0, questions['Q1']['weight'])
+        self.assertEquals(self.lesson.lesson_id, questions['Q1']['lesson'])
+
+        course = courses.Course(handler=None, app_context=self.app_context)
+        question_locations, group_locations = course.get_component_locations()
+        self.assertEquals([5L], question_locations.keys())
+        self.assertEquals([long(group_id)], group_locations.keys())
+        self.assertEquals(
+            [1], question_locations[5L]['lessons'].values())
@@ -111,6 +111,18 @@ class BaseEntityTestCase(actions.TestBase):
         self.assertEquals(23, data.class_rank)
         self.assertEquals(blacklisted, data.additional_fields)
 
+    def test_for_export_reads_reference_keys_without_fetching(self):
+        referent = DefaultConstructableEntity()
+        referent_key = db.put(referent)
+        referrer_key = db.put(DefaultConstructableEntity(prop_ref=referent))
+
+        # Dereferencing the property would now fail.
+        db.delete(referent_key)
+        referrer = DefaultConstructableEntity.get(referrer_key)
+        data = referrer.for_export(lambda x: x)
+        self.assertEquals(str(referent_key), data.prop_ref)
+        self.assertEquals(referrer.key(), data.safe_key)
+
 
 class ExportEntityTestCase(actions.TestBase):
 
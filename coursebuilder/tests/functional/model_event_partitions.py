@@ -0,0 +1,76 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Functional tests for models/event_partitions.py."""
+
+from mapreduce import operation
+
+from common.utils import Namespace
+from models import event_partitions
+from models import jobs
+from models import models
+from tests.functional import actions
+
+from google.appengine.ext import db
+
+TEST_NAMESPACE = 'test'
+
+
+class MockAppContext(object):
+
+    def get_namespace_name(self):
+        return TEST_NAMESPACE
+
+
+class AnswersJob(event_partitions.PartitionedEventsJob):
+
+    def get_event_sources_wanted(self):
+        return ['submit-assessment', 'tag-assessment']
+
+
+class PartitionedEventsJobTest(actions.TestBase):
+    """Validate the backfill of partitions and when jobs rely on them."""
+
+    def setUp(self):
+        super(PartitionedEventsJobTest, self).setUp()
+        self.app_context = MockAppContext()
+
+    def test_backfill_sets_partition_of_older_events(self):
+        # db.put() skips EventEntity.put(), as code predating partitions did.
+        event = models.EventEntity(source='tag-assessment', user_id='1')
+        db.put([event])
+        self.assertIsNone(event.partition)
+
+        output = list(event_partitions.EventPartitionsBackfill.map(event))
+        self.assertEquals('tag-assessment', event.partition)
+        self.assertIsInstance(output[0], operation.db.Put)
+        self.assertEquals(('backfilled', 1), output[1])
+
+        self.assertEquals(
+            [], list(event_partitions.EventPartitionsBackfill.map(event)))
+
+    def test_all_events_are_read_until_backfill_completes(self):
+        answers_job = AnswersJob(self.app_context)
+        backfill = event_partitions.EventPartitionsBackfill(self.app_context)
+        with Namespace(TEST_NAMESPACE):
+            self.assertIsNone(answers_job.entity_partitions())
+        self.assertTrue(backfill.is_active())
+
+        with Namespace(TEST_NAMESPACE):
+            db.run_in_transaction(
+                jobs.DurableJobEntity._complete_job, backfill._job_name,
+                backfill.load().sequence_num, '[]', 1)
+            self.assertEquals(
+                ['submit-assessment', 'tag-assessment'],
+                answers_job.entity_partitions())
@@ -18,8 +18,12 @@ __author__ = [
     'mgainer@google.com (Mike Gainer)',
 ]
 
+from mapreduce import model as mapreduce_model
+from mapreduce import operation
+
 from common.utils import Namespace
 from models import jobs
+from models import shard_planner
 from models import transforms
 from tests.functional import actions
 
@@ -70,6 +74,26 @@ class TestJob(jobs.DurableJobBase):
         return transforms.loads(self.load().output)
 
 
+class ParityCountingJob(jobs.MapReduceJob):
+
+    MAP_BATCH_SIZE = 10
+
+    @staticmethod
+    def map(item):
+        yield ('odd' if item % 2 else 'even', 1)
+
+    @staticmethod
+    def combine_in_mapper(unused_key, combined, value):
+        return (combined or 0) + value
+
+
+class PlannedEntity(db.Model):
+
+    PARTITION_PROPERTY = 'partition'
+
+    partition = db.StringProperty()
+
+
 class JobOperationsTest(actions.TestBase):
     """Validate operation of job behaviors."""
 
@@ -217,3 +241,198 @@ class JobOperationsTest(actions.TestBase):
         self.assertEquals(TEST_DATA, self.test_job.get_output())
         self.assertEquals(TEST_DURATION,
                           self.test_job.load().execution_time_sec)
+
+
+class MapReduceResultsTest(actions.TestBase):
+    """Validate storage and retrieval of sharded map/reduce results."""
+
+    def setUp(self):
+        super(MapReduceResultsTest, self).setUp()
+        self.test_job = TestJob(TEST_NAMESPACE)
+        self.results = [['item %d' % i, i] for i in xrange(10)]
+
+    def _complete_with_shards(self, results):
+        sequence_num = self.test_job.submit()
+        self.test_job.force_start_job(sequence_num)
+        with Namespace(TEST_NAMESPACE):
+            jobs.DurableJobResultsShard.delete_stale(
+                self.test_job._job_name, sequence_num)
+            writer = jobs._ResultsShardWriter(
+                self.test_job._job_name, sequence_num)
+            for result in results:
+                writer.add(result)
+            writer.flush()
+            db.run_in_transaction(
+                jobs.DurableJobEntity._complete_job, self.test_job._job_name,
+                sequence_num, jobs.MapReduceJob.build_output(
+                    'root', None, result_shard_sizes=writer.shard_sizes),
+                TEST_DURATION)
+        return writer.shard_sizes
+
+    def _count_shards(self):
+        with Namespace(TEST_NAMESPACE):
+            return jobs.DurableJobResultsShard.all().count()
+
+    def test_results_are_split_into_shards(self):
+        # Each result takes 13 bytes as JSON, plus a separator.
+        self.swap(jobs, 'RESULTS_SHARD_MAX_BYTES', 40)
+        self.assertEquals([2, 2, 2, 2, 2],
+                          self._complete_with_shards(self.results))
+
+        job = self.test_job.load()
+        self.assertEquals(10, jobs.MapReduceJob.get_result_count(job))
+        self.assertEquals(
+            self.results, list(jobs.MapReduceJob.iter_results(job)))
+        self.assertEquals(self.results, jobs.MapReduceJob.get_results(job))
+        self.assertEquals(
+            self.results[3:6],
+            jobs.MapReduceJob.get_results_page(job, 1, 3))
+        self.assertEquals(
+            self.results[9:], jobs.MapReduceJob.get_results_page(job, 3, 3))
+        self.assertEquals([], jobs.MapReduceJob.get_results_page(job, 4, 3))
+
+    def test_rerun_replaces_shards_of_previous_run(self):
+        self.swap(jobs, 'RESULTS_SHARD_MAX_BYTES', 40)
+        self._complete_with_shards(self.results)
+        self.assertEquals(5, self._count_shards())
+
+        self._complete_with_shards(self.results[:3])
+        self.assertEquals(2, self._count_shards())
+        self.assertEquals(
+            self.results[:3],
+            jobs.MapReduceJob.get_results(self.test_job.load()))
+
+    def test_results_stored_in_line_are_still_read(self):
+        sequence_num = self.test_job.submit()
+        self.test_job.force_start_job(sequence_num)
+        with Namespace(TEST_NAMESPACE):
+            db.run_in_transaction(
+                jobs.DurableJobEntity._complete_job, self.test_job._job_name,
+                sequence_num,
+                jobs.MapReduceJob.build_output('root', self.results),
+                TEST_DURATION)
+
+        job = self.test_job.load()
+        self.assertEquals(10, jobs.MapReduceJob.get_result_count(job))
+        self.assertEquals(self.results, jobs.MapReduceJob.get_results(job))
+        self.assertEquals(
+            self.results[8:], jobs.MapReduceJob.get_results_page(job, 2, 4))
+
+
+class MapCombiningTest(actions.TestBase):
+    """Validate combining of map() output in the mapper."""
+
+    def _map_batch(self, items):
+        return [
+            output for output in ParityCountingJob._map_batch(items)
+            if not isinstance(output, operation.Operation)]
+
+    def test_values_for_a_key_are_combined(self):
+        self.assertEquals(
+            [('even', 3), ('odd', 2)],
+            sorted(self._map_batch([1, 2, 3, 4, 6])))
+
+    def test_combined_values_are_emitted_when_too_many_keys(self):
+        self.swap(ParityCountingJob, 'MAP_COMBINER_MAX_KEYS', 2)
+        self.assertEquals(
+            [('even', 1), ('odd', 1), ('odd', 2)],
+            sorted(self._map_batch([1, 2, 3, 5])))
+
+
+class ShardPlanTest(actions.TestBase):
+    """Validate the choice of the number of shards of map/reduce jobs."""
+
+    def setUp(self):
+        super(ShardPlanTest, self).setUp()
+        self.swap(shard_planner, 'MAX_SHARDS', 4)
+
+    def _put_entities(self, count):
+        with Namespace(TEST_NAMESPACE):
+            db.put([PlannedEntity() for _ in xrange(count)])
+
+    def test_empty_kind_gets_one_shard(self):
+        plan = shard_planner.plan(PlannedEntity, TEST_NAMESPACE, 10)
+        self.assertEquals(0, plan.entity_count)
+        self.assertEquals(shard_planner.SOURCE_KEY_SCAN, plan.source)
+        self.assertEquals(1, plan.shard_count)
+
+    def test_shards_follow_entity_count_up_to_maximum(self):
+        self._put_entities(25)
+        plan = shard_planner.plan(PlannedEntity, TEST_NAMESPACE, 10)
+        self.assertEquals(25, plan.entity_count)
+        self.assertEquals(3, plan.shard_count)
+
+        # The key scan stops once the count can no longer change the plan.
+        plan = shard_planner.plan(PlannedEntity, TEST_NAMESPACE, 5)
+        self.assertEquals(20, plan.entity_count)
+        self.assertEquals(4, plan.shard_count)
+
+        # Entities of other namespaces are not counted.
+        self.assertEquals(
+            0, shard_planner.plan(PlannedEntity, '', 5).entity_count)
+
+    def test_plan_is_recorded_in_job_output(self):
+        self._put_entities(3)
+        plan = shard_planner.plan(PlannedEntity, TEST_NAMESPACE, 2)
+        test_job = TestJob(TEST_NAMESPACE)
+        sequence_num = test_job.submit()
+        with Namespace(TEST_NAMESPACE):
+            db.run_in_transaction(
+                jobs.DurableJobEntity._start_job, test_job._job_name,
+                sequence_num, jobs.MapReduceJob.build_output(
+                    'root', [], shard_plan=plan.to_dict()))
+
+        recorded = jobs.MapReduceJob.get_shard_plan(test_job.load())
+        self.assertEquals(plan.to_dict(), recorded.to_dict())
+        self.assertEquals(
+            '2 shards for about 3 PlannedEntity entities '
+            '(estimated from a count of keys).', recorded.describe())
+
+    def test_partitioned_plan_counts_only_wanted_partitions(self):
+        with Namespace(TEST_NAMESPACE):
+            db.put([PlannedEntity(partition=partition)
+                    for partition in ['a', 'b', 'b', 'c', 'c', 'c']])
+        plan = shard_planner.plan(
+            PlannedEntity, TEST_NAMESPACE, 2, partition_property='partition',
+            partitions=['a', 'c'])
+        self.assertEquals(4, plan.entity_count)
+        self.assertEquals(2, plan.shard_count)
+
+
+class PartitionedInputReaderTest(actions.TestBase):
+    """Validate reading only some partitions of a kind."""
+
+    def _split_input(self, partitions, shard_count):
+        entity_kind = '%s.%s' % (PlannedEntity.__module__,
+                                 PlannedEntity.__name__)
+        input_reader_class = jobs.PartitionedDatastoreInputReader
+        return input_reader_class.split_input(mapreduce_model.MapperSpec(
+            'unused.handler', '%s.%s' % (input_reader_class.__module__,
+                                         input_reader_class.__name__),
+            {'entity_kind': entity_kind, 'namespace': TEST_NAMESPACE,
+             'partitions': partitions, 'partition_property': 'partition'},
+            shard_count))
+
+    def test_only_wanted_partitions_are_read(self):
+        with Namespace(TEST_NAMESPACE):
+            db.put([PlannedEntity(partition=partition)
+                    for partition in ['a', 'b', 'c'] * 5])
+        read = []
+        for reader in self._split_input(['a', 'c'], 3):
+            read.extend(entity.partition for entity in reader)
+        self.assertEquals(['a'] * 5 + ['c'] * 5, sorted(read))
+        self.assertEquals([], self._split_input([], 3))
+
+    def test_reading_resumes_from_json(self):
+        with Namespace(TEST_NAMESPACE):
+            db.put([PlannedEntity(partition=partition)
+                    for partition in ['a', 'b', 'c'] * 3])
+        reader, = self._split_input(['a', 'c'], 1)
+        entities = iter(reader)
+        read = [entities.next().partition for _ in xrange(4)]
+
+        # Both partitions are still there, whatever the order of the keys.
+        reader = jobs.PartitionedDatastoreInputReader.from_json(
+            reader.to_json())
+        read.extend(entity.partition for entity in reader)
+        self.assertEquals(['a'] * 3 + ['c'] * 3, sorted(read))
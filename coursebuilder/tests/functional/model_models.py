@@ -20,13 +20,16 @@ __author__ = [
 
 import datetime
 
+from common import caching
 from models import config
+from models import counters
 from models import entities
 from models import models
 from models import services
 from modules.notifications import notifications
 from tests.functional import actions
 
+from google.appengine.api import memcache
 from google.appengine.ext import db
 
 
@@ -42,6 +45,15 @@ class EventEntityTestCase(actions.ExportTestBase):
         self.assertEqual('transformed_1', exported.user_id)
         self.assertEqual(key, models.EventEntity.safe_key(key, self.transform))
 
+    def test_put_keeps_partition_in_step_with_source(self):
+        event = models.EventEntity(source='source', user_id='1')
+        event.put()
+        self.assertEqual('source', event.partition)
+        self.assertEqual(
+            [event.key()],
+            [key for key in models.EventEntity.all(keys_only=True).filter(
+                'partition =', 'source')])
+
 
 class ContentChunkTestCase(actions.ExportTestBase):
     """Tests ContentChunkEntity|DAO|DTO."""
@@ -276,6 +288,46 @@ class ContentChunkTestCase(actions.ExportTestBase):
         self.assert_fuzzy_equal(
             expected_dto, models.MemcacheManager.get(self.memcache_key))
 
+    def _make_uid_dto(self, contents):
+        return models.ContentChunkDTO({
+            'content_type': self.content_type,
+            'contents': contents,
+            'resource_id': self.resource_id,
+            'supports_custom_tags': self.supports_custom_tags,
+            'type_id': self.type_id,
+        })
+
+    def test_dao_save_by_uid_updates_one_keyed_entity(self):
+        first_key = models.ContentChunkDAO.save_by_uid(
+            self._make_uid_dto('first'))
+        second_key = models.ContentChunkDAO.save_by_uid(
+            self._make_uid_dto('second'))
+
+        self.assertEqual(first_key, second_key)
+        self.assertIsNotNone(first_key.name())
+        matches = models.ContentChunkDAO.get_by_uid(self.uid)
+        self.assertEqual(1, len(matches))
+        self.assertEqual('second', matches[0].contents)
+        self.assert_fuzzy_equal(
+            matches[0], models.ContentChunkDAO.get(first_key.name()))
+        self.assert_fuzzy_equal(
+            matches[0], models.ContentChunkDAO.get_one_by_uid(self.uid))
+
+    def test_dao_save_by_uid_replaces_chunks_saved_by_id(self):
+        models.ContentChunkDAO.save(self._make_uid_dto('legacy'))
+        self.assertEqual(
+            'legacy', models.ContentChunkDAO.get_one_by_uid(self.uid).contents)
+
+        models.ContentChunkDAO.save_by_uid(self._make_uid_dto('keyed'))
+
+        self.assertEqual(
+            'keyed', models.ContentChunkDAO.get_one_by_uid(self.uid).contents)
+        self.assertEqual(
+            ['keyed'], [dto.contents for dto in
+                        models.ContentChunkDAO.get_by_uid(self.uid)])
+        self.assertIsNone(models.ContentChunkDAO.get_one_by_uid(
+            models.ContentChunkDAO.make_uid('other', self.resource_id)))
+
 
 class PersonalProfileTestCase(actions.ExportTestBase):
 
@@ -338,6 +390,79 @@ class MemcacheManagerTestCase(actions.TestBase):
         data = models.MemcacheManager.get_multi(['a', 'b', 'c'])
         self.assertEquals(0, len(data.keys()))
 
+    def test_version_stamp(self):
+        key = 'test_version_stamp'
+        self.assertIsNone(models.MemcacheManager.bump_version_stamp(key))
+
+        version = models.MemcacheManager.get_version_stamp(key)
+        self.assertIsNotNone(version)
+        self.assertEquals(
+            version, models.MemcacheManager.get_version_stamp(key))
+        self.assertEquals(
+            version + 1, models.MemcacheManager.bump_version_stamp(key))
+        self.assertEquals(
+            version + 1, models.MemcacheManager.get_version_stamp(key))
+
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = False
+        self.assertIsNone(models.MemcacheManager.get_version_stamp(key))
+
+    def test_counter_increments_sent_in_one_batch_on_flush(self):
+        config.Registry.test_overrides[
+            models.CAN_AGGREGATE_COUNTERS.name] = True
+        counter = counters.PerfCounter('test-buffered-counter', 'For tests.')
+        self.swap(
+            memcache, 'offset_multi', self._count_calls(memcache.offset_multi))
+
+        counter.inc()
+        counter.inc(increment=2)
+        self.assertEquals(None, counter.global_value)
+        self.assertEquals(0, self.calls)
+
+        counters.flush_counter_global_values()
+        self.assertEquals(1, self.calls)
+        self.assertEquals(3, counter.global_value)
+
+        # Values flushed to different shards are summed.
+        counter.inc(increment=4)
+        counters.flush_counter_global_values()
+        self.assertEquals(7, counter.global_value)
+
+    def test_counter_net_decrements_are_flushed(self):
+        config.Registry.test_overrides[
+            models.CAN_AGGREGATE_COUNTERS.name] = True
+        # One shard, so the decrement lands where the increment did.
+        self.swap(models, 'COUNTER_GLOBAL_SHARDS', 1)
+        counter = counters.PerfCounter('test-decremented-counter', 'For tests.')
+
+        counter.inc(increment=5)
+        counters.flush_counter_global_values()
+        counter.inc(increment=-2)
+        counters.flush_counter_global_values()
+        self.assertEquals(3, counter.global_value)
+
+    def test_latency_histogram_global_buckets(self):
+        config.Registry.test_overrides[
+            models.CAN_AGGREGATE_COUNTERS.name] = True
+        histogram = counters.LatencyHistogram(
+            'test-latency-histogram', 'For tests.')
+        self.assertEquals(None, histogram.global_buckets)
+
+        histogram.record(1)
+        histogram.record(3)
+        counters.flush_counter_global_values()
+
+        buckets = histogram.global_buckets
+        self.assertEquals(histogram.buckets, buckets)
+        self.assertEquals(2, histogram.global_value)
+
+    def _count_calls(self, fn):
+        self.calls = 0
+
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
 
 class TestEntity(entities.BaseEntity):
     data = db.TextProperty(indexed=False)
@@ -414,6 +539,147 @@ class BaseJsonDaoTestCase(actions.TestBase):
         assert_bulk_load_succeeds()
 
 
+class RequestPrefetchTestCase(actions.TestBase):
+
+    def setUp(self):
+        super(RequestPrefetchTestCase, self).setUp()
+        config.Registry.test_overrides = {models.CAN_USE_MEMCACHE.name: True}
+
+    def tearDown(self):
+        caching.RequestScopedSingleton.clear_all()
+        config.Registry.test_overrides = {}
+        super(RequestPrefetchTestCase, self).tearDown()
+
+    def test_entities_are_fetched_in_one_batch_until_written(self):
+        student = models.Student(
+            key_name='user@example.com', user_id='1', is_enrolled=True)
+        student.put()
+        TestDao.save(TestDto('dto_0', {'a': 0}))
+        memcache.flush_all()
+
+        key_batches = []
+        db_get = db.get
+
+        def counting_get(keys):
+            key_batches.append(keys)
+            return db_get(keys)
+
+        self.swap(db, 'get', counting_get)
+        models.RequestPrefetch.fetch([
+            models.Student.get_prefetch_key('user@example.com'),
+            TestDao.get_prefetch_key('dto_0'),
+            models.StudentPropertyEntity.get_prefetch_key('1', 'progress')])
+        self.assertEquals(1, len(key_batches))
+        self.assertEquals(3, len(key_batches[0]))
+
+        self.assertEquals(
+            '1', models.Student.get_enrolled_student_by_email(
+                'user@example.com').user_id)
+        self.assertEquals({'a': 0}, TestDao.load('dto_0').dict)
+        self.assertIsNone(models.StudentPropertyEntity.get(student, 'progress'))
+        self.assertEquals(1, len(key_batches))
+
+        # Entities written after the prefetch are read anew.
+        entity = models.StudentPropertyEntity.create(student, 'progress')
+        entity.value = 'done'
+        entity.put()
+        self.assertEquals(
+            'done', models.StudentPropertyEntity.get(student, 'progress').value)
+
+
+class LabeledItem(object):
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+
+class LabelDAOTestCase(actions.TestBase):
+    """Functional tests for filtering items by their labels."""
+
+    def setUp(self):
+        super(LabelDAOTestCase, self).setUp()
+        config.Registry.test_overrides = {models.CAN_USE_MEMCACHE.name: True}
+
+        def save(title, label_type):
+            return models.LabelDAO.save(models.LabelDTO(
+                None, {'title': title, 'type': label_type}))
+
+        self.track_a = save('A', models.LabelDTO.LABEL_TYPE_COURSE_TRACK)
+        self.track_b = save('B', models.LabelDTO.LABEL_TYPE_COURSE_TRACK)
+        self.general = save('G', models.LabelDTO.LABEL_TYPE_GENERAL)
+        self.locale_fr = save('fr', models.LabelDTO.LABEL_TYPE_LOCALE)
+        self.items = [
+            LabeledItem('none', ''),
+            LabeledItem('a', '%s' % self.track_a),
+            LabeledItem('b', '%s %s' % (self.track_b, self.general)),
+            LabeledItem('ab', '%s,%s' % (self.track_a, self.track_b)),
+            LabeledItem('fr', '%s' % self.locale_fr),
+            LabeledItem('gone', '12345'),
+        ]
+
+    def tearDown(self):
+        config.Registry.test_overrides = {}
+        super(LabelDAOTestCase, self).tearDown()
+
+    def _names(self, items):
+        return [item.name for item in items]
+
+    def test_items_match_student_track_labels(self):
+        student = models.Student(
+            key_name='s', labels='%s %s' % (self.track_a, self.general))
+        self.assertEquals(
+            ['none', 'a', 'ab', 'fr', 'gone'],
+            self._names(models.LabelDAO._apply_labels_to_student_labels(
+                models.LabelDTO.LABEL_TYPE_COURSE_TRACK, student,
+                self.items)))
+
+        # Without track labels, the student sees all items.
+        student.labels = '%s' % self.general
+        self.assertEquals(
+            self._names(self.items),
+            self._names(models.LabelDAO._apply_labels_to_student_labels(
+                models.LabelDTO.LABEL_TYPE_COURSE_TRACK, student,
+                self.items)))
+
+    def test_items_match_locale(self):
+        self.assertEquals(
+            ['none', 'a', 'b', 'ab', 'gone'],
+            self._names(models.LabelDAO._apply_locale_labels_to_locale(
+                'de', self.items)))
+        self.assertEquals(
+            self._names(self.items),
+            self._names(models.LabelDAO._apply_locale_labels_to_locale(
+                'fr', self.items)))
+
+    def test_label_changes_invalidate_cached_labels(self):
+        self.assertEquals(
+            set([self.track_a, self.track_b]),
+            models.LabelDAO.get_set_of_ids_of_type(
+                models.LabelDTO.LABEL_TYPE_COURSE_TRACK))
+
+        # A new request is served from the cache of the process.
+        models.LabelManager.clear_all()
+        hits = models.LABEL_INDEX_CACHE_HIT.value
+        models.LabelDAO.get_all()
+        self.assertEquals(hits + 1, models.LABEL_INDEX_CACHE_HIT.value)
+
+        track_c = models.LabelDAO.save(models.LabelDTO(
+            None, {'title': 'C',
+                   'type': models.LabelDTO.LABEL_TYPE_COURSE_TRACK}))
+        self.assertEquals(
+            set([self.track_a, self.track_b, track_c]),
+            models.LabelDAO.get_set_of_ids_of_type(
+                models.LabelDTO.LABEL_TYPE_COURSE_TRACK))
+
+        models.LabelDAO.delete(models.LabelDAO.load(self.track_a))
+        models.LabelManager.clear_all()
+        self.assertEquals(
+            set([self.track_b, track_c]),
+            models.LabelDAO.get_set_of_ids_of_type(
+                models.LabelDTO.LABEL_TYPE_COURSE_TRACK))
+
+
 class QuestionDAOTestCase(actions.TestBase):
     """Functional tests for QuestionDAO."""
 
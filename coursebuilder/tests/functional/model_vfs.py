@@ -18,6 +18,7 @@ __author__ = [
     'mgainer@google.com (Mike Gainer)',
 ]
 
+import hashlib
 import os
 import random
 import StringIO
@@ -169,6 +170,30 @@ class VfsLargeFileSupportTest(actions.TestBase):
             shard_1 = vfs.FileDataEntity.get_by_key_name(file_key_names[1])
             self.assertEquals(1, len(shard_1.data))
 
+    def test_range_is_read_from_its_shards_only(self):
+        data = ''.join([
+            chr(i % 256) for i in xrange(vfs._MAX_VFS_SHARD_SIZE + 100)])
+        namespace = 'ns_foo'
+        fs = vfs.DatastoreBackedFileSystem(namespace, '/')
+        filename = '/foo'
+        fs.put(filename, StringIO.StringIO(data))
+
+        stat = fs.stat(filename)
+        self.assertEquals(len(data), stat.size)
+        self.assertEquals(hashlib.sha1(data).hexdigest(), stat.content_hash)
+        self.assertFalse(stat.is_draft)
+
+        # A range within the second shard reads it only.
+        with common_utils.Namespace(namespace):
+            vfs.FileDataEntity.get_by_key_name(filename).delete()
+        shard_size = vfs._MAX_VFS_SHARD_SIZE
+        self.assertEquals(
+            data[shard_size + 10:shard_size + 20],
+            fs.read_range(filename, shard_size + 10, shard_size + 20))
+        self.assertEquals(
+            data[shard_size + 90:],
+            fs.read_range(filename, shard_size + 90, shard_size + 500))
+
     def test_illegal_file_name(self):
         namespace = 'ns_foo'
         fs = vfs.DatastoreBackedFileSystem(namespace, '/')
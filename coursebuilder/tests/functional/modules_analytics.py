@@ -17,6 +17,7 @@
 __author__ = 'Mike Gainer (mgainer@google.com)'
 
 import appengine_config
+import datetime
 import json
 import os
 import pprint
@@ -289,6 +290,38 @@ class StudentAggregateTest(AbstractModulesAnalyticsTest):
         # No sorting - items should be presented in order by time, video, etc.
         self.assertEqual(expected, actual['youtube'])
 
+    def test_incremental_run_merges_new_events(self):
+        self.swap(student_aggregate.StudentAggregateGenerator,
+                  'WATERMARK_LAG', datetime.timedelta(0))
+        self.load_course('simple_questions')
+        self.load_datastore('location_locale')
+        self.run_aggregator_job()
+
+        # Events already aggregated are not read again: dropping them
+        # changes nothing.  Only the new one is merged in.
+        with common_utils.Namespace('ns_' + self.COURSE_NAME):
+            student = models.Student.get_by_email('foo@bar.com')
+            for event in models.EventEntity.all():
+                event.delete()
+            models.EventEntity(
+                source='enter-page', user_id=student.user_id,
+                data=transforms.dumps({'loc': {'country': 'FR'}})).put()
+        self.run_aggregator_job()
+        actual = self.get_aggregated_data_by_email('foo@bar.com')
+
+        expected = [
+            {'country': 'AR', 'frequency': 2.0 / 9, 'count': 2},
+            {'country': 'DE', 'frequency': 1.0 / 9, 'count': 1},
+            {'country': 'ES', 'frequency': 1.0 / 9, 'count': 1},
+            {'country': 'FR', 'frequency': 1.0 / 9, 'count': 1},
+            {'country': 'US', 'frequency': 4.0 / 9, 'count': 4}]
+        actual['location_frequencies'].sort(key=lambda x: x['country'])
+        self.assertEqual(expected, actual['location_frequencies'])
+
+        # Locales are merged alike; the new event has none.
+        self.assertEqual(
+            9, sum(item['count'] for item in actual['locale_frequencies']))
+
 
 class ClusteringTabTests(actions.TestBase):
     """Test for the clustering subtab of analytics tab."""
@@ -1575,6 +1608,62 @@ class ClusteringGeneratorTests(actions.TestBase):
         ]
         self._check_hamming(cluster_vector, [], 1)
 
+    def test_hamming_max_distance(self):
+        """The calculation stops once the distance exceeds max_distance."""
+        cluster_vector = [
+            {clustering.DIM_TYPE: clustering.DIM_TYPE_UNIT,
+             clustering.DIM_ID: str(i),
+             clustering.DIM_HIGH: 7,
+             clustering.DIM_LOW: 3} for i in range(5)]
+        self.assertEqual(5, clustering.hamming_distance(cluster_vector, []))
+        self.assertEqual(3, clustering.hamming_distance(
+            cluster_vector, [], max_distance=2))
+
+    def test_engine_matches_hamming_distance(self):
+        cluster_values = [
+            [(i, i * 2) for i in range(1, self.dim_number + 1)],
+            [(i, i + 1) for i in range(1, self.dim_number + 1)],
+            [(None, 3), (4, None), (None, None)]]
+        clusters = []
+        for index, values in enumerate(cluster_values):
+            vector = []
+            for dim_index, (low, high) in enumerate(values):
+                vector.append({
+                    clustering.DIM_TYPE: clustering.DIM_TYPE_QUESTION,
+                    clustering.DIM_ID: str(dim_index),
+                    clustering.DIM_LOW: low,
+                    clustering.DIM_HIGH: high})
+            clusters.append({'id': index, 'vector': vector})
+        engine = clustering.HammingDistanceEngine(clusters)
+        bounded_engine = clustering.HammingDistanceEngine(
+            clusters, max_distance=2)
+        for offset in range(6):
+            student_vector = [
+                {clustering.DIM_TYPE: clustering.DIM_TYPE_QUESTION,
+                 clustering.DIM_ID: i,
+                 clustering.DIM_VALUE: i + offset}
+                for i in range(self.dim_number)]
+            expected = [
+                (cluster['id'], clustering.hamming_distance(
+                    cluster['vector'], student_vector))
+                for cluster in clusters]
+            packed = engine.pack(student_vector)
+            self.assertEqual(expected, engine.distances(packed))
+            self.assertEqual(
+                [item for item in expected if item[1] <= 2],
+                bounded_engine.distances(bounded_engine.pack(student_vector)))
+
+    def test_engine_repeated_dimension(self):
+        """Repeated dimensions count once for each appearance."""
+        dim = {clustering.DIM_TYPE: clustering.DIM_TYPE_LESSON_PROGRESS,
+               clustering.DIM_ID: '8',
+               clustering.DIM_LOW: 1.0,
+               clustering.DIM_HIGH: 1.0}
+        clusters = [{'id': 1, 'vector': [dim]},
+                    {'id': 2, 'vector': [dim] * 3}]
+        engine = clustering.HammingDistanceEngine(clusters)
+        self.assertEqual([(1, 1), (2, 3)], engine.distances(engine.pack([])))
+
 
 class TestClusterStatisticsDataSource(actions.TestBase):
 
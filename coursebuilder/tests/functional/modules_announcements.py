@@ -0,0 +1,100 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for modules/announcements/."""
+
+import datetime
+import re
+
+from models import config
+from models import models
+from modules.announcements import announcements
+from tests.functional import actions
+
+from google.appengine.ext import db
+
+
+class AnnouncementsFeedTest(actions.TestBase):
+    """Tests the pages of the list of announcements."""
+
+    def setUp(self):
+        super(AnnouncementsFeedTest, self).setUp()
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.swap(announcements, 'ANNOUNCEMENTS_PER_PAGE', 2)
+        self.entities = []
+        for day in xrange(1, 6):
+            entity = announcements.AnnouncementEntity(
+                title='Announcement %d' % day,
+                date=datetime.date(2015, 1, day), is_draft=False)
+            entity.put()
+            self.entities.append(entity)
+
+    def tearDown(self):
+        config.Registry.test_overrides = {}
+        super(AnnouncementsFeedTest, self).tearDown()
+
+    def _get_titles(self, page=None):
+        url = 'announcements'
+        if page is not None:
+            url += '?page=%s' % page
+        response = self.get(url)
+        self.assertEquals(200, response.status_int)
+        return re.findall(r'Announcement \d', response.body), response
+
+    def test_announcements_are_paginated_newest_first(self):
+        actions.login('student@example.com')
+        titles, response = self._get_titles()
+        self.assertEquals(['Announcement 5', 'Announcement 4'], titles)
+        self.assertIn('gcb-older-announcements', response.body)
+        self.assertNotIn('gcb-newer-announcements', response.body)
+
+        titles, response = self._get_titles(2)
+        self.assertEquals(['Announcement 1'], titles)
+        self.assertIn('gcb-newer-announcements', response.body)
+        self.assertNotIn('gcb-older-announcements', response.body)
+
+        titles, _ = self._get_titles(7)
+        self.assertEquals([], titles)
+
+    def test_pages_are_cached_until_an_announcement_changes(self):
+        actions.login('student@example.com')
+        self._get_titles()
+
+        # Writes bypassing AnnouncementEntity.put() are not noticed...
+        self.entities[4].title = 'Announcement 9'
+        db.put([self.entities[4]])
+        titles, _ = self._get_titles()
+        self.assertEquals(['Announcement 5', 'Announcement 4'], titles)
+
+        # ...but any change made through it invalidates all pages.
+        self.entities[0].put()
+        titles, _ = self._get_titles()
+        self.assertEquals(['Announcement 9', 'Announcement 4'], titles)
+
+    def test_editors_see_drafts_and_share_one_delete_token(self):
+        self.entities[4].is_draft = True
+        self.entities[4].put()
+
+        actions.login('student@example.com')
+        titles, _ = self._get_titles()
+        self.assertEquals(['Announcement 4', 'Announcement 3'], titles)
+
+        actions.login('admin@example.com', is_admin=True)
+        titles, response = self._get_titles()
+        self.assertEquals(['Announcement 5', 'Announcement 4'], titles)
+        tokens = re.findall(
+            r'gcb-delete-announcement-\d.+[\n\r].+value="([^"]+)"',
+            response.body)
+        self.assertEquals(2, len(tokens))
+        self.assertEquals(1, len(set(tokens)))
@@ -425,6 +425,31 @@ class GoogleDriveTagRendererTest(GoogleDriveTestBase):
 
         self.assert_404_response_with_empty_body(response)
 
+    def test_get_serves_cached_html_until_a_chunk_is_saved(self):
+        self.swap(
+            config.Registry, 'test_overrides',
+            {models.CAN_USE_MEMCACHE.name: True})
+        params = {'resource_id': self.resource_id, 'type_id': self.type_id}
+        self.assert_200_response(self.contents, self.testapp.get(
+            core_tags._GOOGLE_DRIVE_TAG_RENDERER_PATH, params=params))
+
+        # Writes bypassing the DAO are not noticed...
+        entity = models.ContentChunkEntity.all().get()
+        entity.contents = 'new_contents'
+        entity.put()
+        self.assert_200_response(self.contents, self.testapp.get(
+            core_tags._GOOGLE_DRIVE_TAG_RENDERER_PATH, params=params))
+
+        # ...but saving through it makes the cached HTML stale.
+        models.ContentChunkDAO.save_by_uid(models.ContentChunkDTO({
+            'content_type': 'text/html',
+            'contents': 'saved_contents',
+            'resource_id': self.resource_id,
+            'type_id': self.type_id,
+        }))
+        self.assert_200_response('saved_contents', self.testapp.get(
+            core_tags._GOOGLE_DRIVE_TAG_RENDERER_PATH, params=params))
+
 
 class TagsMarkdown(actions.TestBase):
 
@@ -574,3 +599,20 @@ class TagsInclude(actions.TestBase):
             self._expect_content(content, response)
         finally:
             self.context.fs.delete(sub_path)
+
+    def test_student_independent_include_is_cached(self):
+        self._set_content('<p>{{ base_path }}</p>')
+        self._expect_content('<p>assets/html</p>', self.get(LESSON_URL))
+        hits = core_tags.INCLUDE_CACHE_HIT.value
+        self._expect_content('<p>assets/html</p>', self.get(LESSON_URL))
+        self.assertEquals(hits + 1, core_tags.INCLUDE_CACHE_HIT.value)
+
+        # A changed file is not served from the cache.
+        self._set_content('<p>Changed</p>')
+        self._expect_content('<p>Changed</p>', self.get(LESSON_URL))
+
+    def test_include_depending_on_student_is_not_cached(self):
+        self._set_content('{{ is_course_admin }}')
+        self._expect_content('False', self.get(LESSON_URL))
+        actions.login(ADMIN_EMAIL, is_admin=True)
+        self._expect_content('True', self.get(LESSON_URL))
@@ -1146,6 +1146,58 @@ class I18nProgressDeferredUpdaterTests(actions.TestBase):
             el_progress=I18nProgressDTO.IN_PROGRESS,
             ru_progress=I18nProgressDTO.NOT_STARTED)
 
+    def test_changes_are_coalesced_into_one_run(self):
+        unit_key = resource.Key(
+            resources_display.ResourceUnit.TYPE, self.unit.unit_id)
+        lesson_key = resource.Key(
+            resources_display.ResourceLesson.TYPE, self.lesson.lesson_id)
+        lesson_key_el = ResourceBundleKey.from_resource_key(lesson_key, 'el')
+        ResourceBundleDAO.save(ResourceBundleDTO(str(lesson_key_el), {
+            'title': {
+                'type': 'string',
+                'source_value': '',
+                'data': [{
+                    'source_value': 'Test Lesson',
+                    'target_value': 'TEST LESSON'}]
+            },
+            'objectives': {
+                'type': 'html',
+                'source_value': '<p>c</p><p>d</p>',
+                'data': [
+                    {'source_value': 'c', 'target_value': 'C'},
+                    {'source_value': 'd', 'target_value': 'D'}]
+            }
+        }))
+
+        sites.set_path_info(self.base)
+        try:
+            updater = i18n_dashboard.I18nProgressDeferredUpdater
+            updater.update_resource_list([unit_key])
+            updater.update_resource_list([lesson_key, unit_key])
+            updater.update_resource_list([lesson_key])
+        finally:
+            sites.unset_path_info()
+
+        # One run is scheduled, for all the changes.
+        self.assertEquals(1, len(self.taskq.GetTasks('default')))
+        self.assertEquals(
+            3, i18n_dashboard.I18nProgressJournalEntryEntity.all().count())
+        self.assertIsNone(I18nProgressDAO.load(str(unit_key)))
+
+        self.execute_all_deferred_tasks()
+        self._assert_progress(
+            unit_key,
+            el_progress=I18nProgressDTO.NOT_STARTED,
+            ru_progress=I18nProgressDTO.NOT_STARTED)
+        self._assert_progress(
+            lesson_key,
+            el_progress=I18nProgressDTO.DONE,
+            ru_progress=I18nProgressDTO.NOT_STARTED)
+        self.assertEquals(
+            0, i18n_dashboard.I18nProgressJournalEntryEntity.all().count())
+        self.assertFalse(i18n_dashboard.I18nProgressJournalEntity.all().get(
+            ).scheduled)
+
 
 class LazyTranslatorTests(actions.TestBase):
     ADMIN_EMAIL = 'admin@foo.com'
@@ -679,6 +679,100 @@ class ManagerTest(actions.TestBase):
                 invalid_to, self.sender, self.intent, self.body, self.subject,
                 )
 
+    def test_send_many_sets_initial_state_and_can_run_tasks(self):
+        recipients = ['to%s@example.com' % i for i in xrange(
+            2 * notifications._SEND_MANY_MESSAGES_PER_TASK + 1)]
+        key_pairs = notifications.Manager.send_many(
+            recipients + [recipients[0]], self.sender, self.intent, self.body,
+            self.subject, audit_trail=self.audit_trail)
+
+        self.assertEqual(len(recipients), len(key_pairs))
+        for to, (notification_key, payload_key) in zip(recipients, key_pairs):
+            notification, payload = db.get([notification_key, payload_key])
+            self.assertEqual(to, notification.to)
+            self.assertEqual(to, payload.to)
+            self.assertEqual(self.audit_trail, notification.audit_trail)
+            self.assertEqual(self.body, payload.body)
+            self.assertEqual(notification.enqueue_date,
+                             notification._last_enqueue_date)
+            self.assertIsNone(notification._done_date)
+
+        # One task for each group of messages.
+        self.assertEqual(3, len(self.taskq.GetTasks('default')))
+        self.execute_all_deferred_tasks()
+        messages = self.get_mail_stub().get_sent_messages()
+        self.assertEqual(len(recipients), len(messages))
+        self.assertEqual(
+            sorted(recipients), sorted(message.to for message in messages))
+
+        for notification_key, payload_key in key_pairs:
+            self.assertIsNotNone(db.get(notification_key)._done_date)
+            self.assertIsNone(db.get(payload_key).body)
+
+        self.assertEqual(1, notifications.COUNTER_SEND_MANY_SUCCESS.value)
+        self.assertEqual(
+            3, notifications.COUNTER_SEND_MAIL_GROUP_TASK_STARTED.value)
+        self.assertEqual(
+            len(recipients), notifications.COUNTER_SEND_MAIL_TASK_SENT.value)
+
+    def test_send_many_raises_value_error_if_any_to_invalid(self):
+        with self.assertRaisesRegexp(ValueError, 'Malformed email address: ""'):
+            notifications.Manager.send_many(
+                [self.to, ''], self.sender, self.intent, self.body,
+                self.subject)
+
+        self.assertEqual(0, notifications.Notification.all().count())
+        self.assertEqual(0, len(self.taskq.GetTasks('default')))
+
+    def test_send_mail_group_task_tracks_status_per_message(self):
+        key_pairs = [
+            db.put(notifications.Manager._make_unsaved_models(
+                self.audit_trail, self.body, self.now, self.intent,
+                notifications.RetainAuditTrail.NAME, self.sender,
+                self.subject, to))
+            for to in ('a@example.com', 'b@example.com', 'c@example.com')]
+        # Missing payload is a permanent failure for that message only.
+        db.delete(key_pairs[1][1])
+
+        def fail_for_c(unused_sender, to, unused_subject, unused_body):
+            if to == 'c@example.com':
+                raise ValueError('recoverable')
+
+        old_send_mail_task = notifications.Manager._send_mail_task.im_func
+
+        def send_mail_task(cls, notification_key, payload_key):
+            return old_send_mail_task(
+                cls, notification_key, payload_key,
+                test_send_mail_fn=fail_for_c)
+
+        self.swap(
+            notifications.Manager, '_send_mail_task',
+            types.MethodType(
+                send_mail_task, notifications.Manager,
+                type(notifications.Manager)))
+
+        with self.assertRaisesRegexp(ValueError, 'recoverable'):
+            notifications.Manager._send_mail_group_task(key_pairs)
+
+        a, b, c = db.get([key_pair[0] for key_pair in key_pairs])
+        self.assertIsNotNone(a._send_date)
+        self.assertIsNone(b._send_date)
+        self.assertIsNone(c._send_date)
+        self.assertEqual(1, c._recoverable_failure_count)
+        self.assertEqual(
+            1, notifications.COUNTER_SEND_MAIL_GROUP_TASK_FAILED.value)
+
+        # On retry, only the message that failed recoverably is sent.
+        self.swap(notifications.Manager, '_send_mail_task',
+                  classmethod(old_send_mail_task))
+        results = notifications.Manager._send_mail_group_task(key_pairs)
+        self.assertEqual({
+            str(key_pairs[0][0]): notifications.Status.SUCCEEDED,
+            str(key_pairs[1][0]): notifications.Status.FAILED,
+            str(key_pairs[2][0]): notifications.Status.SUCCEEDED,
+        }, results)
+        self.assertEqual(1, len(self.get_mail_stub().get_sent_messages()))
+
     def test_send_mail_task_fails_permanent_and_marks_entities_if_cap_hit(self):
         over_cap = notifications._RECOVERABLE_FAILURE_CAP + 1
         notification_key, payload_key = db.put(
@@ -241,6 +241,66 @@ class RatingHandlerTests(BaseRatingsTests):
         self.assertEquals('Good lesson', event_data['additional_comments'])
         self.assertEquals(self.key, event_data['key'])
 
+    def test_post_updates_counts_of_ratings(self):
+        self.register_student()
+        self.post_data(rating_int=2)
+        self.assertEquals(
+            {'count': 1, 'average': 2.0, 'histogram': {'2': 1}},
+            rating.RatingAggregates.get_summary(
+                self.unit.unit_id, self.lesson.lesson_id))
+
+        # A student changing their rating moves their count.
+        self.post_data(rating_int=4)
+        self.post_data(rating_int=4)
+        actions.logout()
+        actions.login('other@foo.com', is_admin=False)
+        actions.register(self, 'Other Student')
+        self.post_data(rating_int=3)
+        summary = {'count': 2, 'average': 3.5, 'histogram': {'3': 1, '4': 1}}
+        self.assertEquals(
+            summary, rating.RatingAggregates.get_summary(
+                self.unit.unit_id, self.lesson.lesson_id))
+        self.assertEquals(
+            summary, rating.RatingAggregates.get_summary(self.unit.unit_id))
+        self.assertEquals(
+            {'count': 0, 'average': None, 'histogram': {}},
+            rating.RatingAggregates.get_summary(self.unit.unit_id + 1))
+
+    def test_post_rejects_ratings_not_offered_and_counts_real_content(self):
+        self.register_student()
+        for bad_rating in ['abc', {}, 1e9, 2.0, -1, 5, True]:
+            response = self.post_data(rating_int=bad_rating)
+            self.assertEquals(400, response['status'])
+            self.assertIn('Invalid rating', response['message'])
+
+        # Ratings of URLs which are not content of the course are kept but
+        # not counted.
+        self.post_data(key='/%s/unit?unit=999' % COURSE_NAME, rating_int=1)
+        self.post_data(key='/%s/unit?unit=%s&lesson=999' % (
+            COURSE_NAME, self.unit.unit_id), rating_int=1)
+        self.assertEquals(
+            {'count': 0, 'average': None, 'histogram': {}},
+            rating.RatingAggregates.get_summary(self.unit.unit_id))
+        self.assertEquals(
+            {'count': 0, 'average': None, 'histogram': {}},
+            rating.RatingAggregates.get_summary(999))
+
+    def test_changing_an_uncounted_rating_only_counts_the_new_one(self):
+        self.register_student()
+        other_key = '/%s/unit?unit=%s' % (COURSE_NAME, self.unit.unit_id)
+        self.post_data(key=other_key, rating_int=1)
+
+        # Ratings recorded before counts existed are not in the counts.
+        student = models.Student.get_enrolled_student_by_email(STUDENT_EMAIL)
+        prop = rating.StudentRatingProperty.load_or_create(student)
+        prop.set_rating(self.key, 1)
+        prop.put()
+
+        self.post_data(rating_int=3)
+        self.assertEquals(
+            {'count': 2, 'average': 2.0, 'histogram': {'1': 1, '3': 1}},
+            rating.RatingAggregates.get_summary(self.unit.unit_id))
+
     def test_for_export_scrubs_extraneous_data(self):
         def transform_fn(s):
             return s.upper()
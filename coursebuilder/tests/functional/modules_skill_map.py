@@ -37,6 +37,7 @@ from models import models
 from models import transforms
 from models.progress import UnitLessonCompletionTracker
 from modules.i18n_dashboard import i18n_dashboard
+from modules.skill_map import skill_map
 from modules.skill_map.skill_map import CountSkillCompletion
 from modules.skill_map.skill_map import LESSON_SKILL_LIST_KEY
 from modules.skill_map.skill_map import ResourceSkill
@@ -280,6 +281,77 @@ class SkillGraphTests(BaseSkillMapTests):
         self.assertEqual({skill_2.id, skill_3.id}, successor_ids)
 
 
+    def test_skill_graph_served_from_process_cache(self):
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            skill_graph = SkillGraph.load()
+            skill_1 = skill_graph.add(Skill.build(SKILL_NAME, SKILL_DESC))
+            SkillGraph.clear_all()
+
+            # The graph written by this process is served without loading
+            hits = skill_map.SKILL_GRAPH_CACHE_HIT.value
+            skill_graph = SkillGraph.load()
+            self.assertEqual(hits + 1, skill_map.SKILL_GRAPH_CACHE_HIT.value)
+            self.assertEqual([skill_1.id], [s.id for s in skill_graph.skills])
+
+            # A write by another process changes the version stamp
+            _SkillDao.save(Skill.build(SKILL_NAME_2, SKILL_DESC_2))
+            models.MemcacheManager.incr(skill_map.SKILL_GRAPH_VERSION_KEY, 1)
+            SkillGraph.clear_all()
+            misses = skill_map.SKILL_GRAPH_CACHE_MISS.value
+            skill_graph = SkillGraph.load()
+            self.assertEqual(
+                misses + 1, skill_map.SKILL_GRAPH_CACHE_MISS.value)
+            self.assertEqual(2, len(skill_graph.skills))
+
+    def test_course_import_refreshes_cached_skill_graph(self):
+        with actions.OverriddenConfig(models.CAN_USE_MEMCACHE.name, True):
+            skill = SkillGraph.load().add(Skill.build(SKILL_NAME, SKILL_DESC))
+            dst_app_context = actions.simple_add_course(
+                'skill_map_import', ADMIN_EMAIL, 'Imported Course')
+
+            # Cache the graph, and the DAO's list of skills, while the
+            # course has no skills yet
+            namespace_manager.set_namespace('ns_skill_map_import')
+            SkillGraph.clear_all()
+            self.assertEqual([], SkillGraph.load().skills)
+            self.assertEqual([], _SkillDao.get_all())
+
+            # Skills are copied without hooks on import
+            errors = []
+            courses.Course(None, dst_app_context).import_from(
+                self.app_context, errors)
+            self.assertEqual([], errors)
+            SkillGraph.clear_all()
+            self.assertEqual(
+                [skill.id], [s.id for s in SkillGraph.load().skills])
+            self.assertEqual([skill.id], [s.id for s in _SkillDao.get_all()])
+
+    def test_topological_levels_updated_incrementally(self):
+        self._build_sample_graph()
+        self.assertEqual(
+            {self.sa.id: 0, self.sb.id: 0, self.sc.id: 0, self.sd.id: 1,
+             self.se.id: 1, self.sf.id: 2},
+            self.skill_graph.topological_levels())
+
+        # Raise a chain, lower it again, then remove its root
+        self.skill_graph.add_prerequisite(self.sc.id, self.sd.id)
+        self.assertEqual(
+            {self.sa.id: 0, self.sb.id: 0, self.sc.id: 2, self.sd.id: 1,
+             self.se.id: 3, self.sf.id: 4},
+            self.skill_graph.topological_levels())
+        self.skill_graph.delete_prerequisite(self.sc.id, self.sd.id)
+        self.skill_graph.delete(self.sc.id)
+        self.assertEqual(
+            {self.sa.id: 0, self.sb.id: 0, self.sd.id: 1, self.se.id: 0,
+             self.sf.id: 1},
+            self.skill_graph.topological_levels())
+
+        SkillGraph.clear_all()
+        self.assertEqual(
+            self.skill_graph.topological_levels(),
+            SkillGraph.load().topological_levels())
+
+
 class SkillMapTests(BaseSkillMapTests):
 
     def setUp(self):
@@ -18,12 +18,15 @@ __author__ = [
     'johncox@google.com (John Cox)',
 ]
 
+import time
 import types
 
+from models import counters
 from models import models
 from models import student_work
 from modules.review import domain
 from modules.review import peer
+from modules.review import pool
 from modules.review import review as review_module
 from tests.functional import actions
 from google.appengine.ext import db
@@ -34,6 +37,7 @@ class ManagerTest(actions.TestBase):
 
     def setUp(self):
         super(ManagerTest, self).setUp()
+        counters.Registry._clear_all()
         self.reviewee = models.Student(key_name='reviewee@example.com')
         self.reviewee_key = self.reviewee.put()
         self.reviewer = models.Student(key_name='reviewer@example.com')
@@ -821,6 +825,78 @@ class ManagerTest(actions.TestBase):
 
         self.assertEqual(lower_priority_summary_key, step.review_summary_key)
 
+    def test_get_new_review_from_pool_pops_candidate(self):
+        summary_key = peer.ReviewSummary(
+            reviewee_key=self.reviewee_key, submission_key=self.submission_key,
+            unit_id=self.unit_id
+        ).put()
+        self.assertEqual(
+            1, review_module.Manager.refill_candidate_pool(self.unit_id))
+
+        with actions.OverriddenConfig(pool.CAN_USE_CANDIDATE_POOL.name, True):
+            step_key = review_module.Manager.get_new_review(
+                self.unit_id, self.reviewer_key)
+        step, summary = db.get([step_key, summary_key])
+
+        self.assertEqual(summary_key, step.review_summary_key)
+        self.assertEqual(self.reviewer_key, step.reviewer_key)
+        self.assertEqual(1, summary.assigned_count)
+        self.assertEqual(
+            0, sum(len(shard) for shard in db.get(
+                pool.CandidatePoolShard.get_keys(self.unit_id)) if shard))
+        self.assertEqual(
+            1, review_module.COUNTER_GET_NEW_REVIEW_POOL_SUCCESS.value)
+
+    def test_get_new_review_from_pool_skips_own_submission(self):
+        peer.ReviewSummary(
+            reviewee_key=self.reviewee_key, submission_key=self.submission_key,
+            unit_id=self.unit_id
+        ).put()
+        review_module.Manager.refill_candidate_pool(self.unit_id)
+
+        with actions.OverriddenConfig(pool.CAN_USE_CANDIDATE_POOL.name, True):
+            self.assertRaises(
+                domain.NotAssignableError,
+                review_module.Manager.get_new_review, self.unit_id,
+                self.reviewee_key)
+
+        # The candidate is still available to other reviewers.
+        self.assertEqual(
+            1, sum(len(shard) for shard in db.get(
+                pool.CandidatePoolShard.get_keys(self.unit_id)) if shard))
+
+    def test_get_new_review_falls_back_to_query_when_pool_empty(self):
+        summary_key = peer.ReviewSummary(
+            reviewee_key=self.reviewee_key, submission_key=self.submission_key,
+            unit_id=self.unit_id
+        ).put()
+
+        with actions.OverriddenConfig(pool.CAN_USE_CANDIDATE_POOL.name, True):
+            step_key = review_module.Manager.get_new_review(
+                self.unit_id, self.reviewer_key)
+
+        self.assertEqual(summary_key, db.get(step_key).review_summary_key)
+        self.assertEqual(
+            1, review_module.COUNTER_GET_NEW_REVIEW_POOL_MISS.value)
+        self.assertEqual(1, len(self.taskq.GetTasks('default')))
+
+    def test_start_review_process_for_schedules_pool_refill(self):
+        # Pin the clock so both requests fall in the same refill interval.
+        now = time.time()
+        self.swap(review_module.time, 'time', lambda: now)
+        with actions.OverriddenConfig(pool.CAN_USE_CANDIDATE_POOL.name, True):
+            summary_key = review_module.Manager.start_review_process_for(
+                self.unit_id, self.submission_key, self.reviewee_key)
+            # Requests in the same interval are coalesced into one task.
+            review_module.Manager._schedule_candidate_pool_refill(self.unit_id)
+        self.assertEqual(1, len(self.taskq.GetTasks('default')))
+
+        self.execute_all_deferred_tasks()
+        shards = db.get(pool.CandidatePoolShard.get_keys(self.unit_id))
+        self.assertEqual(
+            [summary_key],
+            [key for shard in shards for key in shard.summary_keys])
+
     def test_get_review_step_keys_by_returns_list_of_keys(self):
         summary_key = peer.ReviewSummary(
             reviewee_key=self.reviewee_key, submission_key=self.submission_key,
@@ -0,0 +1,122 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for combining answer statistics in the mapper.
+
+Simulates the map, shuffle and reduce phases of StudentAnswersStatsGenerator
+on synthetic answers, first handing one student to the mapper at a time,
+which is how the job ran before it combined in the mapper, and then in lists
+of MAP_BATCH_SIZE students.  Reports the number and size of the values
+shuffled and the time taken.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/answers_combining_benchmark.py \
+        --student_count=5000 --question_count=40
+"""
+
+import argparse
+import random
+import time
+
+from modules.dashboard import student_answers_analytics
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--student_count', help='Number of students.', default=5000, type=int)
+PARSER.add_argument(
+    '--question_count', help='Number of questions each student answered.',
+    default=40, type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+
+GENERATOR = student_answers_analytics.StudentAnswersStatsGenerator
+SHORT_ANSWERS = [u'mitochondria', u'ribosome', u'nucleus', u'chloroplast',
+                 u'golgi', u'vacuole', u'lysosome', u'cell wall']
+
+
+def make_map_output(rand, student_count, question_count):
+    """For each student, the (key, value) pairs map() emits for them."""
+    students = []
+    for _ in xrange(student_count):
+        pairs = []
+        for question in xrange(question_count):
+            if question % 2:
+                key = GENERATOR.build_key(
+                    '3', question, str(1000 + question), 'McQuestion')
+                value = (sorted(rand.sample(range(4), rand.randint(1, 2))),
+                         float(rand.randint(0, 1)))
+            else:
+                key = GENERATOR.build_key(
+                    '3', question, str(1000 + question), 'SaQuestion')
+                answer = rand.choice(SHORT_ANSWERS)
+                value = (answer, 1.0 if answer == SHORT_ANSWERS[0] else 0.0)
+            pairs.append((key, value))
+        students.append(pairs)
+    return students
+
+
+def run_job(students, batch_size):
+    """Runs map, shuffle and reduce; returns the output and shuffle size."""
+    codec = GENERATOR.RECORD_CODEC
+    shuffled = {}
+    num_values = 0
+    num_bytes = 0
+
+    # Map, as MapReduceJob._map_batch() does it.
+    for start in xrange(0, len(students), batch_size):
+        combined = {}
+        for pairs in students[start:start + batch_size]:
+            for key, value in pairs:
+                combined[key] = GENERATOR.combine_in_mapper(
+                    key, combined.get(key), value)
+        for key, value in combined.iteritems():
+            encoded = codec.encode(value)
+            num_values += 1
+            num_bytes += len(key) + len(encoded)
+            shuffled.setdefault(key, []).append(encoded)
+
+    # Reduce.
+    output = []
+    for key in sorted(shuffled):
+        output.extend(GENERATOR.reduce(
+            key, [codec.decode(value) for value in shuffled[key]]))
+    return output, num_values, num_bytes
+
+
+def run_all(args):
+    rand = random.Random(args.seed)
+    students = make_map_output(rand, args.student_count, args.question_count)
+
+    results = {}
+    for batch_size in [1, GENERATOR.MAP_BATCH_SIZE]:
+        start = time.time()
+        output, num_values, num_bytes = run_job(students, batch_size)
+        elapsed = time.time() - start
+        results[batch_size] = (output, elapsed)
+        print 'Batch size %3d: %8d values, %6.2f MB shuffled, %.2fs' % (
+            batch_size, num_values, num_bytes / 1e6, elapsed)
+
+    sort_key = lambda item: sorted(item.items())
+    if (sorted(results[1][0], key=sort_key) !=
+        sorted(results[GENERATOR.MAP_BATCH_SIZE][0], key=sort_key)):
+        raise Exception('Combining in the mapper changed the job output.')
+    print 'Speedup: %.1fx' % (
+        results[1][1] / results[GENERATOR.MAP_BATCH_SIZE][1])
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
@@ -0,0 +1,129 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for the distances calculated by the ClusteringGenerator job.
+
+Compares hamming_distance, called once for each pair of student and cluster,
+against HammingDistanceEngine on synthetic student vectors.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/clustering_benchmark.py \
+        --student_count=2000 --cluster_count=50 --dimension_count=100
+"""
+
+import argparse
+import random
+import time
+
+from modules.analytics import clustering
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--student_count', help='Number of synthetic student vectors.',
+    default=2000, type=int)
+PARSER.add_argument(
+    '--cluster_count', help='Number of synthetic clusters.',
+    default=50, type=int)
+PARSER.add_argument(
+    '--dimension_count', help='Number of dimensions of each student vector.',
+    default=100, type=int)
+PARSER.add_argument(
+    '--cluster_dimension_count', help='Number of dimensions of each cluster.',
+    default=10, type=int)
+PARSER.add_argument(
+    '--max_distance', help='Maximum distance reported.',
+    default=clustering.ClusteringGenerator.MAX_DISTANCE, type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+
+
+def make_student_vectors(rand, student_count, dimension_count):
+    return [
+        [{clustering.DIM_TYPE: clustering.DIM_TYPE_QUESTION,
+          clustering.DIM_ID: str(dim_id),
+          clustering.DIM_VALUE: rand.randint(0, 10)}
+         for dim_id in range(dimension_count)]
+        for _ in range(student_count)]
+
+
+def make_clusters(rand, cluster_count, dimension_count,
+                  cluster_dimension_count):
+    clusters = []
+    for cluster_id in range(cluster_count):
+        vector = []
+        for dim_id in rand.sample(range(dimension_count),
+                                  cluster_dimension_count):
+            low = rand.randint(0, 8)
+            vector.append({
+                clustering.DIM_TYPE: clustering.DIM_TYPE_QUESTION,
+                clustering.DIM_ID: str(dim_id),
+                clustering.DIM_LOW: low,
+                clustering.DIM_HIGH: low + rand.randint(0, 4)})
+        clusters.append({'id': cluster_id, 'vector': vector})
+    return clusters
+
+
+def run_element_loop(clusters, students, max_distance):
+    result = []
+    for student in students:
+        distances = []
+        for cluster in clusters:
+            distance = clustering.hamming_distance(
+                cluster['vector'], student, max_distance)
+            if distance <= max_distance:
+                distances.append((cluster['id'], distance))
+        result.append(distances)
+    return result
+
+
+def run_engine(clusters, students, max_distance):
+    engine = clustering.HammingDistanceEngine(clusters, max_distance)
+    return [engine.distances(engine.pack(student)) for student in students]
+
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def run_all(args):
+    rand = random.Random(args.seed)
+    students = make_student_vectors(
+        rand, args.student_count, args.dimension_count)
+    clusters = make_clusters(
+        rand, args.cluster_count, args.dimension_count,
+        args.cluster_dimension_count)
+
+    expected, loop_sec = timed(
+        run_element_loop, clusters, students, args.max_distance)
+    actual, engine_sec = timed(
+        run_engine, clusters, students, args.max_distance)
+    if expected != actual:
+        raise Exception('HammingDistanceEngine results differ.')
+
+    pairs = args.student_count * args.cluster_count
+    print 'Student x cluster pairs: %s' % pairs
+    print 'hamming_distance:        %.3fs (%.1f us/pair)' % (
+        loop_sec, loop_sec * 1e6 / pairs)
+    print 'HammingDistanceEngine:   %.3fs (%.1f us/pair)' % (
+        engine_sec, engine_sec * 1e6 / pairs)
+    print 'Speedup:                 %.1fx' % (loop_sec / engine_sec)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
@@ -0,0 +1,175 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for filtering items by course track and locale labels.
+
+Builds synthetic labels and items carrying a few of them, then filters the
+items for a student, first as LabelDAO did before labels were compiled (one
+set per item, membership tests against lists, items.remove() in a loop), and
+then with models._LabelIndex. Checks both give the same items and reports the
+time taken by each, and by compiling the labels.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/label_filter_benchmark.py \
+        --label_count=300 --item_count=5000
+"""
+
+import argparse
+import random
+import time
+
+from common import utils as common_utils
+from models import models
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--label_count', help='Number of labels of each type.', default=300,
+    type=int)
+PARSER.add_argument(
+    '--item_count', help='Number of items to filter.', default=5000, type=int)
+PARSER.add_argument(
+    '--labels_per_item', help='Number of labels on each item.', default=3,
+    type=int)
+PARSER.add_argument(
+    '--iterations', help='Number of times items are filtered.', default=10,
+    type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+
+LABEL_TYPES = [
+    models.LabelDTO.LABEL_TYPE_GENERAL,
+    models.LabelDTO.LABEL_TYPE_COURSE_TRACK,
+    models.LabelDTO.LABEL_TYPE_LOCALE,
+]
+
+
+class Item(object):
+
+    def __init__(self, labels):
+        self.labels = labels
+
+
+def make_labels(label_count):
+    labels = []
+    for label_type in LABEL_TYPES:
+        for _ in xrange(label_count):
+            label_id = len(labels) + 1
+            labels.append(models.LabelDTO(label_id, {
+                'title': 'label_%d' % label_id, 'type': label_type}))
+    return labels
+
+
+def make_items(rand, labels, item_count, labels_per_item):
+    items = []
+    for _ in xrange(item_count):
+        items.append(Item(common_utils.list_to_text([
+            label.id for label in rand.sample(labels, labels_per_item)])))
+    return items
+
+
+def legacy_filter(labels, student_labels, locale, items):
+    """Filters items the way LabelDAO did before labels were compiled."""
+    order = {lt.type: lt.menu_order for lt in models.LabelDTO.LABEL_TYPES}
+    items = list(items)
+
+    # _apply_labels_to_student_labels() for course tracks.
+    labels = sorted(labels, key=lambda l: (order[l.type], l.title))
+    label_ids = set([
+        label.id for label in labels
+        if label.type == models.LabelDTO.LABEL_TYPE_COURSE_TRACK])
+    student_matches = set([
+        int(label) for label in common_utils.text_to_list(student_labels)
+        if int(label) in label_ids])
+    for item in list(items):
+        item_matches = set([int(label_id) for label_id in
+                            common_utils.text_to_list(item.labels)
+                            if int(label_id) in label_ids])
+        if (student_matches and item_matches and
+            student_matches.isdisjoint(item_matches)):
+            items.remove(item)
+
+    # _apply_locale_labels_to_locale().
+    labels = sorted(labels, key=lambda l: (order[l.type], l.title))
+    id_to_label = {}
+    for label in labels:
+        if label.type == models.LabelDTO.LABEL_TYPE_LOCALE:
+            id_to_label[int(label.id)] = label
+    for item in list(items):
+        item_matches = set([int(label_id) for label_id in
+                            common_utils.text_to_list(item.labels)
+                            if int(label_id) in id_to_label.keys()])
+        found = False
+        for item_match in item_matches:
+            label = id_to_label[item_match]
+            if id_to_label and label and label.title == locale:
+                found = True
+        if id_to_label and item_matches and not found:
+            items.remove(item)
+    return items
+
+
+def compiled_filter(index, student_labels, locale, items):
+    """Filters items as LabelDAO does with a compiled label index."""
+    track_mask = index.get_type_mask(models.LabelDTO.LABEL_TYPE_COURSE_TRACK)
+    constraints = []
+    student_mask = index.get_mask(student_labels) & track_mask
+    if student_mask:
+        constraints.append((track_mask, student_mask))
+    constraints.append((
+        index.get_type_mask(models.LabelDTO.LABEL_TYPE_LOCALE),
+        index.get_locale_mask(locale)))
+    return index.filter(items, constraints)
+
+
+def time_it(fn, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        result = fn()
+    return result, (time.time() - start) / iterations
+
+
+def run_all(args):
+    rand = random.Random(args.seed)
+    labels = make_labels(args.label_count)
+    items = make_items(rand, labels, args.item_count, args.labels_per_item)
+    tracks = [
+        label for label in labels
+        if label.type == models.LabelDTO.LABEL_TYPE_COURSE_TRACK]
+    student_labels = common_utils.list_to_text(
+        [label.id for label in rand.sample(tracks, 3)])
+    locale = 'label_%d' % labels[-1].id
+
+    index, compile_time = time_it(
+        lambda: models._LabelIndex(labels),  # pylint: disable=protected-access
+        args.iterations)
+    expected, legacy_time = time_it(
+        lambda: legacy_filter(labels, student_labels, locale, items),
+        args.iterations)
+    actual, compiled_time = time_it(
+        lambda: compiled_filter(index, student_labels, locale, items),
+        args.iterations)
+    assert expected == actual, 'Filters disagree.'
+
+    print '%d labels, %d items, %d items kept' % (
+        len(labels), len(items), len(actual))
+    print 'Legacy filter:   %.2fms' % (legacy_time * 1000)
+    print 'Compiled filter: %.2fms (labels compiled in %.2fms)' % (
+        compiled_time * 1000, compile_time * 1000)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
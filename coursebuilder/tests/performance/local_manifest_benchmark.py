@@ -0,0 +1,87 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for listing the files bundled with the application.
+
+Lists folders of the Course Builder bundle and checks files exist, first from
+the disk, as LocalReadOnlyFileSystem did before it had a manifest (os.walk()
+and os.path.isfile() on each call), and then from vfs.LocalFileManifest.
+Checks both give the same answers and reports the time taken by each, and the
+time taken to build the manifest, which a process pays once.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/local_manifest_benchmark.py \
+        --folders=assets,views,modules
+"""
+
+import argparse
+import time
+
+import appengine_config
+from models import vfs
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--folders', help='Comma-separated folders of the bundle to list.',
+    default='assets,views,modules')
+PARSER.add_argument(
+    '--iterations', help='Number of times folders are listed.', default=10,
+    type=int)
+
+
+def time_it(fn, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        result = fn()
+    return result, (time.time() - start) / iterations
+
+
+def list_and_check(fs, folders):
+    """Lists folders, then checks each file found is a file."""
+    listed = [fs.list(folder) for folder in folders]
+    for files in listed:
+        for filename in files:
+            assert fs.isfile(filename), filename
+    return listed
+
+
+def run_all(args):
+    root = vfs.AbstractFileSystem.normpath(appengine_config.BUNDLE_ROOT)
+    folders = ['%s/%s' % (root, folder) for folder in args.folders.split(',')]
+    fs = vfs.LocalReadOnlyFileSystem(logical_home_folder='/')
+
+    vfs.CAN_USE_LOCAL_FILE_MANIFEST = False
+    expected, disk_time = time_it(
+        lambda: list_and_check(fs, folders), args.iterations)
+
+    start = time.time()
+    manifest = vfs.LocalFileManifest.get_for_bundle()
+    build_time = time.time() - start
+    vfs.CAN_USE_LOCAL_FILE_MANIFEST = True
+    actual, manifest_time = time_it(
+        lambda: list_and_check(fs, folders), args.iterations)
+    assert expected == actual, 'Listings disagree.'
+
+    print '%d files bundled, %d files listed' % (
+        len(manifest.list(root)), sum([len(files) for files in actual]))
+    print 'Manifest built in: %.2fms' % (build_time * 1000)
+    print 'From the disk:     %.2fms' % (disk_time * 1000)
+    print 'From the manifest: %.2fms' % (manifest_time * 1000)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
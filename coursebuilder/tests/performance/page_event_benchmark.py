@@ -0,0 +1,172 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for mapping page events to the course items they are about.
+
+Builds synthetic page events, as browsers record them, for a course of the
+given size: entering and leaving units, lessons, assessments and other pages
+of the course, and watching YouTube videos. Then maps them, first as
+PageEventAggregator.process_event() did before it had a dispatch table (the
+JSON data parsed, the URL parsed with urlparse and the course slug replaced
+in the path of each event), and then with PageEventAggregator.process_event()
+itself. Checks both give the same results and reports the number of events
+processed per second by each.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/page_event_benchmark.py \
+        --event_count=1000000
+"""
+
+import argparse
+import datetime
+import itertools
+import random
+import time
+import urlparse
+
+from models import transforms
+from modules.analytics import page_event_aggregator
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--unit_count', help='Number of units in the course.', default=10,
+    type=int)
+PARSER.add_argument(
+    '--lesson_count', help='Number of lessons in each unit.', default=10,
+    type=int)
+PARSER.add_argument(
+    '--distinct_event_count', help='Number of distinct events built.',
+    default=10000, type=int)
+PARSER.add_argument(
+    '--event_count', help='Number of events processed.', default=1000000,
+    type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+
+SLUG = '/bench'
+HOST = 'https://course-builder.example.com'
+SOURCES = ['enter-page', 'exit-page', 'tag-youtube-event']
+
+
+class SyntheticEvent(object):
+    """Has the fields of EventEntity process_event() reads."""
+
+    def __init__(self, source, recorded_on, data):
+        self.source = source
+        self.recorded_on = recorded_on
+        self.data = data
+
+
+def make_static_params(args):
+    units = {'first_unit_id': '1'}
+    for unit_id in xrange(1, args.unit_count + 1):
+        units[str(unit_id)] = ('lesson', str(unit_id * 100))
+    return {'slug': SLUG, 'unit': units}
+
+
+def make_location(args, rand):
+    unit_id = rand.randint(1, args.unit_count)
+    lesson_id = unit_id * 100 + rand.randrange(args.lesson_count)
+    return rand.choice([
+        'unit?unit=%s&lesson=%s' % (unit_id, lesson_id),
+        'unit?unit=%s&lesson=%s' % (unit_id, lesson_id),
+        'unit?unit=%s&lesson=%s#video' % (unit_id, lesson_id),
+        'unit?unit=%s' % unit_id,
+        'unit',
+        'assessment?name=%s' % unit_id,
+        'course',
+        'forum',
+        'student/home',
+        'rest/modules/rating',
+    ])
+
+
+def make_events(args, rand):
+    start = datetime.datetime(year=2015, month=1, day=1)
+    events = []
+    for index in xrange(args.distinct_event_count):
+        source = rand.choice(SOURCES)
+        data = {
+            'location': '%s%s/%s' % (HOST, SLUG, make_location(args, rand)),
+            'loc': {'page_locale': 'en_US'}}
+        if source == 'exit-page':
+            data['duration'] = rand.randrange(600000)
+        elif source == 'tag-youtube-event':
+            data.update({
+                'video_id': 'Kdg2drcUjYI', 'position': rand.randrange(600),
+                'event_id': rand.randrange(6)})
+        events.append(SyntheticEvent(
+            source, start + datetime.timedelta(seconds=index),
+            transforms.dumps(data)))
+    return events
+
+
+# pylint: disable=protected-access
+def legacy_process_event(event, static_params):
+    """Maps an event as PageEventAggregator did before dispatch tables."""
+    aggregator = page_event_aggregator.PageEventAggregator
+    ret = []
+    data = transforms.loads(event.data)
+    url_parts = urlparse.urlparse(data.get('location', ''))
+    query_params = urlparse.parse_qs(url_parts.query)
+    path = url_parts.path.replace(static_params['slug'], '')
+
+    for matcher in aggregator._matchers_by_path.get(path, []):
+        matcher_params = static_params.get(matcher.get_name())
+        value = matcher.match(matcher_params, query_params)
+        if value:
+            name, item_id = value
+            timestamp = int(
+                (event.recorded_on -
+                 page_event_aggregator.UNIX_EPOCH).total_seconds())
+            ret.append([name, item_id, timestamp, event.source])
+    return ret
+
+
+def time_it(fn, events, event_count):
+    start = time.time()
+    for event in itertools.islice(itertools.cycle(events), event_count):
+        fn(event)
+    return time.time() - start
+
+
+def run_all(args):
+    page_event_aggregator.register_base_course_matchers()
+    static_params = make_static_params(args)
+    events = make_events(args, random.Random(args.seed))
+    aggregator = page_event_aggregator.PageEventAggregator
+    for event in events:
+        assert (legacy_process_event(event, static_params) ==
+                aggregator.process_event(event, static_params)), (
+                    'Results disagree for %s' % event.data)
+
+    legacy_time = time_it(
+        lambda event: legacy_process_event(event, static_params),
+        events, args.event_count)
+    dispatch_time = time_it(
+        lambda event: aggregator.process_event(event, static_params),
+        events, args.event_count)
+
+    print '%d events processed' % args.event_count
+    print 'Legacy:         %.2fs (%d events/s)' % (
+        legacy_time, args.event_count / legacy_time)
+    print 'Dispatch table: %.2fs (%d events/s)' % (
+        dispatch_time, args.event_count / dispatch_time)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
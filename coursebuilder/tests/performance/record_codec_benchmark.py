@@ -0,0 +1,107 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for the codecs of values passed between map/reduce phases.
+
+Encodes synthetic answer records shaped like the values emitted by
+RawAnswersGenerator and StudentAnswersStatsGenerator, then compares the
+decode throughput and encoded size of LiteralEvalCodec and TypedRecordCodec.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/record_codec_benchmark.py \
+        --record_count=5000 --answers_per_record=20
+"""
+
+import argparse
+import random
+import time
+
+from models import record_codec
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--record_count', help='Number of records to decode.',
+    default=5000, type=int)
+PARSER.add_argument(
+    '--answers_per_record', help='Number of answers in each raw record.',
+    default=20, type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+
+WORDS = [u'photosynthesis', u'mitochondria', u'caf\xe9', u'42', u'chlorophyll',
+         u'osmosis', u'not sure', u'the cell wall']
+
+
+def make_answer(rand):
+    """An answer as a list, as RawAnswersGenerator.map() emits it."""
+    question_type = rand.choice(['McQuestion', 'SaQuestion'])
+    if question_type == 'McQuestion':
+        answers = sorted(rand.sample(range(5), rand.randint(1, 3)))
+    else:
+        answers = u' '.join(rand.sample(WORDS, rand.randint(1, 3)))
+    score = float(rand.randint(0, 1))
+    return [
+        rand.randint(1, 30),  # unit
+        rand.choice([None, rand.randint(1, 200)]),  # lesson
+        rand.randint(0, 10),  # sequence
+        str(rand.randint(10 ** 15, 10 ** 16)),  # question id
+        question_type, rand.randint(1.4e9, 1.5e9),  # timestamp
+        answers, score, score * 2.5, rand.choice([True, False])]
+
+
+def make_records(rand, record_count, answers_per_record):
+    records = []
+    for index in xrange(record_count):
+        if index % 2:
+            # Value of StudentAnswersStatsGenerator.map().
+            answer = make_answer(rand)
+            records.append((answer[6], answer[7]))
+        else:
+            # Value of RawAnswersGenerator.map().
+            records.append([
+                make_answer(rand) for _ in xrange(answers_per_record)])
+    return records
+
+
+def time_decode(codec, encoded):
+    start = time.time()
+    decoded = [codec.decode(item) for item in encoded]
+    return decoded, time.time() - start
+
+
+def run_all(args):
+    rand = random.Random(args.seed)
+    records = make_records(rand, args.record_count, args.answers_per_record)
+
+    results = {}
+    for codec in [record_codec.LiteralEvalCodec,
+                  record_codec.TypedRecordCodec]:
+        encoded = [codec.encode(record) for record in records]
+        decoded, elapsed = time_decode(codec, encoded)
+        if decoded != records:
+            raise Exception('%s does not round-trip.' % codec.NAME)
+        results[codec.NAME] = elapsed
+        size = sum(len(item) for item in encoded)
+        print '%-13s decode %.3fs (%.0f records/s), %.1f MB encoded' % (
+            codec.NAME, elapsed, len(records) / elapsed, size / 1e6)
+    print 'Speedup: %.1fx' % (
+        results[record_codec.LiteralEvalCodec.NAME] /
+        results[record_codec.TypedRecordCodec.NAME])
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
@@ -0,0 +1,150 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Contention benchmark for automatic peer review assignment.
+
+Seeds a unit with submissions under review, then has many reviewers call
+review.Manager.get_new_review() concurrently, first with the candidate pool
+disabled and then with it enabled. Reports assignment attempts, attempts that
+lost to a concurrent assignment, and reviewers who got no review at all.
+
+The local datastore stub serializes transactions, so absolute timings are not
+representative of production; the conflict counts are the figures to compare.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/review_pool_benchmark.py \
+        --submission_count=200 --reviewer_count=100 --thread_count=20
+"""
+
+import argparse
+import Queue
+import threading
+import time
+
+import appengine_config  # pylint: disable=unused-import
+from models import config
+from models import counters
+from models import models
+from models import student_work
+from modules.review import domain
+from modules.review import peer
+from modules.review import pool
+from modules.review import review
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--submission_count', help='Number of submissions under review.',
+    default=200, type=int)
+PARSER.add_argument(
+    '--reviewer_count', help='Number of reviewers requesting a review.',
+    default=100, type=int)
+PARSER.add_argument(
+    '--thread_count', help='Number of concurrent requests.',
+    default=20, type=int)
+
+UNIT_ID = '1'
+REPORTED_COUNTERS = [
+    review.COUNTER_GET_NEW_REVIEW_ASSIGNMENT_ATTEMPTED,
+    review.COUNTER_GET_NEW_REVIEW_SUMMARY_CHANGED,
+    review.COUNTER_GET_NEW_REVIEW_POOL_CONTENTION,
+    review.COUNTER_GET_NEW_REVIEW_POOL_MISS,
+    review.COUNTER_GET_NEW_REVIEW_NOT_ASSIGNABLE,
+    review.COUNTER_GET_NEW_REVIEW_SUCCESS,
+]
+
+
+def set_up_testbed():
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_memcache_stub()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_taskqueue_stub()
+    return bed
+
+
+def seed(submission_count, reviewer_count):
+    for index in xrange(submission_count):
+        reviewee_key = models.Student(
+            key_name='reviewee%s@example.com' % index).put()
+        submission_key = student_work.Submission(
+            reviewee_key=reviewee_key, unit_id=UNIT_ID).put()
+        peer.ReviewSummary(
+            reviewee_key=reviewee_key, submission_key=submission_key,
+            unit_id=UNIT_ID).put()
+    return [
+        models.Student(key_name='reviewer%s@example.com' % index).put()
+        for index in xrange(reviewer_count)]
+
+
+def run_reviewers(reviewer_keys, thread_count):
+    work = Queue.Queue()
+    for reviewer_key in reviewer_keys:
+        work.put(reviewer_key)
+
+    def worker():
+        while True:
+            try:
+                reviewer_key = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                review.Manager.get_new_review(UNIT_ID, reviewer_key)
+            except (db.TransactionFailedError, domain.NotAssignableError):
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in xrange(thread_count)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+
+def run_once(args, use_pool):
+    bed = set_up_testbed()
+    try:
+        reviewer_keys = seed(args.submission_count, args.reviewer_count)
+        config.Registry.test_overrides[
+            pool.CAN_USE_CANDIDATE_POOL.name] = use_pool
+        if use_pool:
+            review.Manager.refill_candidate_pool(UNIT_ID)
+        counters.Registry._clear_all()
+        elapsed = run_reviewers(reviewer_keys, args.thread_count)
+    finally:
+        del config.Registry.test_overrides[pool.CAN_USE_CANDIDATE_POOL.name]
+        bed.deactivate()
+
+    print 'Candidate pool %s: %.2fs' % (
+        'enabled' if use_pool else 'disabled', elapsed)
+    for counter in REPORTED_COUNTERS:
+        print '    %s: %s' % (counter.name, counter.value)
+
+
+def run_all(args):
+    run_once(args, False)
+    run_once(args, True)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
@@ -0,0 +1,153 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark for rendering large safe_dom trees.
+
+Builds a table shaped like the question bank of the dashboard, with one row
+per question, and renders it to HTML, first as safe_dom.Element did before
+it wrote into a shared buffer (string concatenation, tag names checked and
+attributes sorted on every render), and then with safe_dom itself. Checks
+both give the same HTML and reports the time taken by each, for a first
+render and for a render of a tree already rendered once.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/safe_dom_benchmark.py --question_count=5000
+"""
+
+import argparse
+import time
+
+from common import safe_dom
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--question_count', help='Number of questions in the bank.',
+    default=5000, type=int)
+PARSER.add_argument(
+    '--iterations', help='Number of times the bank is rendered.', default=5,
+    type=int)
+
+
+def make_question_bank(question_count):
+    """Builds a table like the one of dashboard list_questions()."""
+    preview_button = safe_dom.Element(
+        'div', className='icon md md-visibility', title='Preview',
+        alt='Preview').freeze()
+    add_to_group_button = safe_dom.Element(
+        'div', className='icon md md-add-circle gcb-pull-right',
+        title='Add to question group', alt='Add to question group').freeze()
+
+    table = safe_dom.Element('table', className='assets-table')
+    tbody = safe_dom.Element('tbody')
+    table.add_child(tbody)
+    for quid in xrange(question_count):
+        tr = safe_dom.Element('tr', data_quid=str(quid))
+        td = safe_dom.Element('td', className='description')
+        td.add_child(safe_dom.A(
+            'dashboard?action=edit_question&key=%s' % quid,
+            className='icon md md-mode-edit'))
+        td.add_child(preview_button)
+        td.add_child(safe_dom.A(
+            '#', className='icon md md-content-copy', title='Clone',
+            data_key=str(quid)))
+        td.add_text('Question <%d> & "friends"' % quid)
+        tr.add_child(td)
+
+        groups = safe_dom.Element('td', className='groups')
+        groups.add_child(add_to_group_button)
+        groups.add_child(safe_dom.Element('ol').add_child(
+            safe_dom.Element('li').add_text('Group %d' % (quid % 7))))
+        tr.add_child(groups)
+
+        tr.add_child(safe_dom.Element('td', className='locations').add_child(
+            safe_dom.Element('ol').add_child(
+                safe_dom.Element('li').add_child(safe_dom.A(
+                    'unit?unit=%d' % (quid % 11)).add_text('Unit')))))
+        tr.add_child(safe_dom.Element(
+            'td', data_timestamp='1420070400.0', className='timestamp'))
+        tr.add_child(safe_dom.Element(
+            'td', style='text-align: center').add_text('MC'))
+        tbody.add_child(tr)
+    return table
+
+
+# pylint: disable=protected-access
+def legacy_sanitized(node):
+    """Renders a node the way safe_dom did before it used a shared buffer."""
+    if isinstance(node, safe_dom.NodeList):
+        return ''.join([legacy_sanitized(child) for child in node.list])
+    if not isinstance(node, safe_dom.Element):
+        return node.sanitized
+    assert safe_dom.Element._ALLOWED_NAME_PATTERN.match(node._tag_name), (
+        'tag name %s is not allowed' % node._tag_name)
+    buff = '<' + node._tag_name
+    for attr_name, value in sorted(node._attr.items()):
+        if attr_name == 'classname':
+            attr_name = 'class'
+        elif attr_name.startswith('data_'):
+            attr_name = attr_name.replace('_', '-')
+        if value is None:
+            value = ''
+        buff += ' %s="%s"' % (
+            attr_name, safe_dom.escape(value))
+
+    if node._children:
+        buff += '>'
+        for child in node._children:
+            buff += legacy_sanitized(child)
+        buff += '</%s>' % node._tag_name
+    elif node._tag_name.lower() in safe_dom.Element._VOID_ELEMENTS:
+        buff += '/>'
+    else:
+        buff += '></%s>' % node._tag_name
+
+    return buff
+
+
+def time_it(fn, iterations):
+    start = time.time()
+    for _ in xrange(iterations):
+        result = fn()
+    return result, (time.time() - start) / iterations
+
+
+def run_all(args):
+    _, build_time = time_it(
+        lambda: make_question_bank(args.question_count), args.iterations)
+
+    expected, legacy_time = time_it(
+        lambda: legacy_sanitized(make_question_bank(args.question_count)),
+        args.iterations)
+    actual, first_time = time_it(
+        lambda: make_question_bank(args.question_count).sanitized,
+        args.iterations)
+    assert expected == actual, 'Serializers disagree.'
+
+    table = make_question_bank(args.question_count)
+    _ = table.sanitized  # Builds the start tags.
+    _, again_time = time_it(lambda: table.sanitized, args.iterations)
+
+    print '%d questions, %d bytes of HTML' % (
+        args.question_count, len(actual))
+    print 'Building the tree:  %.2fms' % (build_time * 1000)
+    print 'Legacy serializer:  %.2fms' % ((legacy_time - build_time) * 1000)
+    print 'Buffered, first:    %.2fms' % ((first_time - build_time) * 1000)
+    print 'Buffered, again:    %.2fms' % (again_time * 1000)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
@@ -0,0 +1,353 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load and latency benchmark of the whole application, run in-process.
+
+Boots the WSGI application of main.py against the App Engine service stubs
+the functional tests use, and seeds courses of the given size: units and
+lessons embedding questions from the question bank, enrolled students and
+recorded events. Then replays scripted scenarios, students browsing a course
+and admins browsing its dashboard, and reports for each route the latency
+(50th, 95th and 99th percentiles), the CPU time of the process and the
+number of API calls made, per request. Requests of the first --warmup
+iterations are not counted; they compile templates and fill caches.
+
+Times include the service stubs, so compare results of runs on the same
+machine only: run once before and once after a change, with --output for
+the first run and --baseline for the second.
+
+Here is how to run:
+    - make sure your PYTHONPATH is set up as for tests/suite.py
+    - from the Course Builder folder, run:
+        python tests/performance/wsgi_benchmark.py \
+        --unit_count=10 --lesson_count=5 --student_count=100 \
+        --output=/tmp/before.json
+    - change the code, then run:
+        python tests/performance/wsgi_benchmark.py \
+        --unit_count=10 --lesson_count=5 --student_count=100 \
+        --baseline=/tmp/before.json
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import time
+
+import webtest
+
+from common import utils as common_utils
+from controllers import sites
+from models import config
+from models import courses
+from models import models
+from models import transforms
+from tests import suite
+from tools.etl import etl
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+from google.appengine.api.search import simple_search_stub
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument(
+    '--course_count', help='Number of courses.', default=1, type=int)
+PARSER.add_argument(
+    '--unit_count', help='Number of units in each course.', default=10,
+    type=int)
+PARSER.add_argument(
+    '--lesson_count', help='Number of lessons in each unit.', default=5,
+    type=int)
+PARSER.add_argument(
+    '--question_count', help='Number of questions in each course.',
+    default=50, type=int)
+PARSER.add_argument(
+    '--student_count', help='Number of students enrolled in each course.',
+    default=100, type=int)
+PARSER.add_argument(
+    '--event_count', help='Number of events recorded in each course.',
+    default=1000, type=int)
+PARSER.add_argument(
+    '--user_count', help='Number of students replaying the scenario in each '
+    'course and iteration.', default=10, type=int)
+PARSER.add_argument(
+    '--iterations', help='Number of times scenarios are replayed.',
+    default=5, type=int)
+PARSER.add_argument(
+    '--warmup', help='Number of iterations replayed first and not counted.',
+    default=1, type=int)
+PARSER.add_argument(
+    '--seed', help='Seed for the random generator.', default=0, type=int)
+PARSER.add_argument(
+    '--output', help='File to write the results to, as JSON.')
+PARSER.add_argument(
+    '--baseline', help='File with results of an earlier run, as written by '
+    '--output, to compare results with.')
+
+ADMIN_EMAIL = 'admin@example.com'
+
+# Routes requested, in order, by a student; {unit} and {lesson} are picked at
+# random among those of the course.
+STUDENT_SCENARIO = [
+    'course',
+    'unit?unit={unit}',
+    'unit?unit={unit}&lesson={lesson}',
+    'unit?unit={unit}&lesson={lesson}',
+    'student/home',
+]
+
+# Routes requested, in order, by an admin of the course.
+ADMIN_SCENARIO = [
+    'dashboard?action=outline',
+    'dashboard?action=assets',
+    'dashboard?action=settings',
+    'dashboard?action=analytics',
+]
+
+EVENT_SOURCES = ['enter-page', 'exit-page', 'tag-assessment', 'attempt-lesson']
+
+PERCENTILES = [50, 95, 99]
+
+
+class RouteStats(object):
+    """Measures of all the requests made to one route."""
+
+    def __init__(self):
+        self.latencies = []
+        self.cpu_times = []
+        self.rpc_counts = collections.defaultdict(int)
+        self.errors = 0
+
+    def add(self, latency, cpu_time, rpc_counts, status):
+        self.latencies.append(latency)
+        self.cpu_times.append(cpu_time)
+        for name, count in rpc_counts.iteritems():
+            self.rpc_counts[name] += count
+        if status >= 400:
+            self.errors += 1
+
+    def to_dict(self):
+        count = len(self.latencies)
+        result = {
+            'requests': count,
+            'errors': self.errors,
+            'cpu_ms': 1000 * sum(self.cpu_times) / count,
+            'rpcs': sum(self.rpc_counts.values()) / float(count),
+            'rpcs_by_call': dict([
+                (name, total / float(count))
+                for name, total in self.rpc_counts.iteritems()]),
+        }
+        for percent in PERCENTILES:
+            result['p%d_ms' % percent] = 1000 * percentile(
+                self.latencies, percent)
+        return result
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of values."""
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(0, rank - 1)]
+
+
+def set_up_testbed():
+    """Activates the service stubs as tests.suite.AppEngineTestBase does."""
+    suite.empty_environ()
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_user_stub()
+    bed.init_memcache_stub()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_taskqueue_stub()
+    bed.init_urlfetch_stub()
+    bed.init_files_stub()
+    bed.init_blobstore_stub()
+    bed.init_mail_stub()
+    bed._register_stub(  # pylint: disable=protected-access
+        'search', simple_search_stub.SearchServiceStub())
+    return bed
+
+
+def count_rpcs(rpc_counts):
+    """Counts the API calls made, by service and method, into rpc_counts."""
+
+    def hook(service, call, unused_request, unused_response):
+        rpc_counts['%s.%s' % (service, call)] += 1
+
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+        'wsgi_benchmark', hook)
+
+
+def seed_course(actions, args, rand, index):
+    """Adds a course of the size asked for; returns what scenarios need."""
+    name = 'bench%d' % index
+    app_context = actions.simple_add_course(
+        name, ADMIN_EMAIL, 'Benchmark Course %d' % index)
+
+    with common_utils.Namespace(app_context.get_namespace_name()):
+        question_ids = []
+        for number in xrange(args.question_count):
+            question_ids.append(models.QuestionDAO.save(models.QuestionDTO(
+                None, {
+                    'question': 'Question %d' % number,
+                    'description': 'Question %d' % number,
+                    'type': models.QuestionDTO.MULTIPLE_CHOICE,
+                    'choices': [
+                        {'text': 'Right', 'score': 1.0},
+                        {'text': 'Wrong', 'score': 0.0}],
+                    'version': '1.5'})))
+
+    course = courses.Course(None, app_context=app_context)
+    lessons_by_unit = {}
+    for unit_number in xrange(args.unit_count):
+        unit = course.add_unit()
+        unit.title = 'Unit %d' % unit_number
+        unit.now_available = True
+        lessons_by_unit[unit.unit_id] = []
+        for lesson_number in xrange(args.lesson_count):
+            lesson = course.add_lesson(unit)
+            lesson.title = 'Lesson %d' % lesson_number
+            lesson.now_available = True
+            lesson.objectives = '<p>Lesson %d.</p>' % lesson_number
+            if question_ids:
+                lesson.objectives += (
+                    '<question quid="%s" weight="1" instanceid="q%d">'
+                    '</question>' % (rand.choice(question_ids), lesson_number))
+            lessons_by_unit[unit.unit_id].append(lesson.lesson_id)
+    course.save()
+
+    emails = []
+    with common_utils.Namespace(app_context.get_namespace_name()):
+        for number in xrange(args.student_count):
+            email = 'student%d@example.com' % number
+            # pylint: disable=protected-access
+            models.StudentProfileDAO._add_new_student_for_current_user(
+                email, email, 'Student %d' % number,
+                transforms.dumps([['form01', 'Student %d' % number]]))
+            emails.append(email)
+
+        events = []
+        for number in xrange(args.event_count):
+            source = EVENT_SOURCES[number % len(EVENT_SOURCES)]
+            events.append(models.EventEntity(
+                source=source, partition=source,
+                user_id=emails[number % len(emails)] if emails else '',
+                data=transforms.dumps({'location': 'unit?unit=1'})))
+            if len(events) == 500:
+                db.put(events)
+                events = []
+        db.put(events)
+
+    return name, lessons_by_unit, emails
+
+
+def replay(app, course_name, scenario, params, stats, rpc_counts):
+    for route in scenario:
+        url = '/%s/%s' % (course_name, route.format(**params))
+        rpc_counts.clear()
+        start_cpu = sum(os.times()[:2])
+        start = time.time()
+        response = app.get(url, expect_errors=True)
+        latency = time.time() - start
+        cpu_time = sum(os.times()[:2]) - start_cpu
+        if stats is not None:
+            stats[route].add(latency, cpu_time, rpc_counts, response.status_int)
+
+
+def print_results(results, baseline):
+    print '%-36s %6s %8s %8s %8s %8s %6s' % (
+        'route', 'reqs', 'p50 ms', 'p95 ms', 'p99 ms', 'cpu ms', 'rpcs')
+    for route, result in sorted(results['routes'].iteritems()):
+        print '%-36s %6d %8.1f %8.1f %8.1f %8.1f %6.1f' % (
+            route, result['requests'], result['p50_ms'], result['p95_ms'],
+            result['p99_ms'], result['cpu_ms'], result['rpcs'])
+        if result['errors']:
+            print '    %d requests failed' % result['errors']
+        if baseline and route in baseline['routes']:
+            before = baseline['routes'][route]
+            print '    vs baseline: p50 %+.0f%%, p95 %+.0f%%, rpcs %+.1f' % (
+                100 * (result['p50_ms'] / before['p50_ms'] - 1),
+                100 * (result['p95_ms'] / before['p95_ms'] - 1),
+                result['rpcs'] - before['rpcs'])
+
+
+def run_all(args):
+    # Modules named in app.yaml register when main.py is first imported.
+    etl._set_env_vars_from_app_yaml()  # pylint: disable=protected-access
+    import main
+    from tests.functional import actions
+
+    bed = set_up_testbed()
+    try:
+        memcache.flush_all()
+        sites.ApplicationContext.clear_per_process_cache()
+        config.Registry.get_overrides(True)
+        sites.ApplicationRequestHandler.bind(main.namespaced_routes)
+        app = webtest.TestApp(main.app)
+
+        rand = random.Random(args.seed)
+        seeded = [
+            seed_course(actions, args, rand, index)
+            for index in xrange(args.course_count)]
+
+        rpc_counts = collections.defaultdict(int)
+        count_rpcs(rpc_counts)
+        stats = collections.defaultdict(RouteStats)
+        for iteration in xrange(args.warmup + args.iterations):
+            counted = stats if iteration >= args.warmup else None
+            for course_name, lessons_by_unit, emails in seeded:
+                for email in rand.sample(
+                        emails, min(args.user_count, len(emails))):
+                    unit = rand.choice(sorted(lessons_by_unit.keys()))
+                    params = {
+                        'unit': unit,
+                        'lesson': rand.choice(lessons_by_unit[unit] or [''])}
+                    actions.login(email)
+                    replay(app, course_name, STUDENT_SCENARIO, params,
+                           counted, rpc_counts)
+                actions.login(ADMIN_EMAIL, is_admin=True)
+                replay(app, course_name, ADMIN_SCENARIO, {}, counted,
+                       rpc_counts)
+    finally:
+        bed.deactivate()
+
+    parameters = dict(vars(args))
+    del parameters['output']
+    del parameters['baseline']
+    results = {
+        'parameters': parameters,
+        'routes': dict([
+            (route, route_stats.to_dict())
+            for route, route_stats in stats.iteritems()]),
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    run_all(PARSER.parse_args())
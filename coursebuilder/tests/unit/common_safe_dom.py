@@ -184,6 +184,53 @@ class ElementTests(unittest.TestCase):
             self.assertEqual(
                 '<%s></%s>' % (elt, elt), safe_dom.Element(elt).__str__())
 
+    def test_nested_elements_render_in_order(self):
+        """Deep and wide trees should render as the sum of their parts."""
+        table = safe_dom.Element('table')
+        for row in xrange(3):
+            tr = safe_dom.Element('tr', data_row=str(row))
+            for col in xrange(2):
+                tr.add_child(safe_dom.Element('td').add_child(
+                    safe_dom.Element('b').add_text('%d<%d' % (row, col))))
+            table.add_child(tr)
+        expected = '<table>%s</table>' % ''.join(
+            '<tr data-row="%d">%s</tr>' % (row, ''.join(
+                '<td><b>%d&lt;%d</b></td>' % (row, col) for col in xrange(2)))
+            for row in xrange(3))
+        self.assertEqual(expected, table.sanitized)
+        self.assertEqual(expected, table.sanitized)
+
+    def test_attribute_changes_after_rendering_are_shown(self):
+        """Changing attributes should update an element already rendered."""
+        element = safe_dom.Element('a', b='c')
+        self.assertEqual('<a b="c"></a>', element.sanitized)
+        element.add_attribute(d='e')
+        self.assertEqual('<a b="c" d="e"></a>', element.sanitized)
+        element.set_attribute('b', 'f')
+        self.assertEqual('<a b="f" d="e"></a>', element.sanitized)
+
+    def test_frozen_element_can_be_shared(self):
+        """Frozen elements render the same under any number of parents."""
+        icon = safe_dom.Element('img', src='icon.png').freeze()
+        rows = safe_dom.NodeList()
+        for _ in xrange(2):
+            rows.append(safe_dom.Element('td').add_child(icon))
+        self.assertEqual(
+            '<td><img src="icon.png"/></td><td><img src="icon.png"/></td>',
+            rows.sanitized)
+
+    def test_frozen_element_cannot_be_changed(self):
+        """Changing a frozen element should raise an error."""
+        element = safe_dom.Element('p').add_text('a').freeze()
+        for change in [
+                lambda: element.add_text('b'),
+                lambda: element.add_attribute(b='c'),
+                lambda: element.set_attribute('b', 'c'),
+                element.empty]:
+            with self.assertRaises(ValueError):
+                change()
+        self.assertEqual('<p>a</p>', element.sanitized)
+
 
 class ScriptElementTests(unittest.TestCase):
     """Unit tests for common.safe_dom.ScriptElement."""
@@ -0,0 +1,73 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for models.counters."""
+
+import unittest
+
+from models import counters
+
+
+class LatencyHistogramTests(unittest.TestCase):
+
+    def setUp(self):
+        super(LatencyHistogramTests, self).setUp()
+        self.histogram = counters.LatencyHistogram(
+            'test-latency-histogram', 'For tests.')
+
+    def tearDown(self):
+        del counters.Registry.registered[self.histogram.name]
+        super(LatencyHistogramTests, self).tearDown()
+
+    def test_record_counts_into_log_buckets(self):
+        for duration_ms in [0.5, 1, 3, 4, 1000, 10 ** 6]:
+            self.histogram.record(duration_ms)
+
+        buckets = self.histogram.buckets
+        self.assertEqual(6, self.histogram.value)
+        self.assertEqual(2, buckets[0])  # Up to 1 ms.
+        self.assertEqual(2, buckets[2])  # Up to 4 ms.
+        self.assertEqual(1, buckets[10])  # Up to 1024 ms.
+        self.assertEqual(1, buckets[-1])  # Longer than the last bound.
+        self.assertEqual(6, sum(buckets))
+
+    def test_percentiles(self):
+        for _ in xrange(90):
+            self.histogram.record(10)
+        for _ in xrange(9):
+            self.histogram.record(100)
+        self.histogram.record(10 ** 6)
+
+        self.assertEqual(
+            [16, 128, 128],
+            counters.LatencyHistogram.get_percentiles(self.histogram.buckets))
+        self.assertEqual(
+            'count=100 p50<=16ms p95<=128ms p99<=128ms',
+            counters.LatencyHistogram.format_buckets(self.histogram.buckets))
+        self.assertIsNone(counters.LatencyHistogram.get_percentiles(
+            [0] * len(self.histogram.buckets)))
+
+    def test_merged_buckets_give_overall_percentiles(self):
+        other = [0] * len(self.histogram.buckets)
+        other[-1] = 10
+        for _ in xrange(10):
+            self.histogram.record(1)
+        merged = [a + b for a, b in zip(self.histogram.buckets, other)]
+
+        self.assertEqual(
+            [1, None, None],
+            counters.LatencyHistogram.get_percentiles(merged))
+        self.assertEqual(
+            'count=20 p50<=1ms p95>65536ms p99>65536ms',
+            counters.LatencyHistogram.format_buckets(merged))
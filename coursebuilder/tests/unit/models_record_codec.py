@@ -0,0 +1,60 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for models.record_codec."""
+
+import unittest
+
+from models import record_codec
+
+
+class TypedRecordCodecTests(unittest.TestCase):
+
+    def _round_trip(self, value):
+        codec = record_codec.TypedRecordCodec
+        return codec.decode(codec.encode(value))
+
+    def test_round_trip_preserves_values_and_types(self):
+        value = {
+            'answers': [u'caf\xe9', 'raw', 3, 2 ** 70, -1.5, None, True],
+            'key': ('1', 2L, False),
+            7: {},
+            'long': ['x' * 300, u'\xe9' * 300, range(-300, 300), 2 ** 40],
+        }
+        decoded = self._round_trip(value)
+        self.assertEqual(value, decoded)
+        self.assertIsInstance(decoded['answers'][0], unicode)
+        self.assertIsInstance(decoded['answers'][1], str)
+        self.assertIsInstance(decoded['key'], tuple)
+        self.assertIs(True, decoded['answers'][6])
+
+    def test_subclasses_are_stored_as_base_types(self):
+
+        class Text(unicode):
+            pass
+
+        decoded = self._round_trip([Text(u'text')])
+        self.assertEqual([u'text'], decoded)
+        self.assertIs(unicode, type(decoded[0]))
+        with self.assertRaises(TypeError):
+            record_codec.TypedRecordCodec.encode(object())
+
+    def test_foreign_and_truncated_records_are_rejected(self):
+        codec = record_codec.TypedRecordCodec
+        with self.assertRaises(ValueError):
+            codec.decode(record_codec.LiteralEvalCodec.encode([1, 2]))
+        with self.assertRaises(ValueError):
+            codec.decode(codec.encode([1, 2]) + 'N')
+        with self.assertRaises(ValueError):
+            codec.decode(codec.encode('abcdef')[:-2] + 'x')
@@ -0,0 +1,85 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for models/vfs.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import appengine_config
+from models import vfs
+
+
+class LocalFileManifestTests(unittest.TestCase):
+    """Validate the manifest against the files it indexes."""
+
+    FILES = ['top.txt', 'a/x.txt', 'a/b/y.txt', 'ab/z.txt', 'a0/w.txt']
+
+    def setUp(self):
+        super(LocalFileManifestTests, self).setUp()
+        self.root = vfs.AbstractFileSystem.normpath(
+            os.path.realpath(tempfile.mkdtemp()))
+        for filename in self.FILES:
+            self._write(filename)
+        self.bundle_root = appengine_config.BUNDLE_ROOT
+        self.can_use_manifest = vfs.CAN_USE_LOCAL_FILE_MANIFEST
+
+    def tearDown(self):
+        appengine_config.BUNDLE_ROOT = self.bundle_root
+        vfs.CAN_USE_LOCAL_FILE_MANIFEST = self.can_use_manifest
+        shutil.rmtree(self.root)
+        super(LocalFileManifestTests, self).tearDown()
+
+    def _write(self, filename):
+        path = os.path.join(self.root, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as stream:
+            stream.write(filename)
+
+    def test_lists_only_files_under_folder(self):
+        manifest = vfs.LocalFileManifest(self.root)
+        self.assertEquals(
+            [self.root + '/a/b/y.txt', self.root + '/a/x.txt'],
+            manifest.list(self.root + '/a'))
+        self.assertEquals(
+            manifest.list(self.root + '/a'), manifest.list(self.root + '/a/'))
+        self.assertEquals(len(self.FILES), len(manifest.list(self.root)))
+        self.assertEquals([], manifest.list(self.root + '/top.txt'))
+        self.assertTrue(manifest.isfile(self.root + '/a/x.txt'))
+        self.assertFalse(manifest.isfile(self.root + '/a'))
+        self.assertEquals(
+            len('a/x.txt'), manifest.stat(self.root + '/a/x.txt')[0])
+
+    def test_file_system_answers_as_disk_does(self):
+        fs = vfs.LocalReadOnlyFileSystem(logical_home_folder='/')
+        queries = ['/a', '/a/b', '/ab', '/', '/missing']
+
+        vfs.CAN_USE_LOCAL_FILE_MANIFEST = False
+        from_disk = [fs.list(self.root + query) for query in queries]
+
+        vfs.CAN_USE_LOCAL_FILE_MANIFEST = True
+        appengine_config.BUNDLE_ROOT = self.root
+        self.assertEquals(
+            from_disk, [fs.list(self.root + query) for query in queries])
+        self.assertTrue(fs.isfile(self.root + '/a/b/y.txt'))
+        self.assertFalse(fs.isfile(self.root + '/a/b'))
+        self.assertEquals(
+            len('a/b/y.txt'), fs.stat(self.root + '/a/b/y.txt').size)
+
+        # The bundle is indexed once; files added later are not seen.
+        self._write('a/new.txt')
+        self.assertFalse(fs.isfile(self.root + '/a/new.txt'))
@@ -0,0 +1,94 @@
+# Copyright 2015 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for modules/analytics."""
+
+import collections
+import datetime
+import unittest
+import urlparse
+
+from models import transforms
+from modules.analytics import page_event_aggregator
+
+# pylint: disable=protected-access
+
+
+class Event(object):
+
+    def __init__(self, data, source='enter-page'):
+        self.data = data
+        self.source = source
+        self.recorded_on = datetime.datetime(year=2015, month=1, day=1)
+
+
+class PageEventAggregatorTests(unittest.TestCase):
+    """Validate the fast paths of page event processing."""
+
+    LOCATIONS = [
+        'http://localhost:8080/test/unit?unit=2&lesson=3#top',
+        'http://localhost:8080/test/unit',
+        'http://localhost:8080/test/assessment?name=4',
+        'https://example.com/test/course',
+        'http://localhost:8080/test/student/unenroll?x=1',
+        'http://localhost:8080/other/course',
+        'http://localhost:8080',
+        '/test/unit;params?unit=5',
+        'unit?unit=2',
+    ]
+
+    def setUp(self):
+        super(PageEventAggregatorTests, self).setUp()
+        aggregator = page_event_aggregator.PageEventAggregator
+        self.matchers = (
+            aggregator._matchers_by_name, aggregator._matchers_by_path)
+        aggregator._matchers_by_name = {}
+        aggregator._matchers_by_path = collections.defaultdict(list)
+        page_event_aggregator.register_base_course_matchers()
+        self.static_params = {
+            'slug': '/test',
+            'unit': {'first_unit_id': '2', '2': ('lesson', '3')}}
+
+    def tearDown(self):
+        aggregator = page_event_aggregator.PageEventAggregator
+        (aggregator._matchers_by_name,
+         aggregator._matchers_by_path) = self.matchers
+        aggregator._dispatch_by_slug = {}
+        super(PageEventAggregatorTests, self).tearDown()
+
+    def test_location_is_split_as_urlparse_does(self):
+        for location in self.LOCATIONS:
+            url_parts = urlparse.urlparse(location)
+            self.assertEquals(
+                (url_parts.path, url_parts.query),
+                page_event_aggregator._split_location(location))
+
+    def test_location_is_read_with_or_without_parsing_data(self):
+        for data in [
+                {'location': self.LOCATIONS[0], 'loc': {'locale': 'en'}},
+                {'location': u'http://localhost:8080/test/unit?x=\u00e9'},
+                {'loc': {'location': 'nested'}, 'location': '/test/course'},
+                {'loc': {}}]:
+            self.assertEquals(
+                data.get('location', ''),
+                page_event_aggregator._get_location(transforms.dumps(data)))
+
+        aggregator = page_event_aggregator.PageEventAggregator
+        event = Event(transforms.dumps({'location': self.LOCATIONS[0]}))
+        self.assertEquals(
+            [['lesson', '3', 1420070400, 'enter-page']],
+            aggregator.process_event(event, self.static_params))
+        event = Event(transforms.dumps({'location': self.LOCATIONS[5]}))
+        self.assertEquals(
+            [], aggregator.process_event(event, self.static_params))